@@ -0,0 +1,197 @@
+"""Benchmarks of the `pw` hot paths on synthetic vaults.
+
+Usage (from the root of the repo):
+
+    python benchmarks/bench_cli.py --output bench.json
+    python benchmarks/bench_cli.py --sizes 1000 10000 --compare bench.json
+
+Every benchmark runs `--repeat` times on a fresh synthetic vault per size.
+Clipboard access is replaced by a no-op, because it depends on the desktop
+environment and not on pw. Results are written as json; with `--compare`
+the run is compared against an earlier result file and exits with 1 if a
+benchmark got slower than `--tolerance`.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet  # noqa: E402
+from pw import pw_cli  # noqa: E402
+from pw.pw_cli import PasswordCommand  # noqa: E402
+from pw.pw_config import PWConfig  # noqa: E402
+from pw.pw_index import EntityIndex  # noqa: E402
+from pw.pw_utils import find_key  # noqa: E402
+from pw.pw_vault import Vault  # noqa: E402
+
+ENCRYPTION_KEY = b'-HOFu-mIaxeVAdRMANMlTxvLF0Ihm5ncW3zOOZprX-U='
+N_SECTIONS = 20
+
+
+def generate_vault(creds_dir: str, n_entities: int, n_sections: int = N_SECTIONS) -> PWConfig:
+    """Write a synthetic vault with `n_entities` spread over `n_sections`.
+
+    Half of the entities are in "main". Ciphertexts are drawn from a small
+    pool, since encrypting every value would dominate the setup time."""
+    rng = random.Random(n_entities)
+    crypto = SynchronousEncryptionFernet(ENCRYPTION_KEY)
+    token_pool = crypto.encrypt_many(f'value-{i}' for i in range(100))
+    sections = ['main'] + [f'section-{i:02d}' for i in range(1, n_sections)]
+    pw_dict = {section: {} for section in sections}
+    for i in range(n_entities):
+        section = 'main' if i % 2 == 0 else sections[i % n_sections]
+        pw_dict[section][f'entity-{i:06d}'] = {
+            'password': rng.choice(token_pool),
+            'username': rng.choice(token_pool),
+            'website': rng.choice(token_pool),
+        }
+    os.makedirs(os.path.join(creds_dir, '.backups'), exist_ok=True)
+    with open(os.path.join(creds_dir, 'vault.json'), 'w') as f:
+        json.dump(pw_dict, f)
+    return PWConfig(creds_dir, 'vault.json', ENCRYPTION_KEY)
+
+
+def measure(function: Callable, repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return {'best_ms': min(timings), 'mean_ms': sum(timings) / len(timings)}
+
+
+def run_benchmarks(n_entities: int, repeat: int) -> Dict[str, dict]:
+    with tempfile.TemporaryDirectory() as creds_dir:
+        pw_config = generate_vault(creds_dir, n_entities)
+        creds_file_path = os.path.join(creds_dir, 'vault.json')
+        entity = f'entity-{n_entities // 2:06d}'
+        new_entity = 'bench-new-entity'
+
+        def cli(*args):
+            return lambda: PasswordCommand.main(list(args), pw_config)
+
+        with open(creds_file_path) as f:
+            pw_dict = json.load(f)
+        index = EntityIndex.build(pw_dict)
+        crypto = SynchronousEncryptionFernet(ENCRYPTION_KEY)
+        token = crypto.encrypt('value')
+        # A long-lived vault (agent, AsyncVault) builds the index on its second search
+        vault = Vault.from_config(pw_config)
+        for _ in range(2):
+            vault.find(entity[:-1])
+
+        benchmarks = {
+            'cli_lookup': cli(entity),
+            'cli_find': cli(entity[:-1]),
+            'cli_add': cli('-n', new_entity, '-pw', 'secret', '-ow'),
+            'cli_update': cli('-u', 'username=bench', new_entity),
+            'cli_remove': cli('-rm', new_entity),
+            'cli_list': cli('-ls'),
+            'cli_random': cli('-r'),
+            'find_key_scan': lambda: list(find_key(entity[:-1], pw_dict)),
+            'find_key_index': lambda: list(find_key(entity[:-1], pw_dict, index)),
+            'vault_find_warm': lambda: vault.find(entity[:-1]),
+            'json_load': lambda: json.load(open(creds_file_path)),
+            'fernet_encrypt': lambda: crypto.encrypt('value'),
+            'fernet_decrypt': lambda: crypto.decrypt(token),
+        }
+        results = {}
+        for name, function in benchmarks.items():
+            if name == 'cli_remove':
+                # Every remove needs an entity to remove
+                results[name] = _measure_with_setup(
+                    function, cli('-n', new_entity, '-pw', 'secret'), repeat)
+            else:
+                results[name] = measure(function, repeat)
+        return results
+
+
+def _measure_with_setup(function: Callable, setup: Callable, repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            setup()
+        timings.append(measure(function, 1)['best_ms'])
+    return {'best_ms': min(timings), 'mean_ms': sum(timings) / len(timings)}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Print a comparison table and return the names of regressed benchmarks."""
+    regressions = []
+    print(f'{"size":>8} {"benchmark":<16} {"baseline":>12} {"current":>12} {"ratio":>7}')
+    for size, benchmarks in results['results'].items():
+        for name, timing in benchmarks.items():
+            baseline_timing = baseline['results'].get(size, {}).get(name)
+            if baseline_timing is None:
+                continue
+            ratio = timing['best_ms'] / max(baseline_timing['best_ms'], 1e-9)
+            flag = ' <--' if ratio > tolerance else ''
+            print(f'{size:>8} {name:<16} {baseline_timing["best_ms"]:>10.3f}ms '
+                  f'{timing["best_ms"]:>10.3f}ms {ratio:>6.2f}x{flag}')
+            if ratio > tolerance:
+                regressions.append(f'{size}/{name}')
+    return regressions
+
+
+def _get_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main(args: List[str] = None):
+    parser = argparse.ArgumentParser(description='Benchmark the pw hot paths.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', type=str, help='Write the results to this json file.')
+    parser.add_argument('--compare', type=str, help='Compare against this result file.')
+    parser.add_argument('--tolerance', type=float, default=1.2,
+                        help='Ratio to the baseline that counts as a regression.')
+    args = parser.parse_args(args)
+
+    os.environ['PW_NO_AGENT'] = '1'
+    pw_cli.copy_to_clipboard = lambda text: None
+
+    results = {
+        'meta': {
+            'commit': _get_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {},
+    }
+    for size in args.sizes:
+        print(f'Benchmarking {size} entities ...', file=sys.stderr)
+        results['results'][str(size)] = run_benchmarks(size, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f'Regressions: {", ".join(regressions)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Memory footprint of the secrets data on synthetic vaults.
+
+Usage (from the root of the repo):
+
+    python benchmarks/bench_memory.py --sizes 1000 10000 100000
+
+Compares the resident size of the nested dicts returned by `json.load` with
+`CompactSecretsData`, which `pw` uses when `compact_memory` is enabled in the
+config. Sizes are measured with tracemalloc and written as json.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from bench_cli import generate_vault  # noqa: E402
+from pw.pw_compact_vault import CompactSecretsData  # noqa: E402
+
+
+def measure_memory(load: Callable) -> Dict[str, int]:
+    """Return the bytes still allocated by the result of `load` and the peak while loading."""
+    tracemalloc.start()
+    try:
+        result = load()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {'retained_bytes': retained, 'peak_bytes': peak}
+
+
+def run_benchmarks(n_entities: int) -> Dict[str, dict]:
+    with tempfile.TemporaryDirectory() as creds_dir:
+        pw_config = generate_vault(creds_dir, n_entities)
+        path = os.path.join(pw_config.creds_dir, pw_config.creds_file_name)
+
+        def load_dict():
+            with open(path) as f:
+                return json.load(f)
+
+        return {
+            'file_bytes': os.path.getsize(path),
+            'dict': measure_memory(load_dict),
+            'compact': measure_memory(lambda: CompactSecretsData.from_dict(load_dict())),
+        }
+
+
+def main(args: List[str] = None):
+    parser = argparse.ArgumentParser(description='Measure the memory footprint of the secrets data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--output', help='write the results as json to this file')
+    args = parser.parse_args(args)
+
+    results = {str(n): run_benchmarks(n) for n in args.sizes}
+    for n, result in results.items():
+        ratio = result['compact']['retained_bytes'] / result['dict']['retained_bytes']
+        print(f'{n:>8} entities: dict {result["dict"]["retained_bytes"] / 2**20:8.2f} MiB, '
+              f'compact {result["compact"]["retained_bytes"] / 2**20:8.2f} MiB ({ratio:.0%})')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 # Docs: https://cryptography.io/en/latest/hazmat/primitives/asymmetric/rsa/
 
+from functools import lru_cache
+
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from cryptography.hazmat.primitives.asymmetric.rsa import (RSAPrivateKey,
@@ -14,8 +16,12 @@ def generate_private_rsa_2048_key() -> RSAPrivateKey:
     return private_key
 
 
+@lru_cache(maxsize=None)
 def load_existing_key(path: str) -> RSAPrivateKey:
-    with open("path/to/key.pem", "rb") as key_file:
+    """Load a private key from a pem file.
+
+    Parsing a private key is expensive, the key is cached per path."""
+    with open(path, "rb") as key_file:
         private_key = serialization.load_pem_private_key(
             key_file.read(),
             password=None,
@@ -23,6 +29,25 @@ def load_existing_key(path: str) -> RSAPrivateKey:
         return private_key
 
 
+def load_public_key(pem: bytes) -> RSAPublicKey:
+    return serialization.load_pem_public_key(pem)
+
+
+def serialize_private_key(private_key: RSAPrivateKey) -> bytes:
+    return private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+def serialize_public_key(public_key: RSAPublicKey) -> bytes:
+    return public_key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+
+
 def encrypt(message: bytes, public_key: RSAPublicKey):
     ciphertext = public_key.encrypt(
         message,
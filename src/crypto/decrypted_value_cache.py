@@ -0,0 +1,53 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class DecryptedValueCache:
+    """Bounded LRU cache of decrypted values, keyed by their ciphertext.
+
+    Meant for long-running processes that decrypt the same values over and
+    over. Entries expire after `ttl` seconds. The cached plaintext is kept in
+    a bytearray that is overwritten with zeros when the entry is evicted.
+    Note that the `str` objects handed out to callers are immutable and can
+    not be zeroed; only the copy held by the cache is.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (expires_at, bytearray)
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, plaintext = entry
+            if expires_at < time.monotonic():
+                self._evict(token)
+                return None
+            self._entries.move_to_end(token)
+            return plaintext.decode('utf-8')
+
+    def put(self, token: str, plaintext: bytes):
+        with self._lock:
+            if token in self._entries:
+                self._evict(token)
+            self._entries[token] = (time.monotonic() + self.ttl, bytearray(plaintext))
+            while len(self._entries) > self.max_size:
+                self._evict(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            for token in list(self._entries):
+                self._evict(token)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, token: str):
+        _, plaintext = self._entries.pop(token)
+        plaintext[:] = bytes(len(plaintext))
@@ -1,9 +1,14 @@
+from typing import Iterable, List
+
 from cryptography.fernet import Fernet
 
+from .decrypted_value_cache import DecryptedValueCache
+
 
 class SynchronousEncryptionFernet:
-    def __init__(self, encryption_key):
+    def __init__(self, encryption_key, cache: DecryptedValueCache = None):
         self.cipher = Fernet(encryption_key)
+        self.cache = cache
 
     def encrypt(self, text: str) -> str:
         encrypted_text = self.cipher.encrypt(text.encode('utf-8'))
@@ -11,8 +16,31 @@ class SynchronousEncryptionFernet:
 
     def decrypt(self, encrypted_text: str) -> str:
         """Decrypt an encrypted text."""
-        decrypted_text = self.cipher.decrypt(encrypted_text.encode('utf-8'))
-        return decrypted_text.decode()
+        if self.cache is not None:
+            decrypted_text = self.cache.get(encrypted_text)
+            if decrypted_text is not None:
+                return decrypted_text
+        decrypted_bytes = self.cipher.decrypt(encrypted_text.encode('utf-8'))
+        if self.cache is not None:
+            self.cache.put(encrypted_text, decrypted_bytes)
+        return decrypted_bytes.decode()
+
+    def encrypt_many(self, texts: Iterable[str]) -> List[str]:
+        """Encrypt many texts, keeping their order."""
+        encrypt = self.cipher.encrypt
+        return [encrypt(text.encode('utf-8')).decode('utf-8') for text in texts]
+
+    def decrypt_many(self, encrypted_texts: Iterable[str]) -> List[str]:
+        """Decrypt many texts, keeping their order.
+
+        Every distinct ciphertext is decrypted only once."""
+        decrypted = {}
+        results = []
+        for encrypted_text in encrypted_texts:
+            if encrypted_text not in decrypted:
+                decrypted[encrypted_text] = self.decrypt(encrypted_text)
+            results.append(decrypted[encrypted_text])
+        return results
 
     @staticmethod
     def generate_key():
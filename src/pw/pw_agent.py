@@ -0,0 +1,171 @@
+import os
+import io
+import sys
+import json
+import socket
+import argparse
+import traceback
+import contextlib
+from typing import List, Tuple
+
+from .pw_config import PWConfig
+
+# Seconds a client may take to send its request or read the response
+CONNECTION_TIMEOUT = 5
+
+
+class PWAgentError(Exception):
+    """Raised by a forwarded command that failed inside the agent."""
+
+
+def forward_to_agent(args: List[str], pw_config: PWConfig) -> Tuple[bool, object]:
+    """Run `args` in a running `pw agent`.
+
+    Returns (False, None) if no agent is listening, so the caller can run
+    the command itself. Otherwise prints the output of the agent, stdout and
+    stderr, and returns
+    (True, <return value of the command>)."""
+    socket_path = pw_config.get_agent_socket_path()
+    if not os.path.exists(socket_path):
+        return False, None
+    try:
+        response = _send(socket_path, {'args': args})
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False, None
+    print(response['stdout'], end='')
+    print(response.get('stderr', ''), end='', file=sys.stderr)
+    if 'error' in response:
+        raise PWAgentError(response['error'])
+    return True, response['result']
+
+
+def agent_command(args: List[str], pw_config: PWConfig):
+    """`pw agent (--timeout <seconds>) (--stop)`"""
+    parser = argparse.ArgumentParser(prog='pw agent', description=(
+        'Keep the secrets data and the cipher in memory and serve pw commands '
+        'over a unix domain socket.'))
+    parser.add_argument('--timeout', type=int, default=pw_config.agent_timeout,
+                        help='Lock (stop) the agent after this many idle seconds.')
+    parser.add_argument('--stop', action='store_true', help='Stop a running agent.')
+    args = parser.parse_args(args)
+
+    socket_path = pw_config.get_agent_socket_path()
+    if args.stop:
+        try:
+            _send(socket_path, {'stop': True})
+        except (ConnectionRefusedError, FileNotFoundError):
+            print('No agent is running.')
+            return False
+        print('Stopped the agent.')
+        return True
+
+    PasswordAgent(pw_config, socket_path, args.timeout).serve()
+    return True
+
+
+class PasswordAgent:
+    """Serves pw commands from a single, long-lived PasswordCommand."""
+
+    def __init__(self, pw_config: PWConfig, socket_path: str, timeout: int):
+        self.pw_config = pw_config
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pw = None
+        self._fingerprint = None
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            try:
+                _send(self.socket_path, {'ping': True})
+            except ConnectionRefusedError:
+                os.remove(self.socket_path)  # left behind by a dead agent
+            else:
+                print(f'An agent is already listening on {self.socket_path}')
+                return
+
+        self._load()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # socket only accessible by its owner
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen()
+        server.settimeout(self.timeout)
+        print(f'pw agent listening on {self.socket_path} '
+              f'(locks after {self.timeout}s without requests)')
+        try:
+            while True:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    print('pw agent locked after being idle.')
+                    break
+                with connection:
+                    connection.settimeout(CONNECTION_TIMEOUT)
+                    try:
+                        request = _receive(connection)
+                        if request.get('stop'):
+                            _reply(connection, {'stopped': True})
+                            break
+                        _reply(connection, self.handle(request))
+                    except socket.timeout:
+                        print('pw agent closed a stalled connection.', file=sys.stderr)
+        finally:
+            server.close()
+            os.remove(self.socket_path)
+            self.lock()
+
+    def handle(self, request: dict) -> dict:
+        if request.get('ping'):
+            return {'pong': True}
+        from .pw_cli import PasswordCommand
+
+        if self._fingerprint != self._get_fingerprint():
+            self._load()  # changed on disk by another process
+        stdout, stderr = io.StringIO(), io.StringIO()
+        response = {}
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                response['result'] = PasswordCommand.execute(self.pw, request['args'])
+        except SystemExit as e:  # e.g. argparse errors and --help
+            response['result'] = e.code
+        except Exception as e:
+            response['error'] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        response['stdout'] = stdout.getvalue()
+        response['stderr'] = stderr.getvalue()
+        self._fingerprint = self._get_fingerprint()
+        return response
+
+    def lock(self):
+        """Drop the decrypted values, the secrets data and the cipher."""
+        if self.pw is not None:
+            self.pw.vault.close()
+        self.pw = None
+
+    def _load(self):
+        from crypto.decrypted_value_cache import DecryptedValueCache
+        from .pw_cli import PasswordCommand
+
+        self.lock()
+        self.pw = PasswordCommand(self.pw_config, DecryptedValueCache(ttl=self.timeout))
+        self._fingerprint = self._get_fingerprint()
+
+    def _get_fingerprint(self):
+        return self.pw.vault.pw_client.get_fingerprint()
+
+
+def _send(socket_path: str, request: dict) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        _reply(connection, request)
+        return _receive(connection)
+
+
+def _reply(connection: socket.socket, message: dict):
+    connection.sendall(json.dumps(message, default=str).encode('utf-8') + b'\n')
+
+
+def _receive(connection: socket.socket) -> dict:
+    with connection.makefile('rb') as stream:
+        return json.loads(stream.readline())
@@ -0,0 +1,101 @@
+"""asyncio API of the vault, for services that read secrets from it.
+
+    vault = await AsyncVault.open(pw_config)
+    password = await vault.get('main', 'postgres')
+
+File I/O and crypto run in an executor, so the event loop is never
+blocked. Concurrent reads of the same value share one decryption, and the
+vault is reloaded when another process changed its files.
+"""
+import time
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Hashable, List
+
+from .pw_config import PWConfig
+from .pw_vault import Vault
+
+
+class AsyncVault:
+    def __init__(self, vault: Vault, executor: Executor = None, check_interval: float = 1.0):
+        """Use `AsyncVault.open`, which loads the vault in the executor.
+
+        The files are checked for changes at most every `check_interval` seconds."""
+        self.vault = vault
+        self.executor = executor
+        self.check_interval = check_interval
+        self._checked_at = time.monotonic()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._write_lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, pw_config: PWConfig, executor: Executor = None, crypto_cache=None,
+                   **kwargs) -> 'AsyncVault':
+        loop = asyncio.get_running_loop()
+        vault = await loop.run_in_executor(executor, Vault.from_config, pw_config, crypto_cache)
+        return cls(vault, executor, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Drop the decrypted values that are cached."""
+        self.vault.close()
+        self._in_flight.clear()
+
+    async def get(self, section: str, entity: str, key: str = 'password') -> str:
+        """The decrypted value of `key`. Raises KeyError if it does not exist."""
+        await self.reload_if_changed()
+        return await self._coalesce(('get', section, entity, key), self.vault.get, section, entity, key)
+
+    async def get_fields(self, section: str, entity: str) -> Dict[str, str]:
+        """All decrypted values of an entity."""
+        await self.reload_if_changed()
+        return await self._coalesce(('get_fields', section, entity),
+                                    self.vault.get_fields, section, entity)
+
+    async def entities(self, section: str) -> List[str]:
+        await self.reload_if_changed()
+        return self.vault.entities(section)
+
+    async def add(self, section: str, entity: str, fields: Dict[str, str]):
+        """Add or replace an entity."""
+        async with self._write_lock:
+            await self._run(self.vault.add, section, entity, fields)
+
+    async def set_fields(self, section: str, entity: str, fields: Dict[str, str]):
+        async with self._write_lock:
+            await self._run(self.vault.set_fields, section, entity, fields)
+
+    async def delete(self, section: str, entity: str):
+        async with self._write_lock:
+            await self._run(self.vault.delete, section, entity)
+
+    async def reload_if_changed(self):
+        """Reload the vault if its files changed since the last check."""
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        await self._coalesce(('reload',), self._reload_if_changed)
+        self._checked_at = time.monotonic()
+
+    def _reload_if_changed(self):
+        if self.vault.pw_client.has_changed():
+            self.vault.pw_client.load()
+
+    async def _coalesce(self, key: Hashable, function: Callable, *args) -> Any:
+        """Run `function` in the executor, unless a call with the same `key` is
+        running already; then wait for its result instead."""
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(function, *args))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # A cancelled caller must not cancel the call for the other callers
+        return await asyncio.shield(future)
+
+    async def _run(self, function: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
@@ -0,0 +1,244 @@
+"""`pw audit`: find reused, weak and old passwords.
+
+The passwords are decrypted in a process pool, chunk by chunk. For every
+password a worker returns its length, an entropy estimate, its age and an
+HMAC-SHA256 with a key that is drawn for every audit. The plaintexts
+never leave the workers, and the HMACs cannot be attacked offline once
+the audit is over. Reused passwords are found by comparing the HMACs.
+
+The age comes from the "_password_modified" metadata of the entity (see
+Vault), which changes of the other keys leave alone. For entities written
+before the metadata existed, it comes from the time the password was
+encrypted, which every Fernet token contains.
+"""
+import os
+import sys
+import hmac
+import math
+import time
+import base64
+import string
+import struct
+import hashlib
+from collections import Counter
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from .pw_config import PWConfig
+from .pw_vault import PASSWORD_MODIFIED_KEY, Vault, parse_timestamp
+
+Chunk = Tuple[str, object, List[Tuple[str, str, str]]]  # (section, Fernet, [(entity, password, modified)])
+
+# Character classes and the number of characters they add to the search space
+CHARACTER_CLASSES = (
+    (frozenset(string.ascii_lowercase), 26),
+    (frozenset(string.ascii_uppercase), 26),
+    (frozenset(string.digits), 10),
+    (frozenset(string.punctuation + ' '), 33),
+)
+NON_ASCII_CHARACTERS = 100
+
+
+class PasswordAudit(NamedTuple):
+    section: str
+    entity: str
+    length: int
+    entropy: float  # bits
+    age_days: float
+    age_is_estimated: bool  # from the encryption time, no "_password_modified" metadata
+    digest: bytes  # HMAC with the key of the audit
+
+
+class AuditReport(NamedTuple):
+    n_passwords: int
+    seconds: float
+    reused: List[List[Tuple[str, str]]]
+    weak: List[PasswordAudit]
+    old: List[PasswordAudit]
+    skipped_sections: List[str]
+
+    def has_findings(self) -> bool:
+        return bool(self.reused or self.weak or self.old)
+
+
+def audit_command(args: List[str], pw_config: PWConfig):
+    """`pw audit (-s <section>) (--min_length <n>) (--min_entropy <bits>) (--max_age <days>) (--workers <n>) (--format text|json)`"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pw audit', description=(
+        'Find reused, weak and old passwords. Exits with an error if there are any.'))
+    parser.add_argument('-s', '--section', type=str, help='Only audit this section.')
+    parser.add_argument('--min_length', type=int, default=12)
+    parser.add_argument('--min_entropy', type=float, default=60,
+                        help='Estimated bits of entropy a password needs (default: 60).')
+    parser.add_argument('--max_age', type=float, default=365,
+                        help='Days after which a password is old (default: 365).')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Size of the process pool, 0 to decrypt in this process.')
+    parser.add_argument('--chunk_size', type=int, default=1000)
+    parser.add_argument('--format', choices=('text', 'json'), default='text')
+    args = parser.parse_args(args)
+
+    vault = Vault.from_config(pw_config)
+    report = audit_vault(vault, args.section, args.min_length, args.min_entropy, args.max_age,
+                         args.workers, args.chunk_size)
+    if args.format == 'json':
+        import json
+        print(json.dumps(_to_json(report), indent=2))
+    else:
+        print_report(report, args.min_length, args.min_entropy, args.max_age)
+    return not report.has_findings()
+
+
+def audit_vault(vault, section: str = None, min_length: int = 12, min_entropy: float = 60,
+                max_age_days: float = 365, workers: int = 0, chunk_size: int = 1000) -> AuditReport:
+    """Audit the passwords of all sections (or of `section`) of a Vault."""
+    started_at = time.perf_counter()
+    hmac_key = os.urandom(32)
+    now = time.time()
+    chunks, skipped_sections = _get_chunks(vault, section, chunk_size)
+
+    audits = [audit for chunk_audits in _audit_chunks(hmac_key, now, chunks, workers)
+              for audit in chunk_audits]
+    by_digest: Dict[bytes, List[Tuple[str, str]]] = {}
+    for audit in audits:
+        by_digest.setdefault(audit.digest, []).append((audit.section, audit.entity))
+    return AuditReport(
+        n_passwords=len(audits),
+        seconds=time.perf_counter() - started_at,
+        reused=sorted(sorted(matches) for matches in by_digest.values() if len(matches) > 1),
+        weak=[a for a in audits if a.length < min_length or a.entropy < min_entropy],
+        old=[a for a in audits if a.age_days > max_age_days],
+        skipped_sections=skipped_sections,
+    )
+
+
+def estimate_entropy(password: str) -> float:
+    """Bits of entropy of `password`, estimated from the sizes of the
+    character classes it uses.
+
+    Repeated characters lower the estimate: it is scaled by the share of the
+    largest possible Shannon entropy (for its length) that the characters
+    reach. Words and patterns are not detected."""
+    return estimate_entropies([password])[0]
+
+
+def estimate_entropies(passwords: List[str]) -> List[float]:
+    """`estimate_entropy` of many passwords, with the logarithms computed once."""
+    max_length = max(map(len, passwords), default=0)
+    # Shannon entropy of a password of length L: log2(L) - sum(n * log2(n)) / L
+    # over the counts n of its characters
+    log2 = [0.0] + [math.log2(n) for n in range(1, max_length + 1)]
+    n_log2_n = [n * log2[n] for n in range(max_length + 1)]
+    entropies = []
+    for password in passwords:
+        length = len(password)
+        characters = set(password)
+        pool = sum(size for charset, size in CHARACTER_CLASSES
+                   if not characters.isdisjoint(charset))
+        if not password.isascii():
+            pool += NON_ASCII_CHARACTERS
+        pool = max(pool, len(characters))  # e.g. control characters
+        if length < 2 or len(characters) == 1:
+            entropies.append(math.log2(pool) if length == 1 else 0.0)
+            continue
+        shannon = log2[length] - sum(map(n_log2_n.__getitem__, Counter(password).values())) / length
+        max_shannon = log2[min(length, pool)]
+        entropies.append(length * math.log2(pool) * min(shannon / max_shannon, 1.0))
+    return entropies
+
+
+def print_report(report: AuditReport, min_length: int, min_entropy: float, max_age_days: float):
+    print(f'Audited {report.n_passwords} passwords in {report.seconds:.2f}s.')
+    for section in report.skipped_sections:
+        print(f'Skipped section "{section}": it is not shared with you.', file=sys.stderr)
+    if report.reused:
+        print(f'\nReused passwords ({len(report.reused)}):')
+        for matches in report.reused:
+            print('  ' + ', '.join(f'({section}) {entity}' for section, entity in matches))
+    if report.weak:
+        print(f'\nWeak passwords (less than {min_length} characters or {min_entropy:g} bits):')
+        for audit in report.weak:
+            print(f'  ({audit.section}) {audit.entity}: {audit.length} characters, '
+                  f'~{audit.entropy:.0f} bits')
+    if report.old:
+        print(f'\nOld passwords (older than {max_age_days:g} days):')
+        for audit in report.old:
+            estimated = ' (encryption time)' if audit.age_is_estimated else ''
+            print(f'  ({audit.section}) {audit.entity}: {audit.age_days:.0f} days{estimated}')
+    if not report.has_findings():
+        print('No findings.')
+
+
+def _get_chunks(vault, section: str, chunk_size: int) -> Tuple[List[Chunk], List[str]]:
+    chunks = []
+    skipped_sections = []
+    sections = [section] if section else vault.sections()
+    for section in sections:
+        try:
+            cipher = vault.get_crypto(section).cipher
+        except PermissionError:
+            skipped_sections.append(section)
+            continue
+        items = [(entity, secrets_data['password'], secrets_data.get(PASSWORD_MODIFIED_KEY))
+                 for entity, secrets_data in vault.pw_client.pw_dict[section].items()
+                 if 'password' in secrets_data]
+        for i in range(0, len(items), chunk_size):
+            chunks.append((section, cipher, items[i:i + chunk_size]))
+    return chunks, skipped_sections
+
+
+def _audit_chunks(hmac_key: bytes, now: float, chunks: List[Chunk],
+                  workers: int) -> Iterator[List[PasswordAudit]]:
+    if not workers or len(chunks) < 2:
+        for chunk in chunks:
+            yield _audit_chunk(hmac_key, now, chunk)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_audit_chunk, [hmac_key] * len(chunks), [now] * len(chunks), chunks)
+
+
+def _audit_chunk(hmac_key: bytes, now: float, chunk: Chunk) -> List[PasswordAudit]:
+    section, cipher, items = chunk
+    lengths, digests, ages = [], [], []
+    passwords = []  # only for estimate_entropies, dropped with the chunk
+    for _, encrypted_password, encrypted_modified in items:
+        password = cipher.decrypt(encrypted_password.encode('utf-8')).decode('utf-8')
+        passwords.append(password)
+        lengths.append(len(password))
+        digests.append(hmac.new(hmac_key, password.encode('utf-8'), hashlib.sha256).digest())
+        if encrypted_modified is not None:
+            modified = cipher.decrypt(encrypted_modified.encode('utf-8')).decode('utf-8')
+            modified_at = parse_timestamp(modified)
+        else:
+            modified_at = _get_encryption_time(encrypted_password)
+        ages.append((now - modified_at) / 86400)
+    entropies = estimate_entropies(passwords)
+    del passwords
+    return [
+        PasswordAudit(section, entity, length, entropy, age, encrypted_modified is None, digest)
+        for (entity, _, encrypted_modified), length, entropy, age, digest
+        in zip(items, lengths, entropies, ages, digests)
+    ]
+
+
+def _get_encryption_time(token: str) -> int:
+    """The timestamp of a Fernet token: version (1 byte), timestamp (8 bytes), ..."""
+    (timestamp,) = struct.unpack('>Q', base64.urlsafe_b64decode(token)[1:9])
+    return timestamp
+
+
+def _to_json(report: AuditReport) -> dict:
+    def entry(audit: PasswordAudit, **values) -> dict:
+        return {'section': audit.section, 'entity': audit.entity, **values}
+
+    return {
+        'passwords': report.n_passwords,
+        'seconds': report.seconds,
+        'reused': [[{'section': s, 'entity': e} for s, e in matches] for matches in report.reused],
+        'weak': [entry(a, length=a.length, entropy=round(a.entropy, 1)) for a in report.weak],
+        'old': [entry(a, age_days=round(a.age_days, 1), estimated=a.age_is_estimated)
+                for a in report.old],
+        'skipped_sections': report.skipped_sections,
+    }
@@ -0,0 +1,299 @@
+import os
+import json
+import hashlib
+import datetime
+from typing import Dict, Iterable, List, Optional
+
+from .pw_utils import open_atomically, write_json_atomically
+
+
+class SecretsDataBackups:
+    """Content-addressed backups of the secrets data.
+
+    Every entity is stored once as an object named after the sha256 of its
+    json. A full snapshot lists the object of every entity per section, so
+    entities that did not change between two snapshots are not duplicated.
+
+    Hashing every entity for every snapshot is O(vault), so the clients
+    record which entities they change (`record_changes`) and the next
+    snapshot only lists those, on top of the snapshot before it. Every
+    MAX_DELTAS snapshots, or when the secrets data was changed without a
+    record (e.g. by `pw rotate-key` or by hand), a full snapshot is taken.
+
+    Sections that are stored in files of their own, which are never changed
+    in place (see pw_sharded_client), are hard linked instead of hashed.
+
+    .backups/
+        objects/<sha256>
+        shards/<inode>-<mtime>-<shard file name>
+        snapshots/<timestamp>.json          full snapshot
+        snapshots/<timestamp>.delta.json    changes since the snapshot before it
+        changes.json                        changes since the latest snapshot
+    """
+
+    TIMESTAMP_FORMAT = '%Y-%m-%dT%H.%M.%S.%f'
+    MAX_DELTAS = 50
+    DELTA_SUFFIX = '.delta.json'
+
+    def __init__(self, backups_dir_path: str, keep_last: int = 10, keep_daily: int = 30):
+        self.backups_dir_path = backups_dir_path
+        self.objects_dir_path = os.path.join(backups_dir_path, 'objects')
+        self.snapshots_dir_path = os.path.join(backups_dir_path, 'snapshots')
+        self.shards_dir_path = os.path.join(backups_dir_path, 'shards')
+        self.changes_path = os.path.join(backups_dir_path, 'changes.json')
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+
+    def create_snapshot(self, pw_dict, fingerprint=None,
+                        section_files: Dict[str, str] = None) -> Optional[str]:
+        """Snapshot `pw_dict` unless it equals the latest snapshot.
+
+        With the `fingerprint` of the secrets data files (see
+        `SecretsDataClient.get_fingerprint`), only the entities changed since
+        the latest snapshot are stored, if their changes were recorded up to
+        that fingerprint. `section_files` are the paths of immutable json
+        files with the entities of sections, which a full snapshot links
+        instead of reading. Returns the name of the new snapshot or None if
+        nothing changed."""
+        os.makedirs(self.objects_dir_path, exist_ok=True)
+        os.makedirs(self.snapshots_dir_path, exist_ok=True)
+
+        changes = None if fingerprint is None else self._read_changes(fingerprint)
+        if changes is not None and changes['snapshot'] == self._get_latest_snapshot():
+            name = self._create_delta_snapshot(pw_dict, changes)
+            depth = changes['depth'] + 1 if name else changes['depth']
+        else:
+            name = self._create_full_snapshot(pw_dict, section_files or {})
+            depth = 0
+        if fingerprint is not None:
+            self._write_changes({'snapshot': self._get_latest_snapshot(), 'depth': depth,
+                                 'fingerprint': fingerprint, 'sections': {}})
+        if name is not None:
+            self.apply_retention()
+        return name
+
+    def record_changes(self, records: Iterable[dict], fingerprint_before, fingerprint_after):
+        """Note the entities that journal `records` (see pw_journal) changed,
+        for the next snapshot. The fingerprints are those of the secrets data
+        files before and after the records were written."""
+        changes = self._read_changes(fingerprint_before)
+        if changes is None:
+            return  # the next snapshot is a full one
+        for record in records:
+            _add_changes(changes['sections'], record)
+        changes['fingerprint'] = fingerprint_after
+        self._write_changes(changes)
+
+    def list_snapshots(self) -> List[str]:
+        """Names of all snapshots, oldest first."""
+        return sorted(self._get_snapshot_files())
+
+    def load_snapshot(self, name: str) -> dict:
+        """Rebuild the secrets data of a snapshot."""
+        snapshots = self.list_snapshots()
+        deltas = []
+        snapshot = self._read_snapshot(name)
+        position = snapshots.index(name)
+        while 'parent' in snapshot:
+            deltas.append(snapshot)
+            position -= 1
+            snapshot = self._read_snapshot(snapshots[position])
+        pw_dict = {section: {entity: self._read_object(object_hash)
+                             for entity, object_hash in entities.items()}
+                   for section, entities in snapshot['sections'].items()}
+        for section, shard_name in snapshot.get('shards', {}).items():
+            with open(os.path.join(self.shards_dir_path, shard_name)) as f:
+                pw_dict[section] = json.load(f)
+        for delta in reversed(deltas):
+            for section in delta['removed']:
+                pw_dict.pop(section, None)
+            for section, entities in delta['replaced'].items():
+                pw_dict[section] = {entity: self._read_object(object_hash)
+                                    for entity, object_hash in entities.items()}
+            for section, entities in delta['changed'].items():
+                section_dict = pw_dict.setdefault(section, {})
+                for entity, object_hash in entities.items():
+                    if object_hash is None:
+                        section_dict.pop(entity, None)
+                    else:
+                        section_dict[entity] = self._read_object(object_hash)
+        return pw_dict
+
+    def apply_retention(self):
+        """Keep the `keep_last` newest snapshots plus the newest snapshot of
+        each of the `keep_daily` most recent days, and the snapshots that
+        these build on, then drop unused objects."""
+        files = self._get_snapshot_files()
+        snapshots = sorted(files)
+        keep = set(snapshots[-self.keep_last:]) if self.keep_last else set()
+        days = {}
+        for name in snapshots:
+            days[name[:len('YYYY-MM-DD')]] = name  # newest of each day wins
+        for day in sorted(days)[-self.keep_daily:] if self.keep_daily else []:
+            keep.add(days[day])
+        is_needed = False  # by a kept delta snapshot after it
+        for name in reversed(snapshots):
+            if is_needed:
+                keep.add(name)
+            if name in keep:
+                is_needed = files[name].endswith(self.DELTA_SUFFIX)
+
+        removed_full_snapshot = False
+        for name in snapshots:
+            if name not in keep:
+                os.remove(os.path.join(self.snapshots_dir_path, files[name]))
+                removed_full_snapshot |= not files[name].endswith(self.DELTA_SUFFIX)
+        # The objects of removed delta snapshots wait for the next removed
+        # full snapshot, which saves reading all snapshots every time
+        if removed_full_snapshot:
+            self._collect_garbage()
+
+    def _create_full_snapshot(self, pw_dict, section_files: Dict[str, str]) -> Optional[str]:
+        sections = {}
+        shards = {}
+        for section in pw_dict:
+            if section in section_files:
+                shards[section] = self._link_shard(section_files[section])
+                continue
+            sections[section] = {}
+            for entity, secrets_data in pw_dict[section].items():
+                sections[section][entity] = self._write_object(secrets_data)
+        digest = _hash_json({'sections': sections, 'shards': shards})
+
+        latest = self._get_latest_snapshot()
+        if latest is not None and self._read_snapshot(latest).get('digest') == digest:
+            return None
+        snapshot = {'digest': digest, 'sections': sections}
+        if shards:
+            snapshot['shards'] = shards
+        return self._write_snapshot(snapshot)
+
+    def _link_shard(self, path: str) -> str:
+        """Hard link (or copy, where links are not supported) an immutable file."""
+        stat = os.stat(path)
+        shard_name = f'{stat.st_ino}-{stat.st_mtime_ns}-{os.path.basename(path)}'
+        shard_path = os.path.join(self.shards_dir_path, shard_name)
+        if not os.path.exists(shard_path):
+            os.makedirs(self.shards_dir_path, exist_ok=True)
+            try:
+                os.link(path, shard_path)
+            except OSError:
+                import shutil
+                with open(path, 'rb') as source, \
+                        open_atomically(shard_path, 'wb', sync=False) as target:
+                    shutil.copyfileobj(source, target)
+        return shard_name
+
+    def _create_delta_snapshot(self, pw_dict, changes: dict) -> Optional[str]:
+        if not changes['sections']:
+            return None
+        removed, replaced, changed = [], {}, {}
+        for section, entities in changes['sections'].items():
+            if section not in pw_dict:
+                removed.append(section)
+            elif entities is None:
+                replaced[section] = {entity: self._write_object(secrets_data)
+                                     for entity, secrets_data in pw_dict[section].items()}
+            else:
+                current = pw_dict[section]
+                changed[section] = {entity: self._write_object(current[entity]) if entity in current else None
+                                    for entity in entities}
+        return self._write_snapshot({'parent': changes['snapshot'], 'removed': removed,
+                                     'replaced': replaced, 'changed': changed})
+
+    def _write_snapshot(self, snapshot: dict) -> str:
+        name = datetime.datetime.now().strftime(self.TIMESTAMP_FORMAT)
+        suffix = self.DELTA_SUFFIX if 'parent' in snapshot else '.json'
+        write_json_atomically(os.path.join(self.snapshots_dir_path, name + suffix), snapshot)
+        return name
+
+    def _read_changes(self, fingerprint) -> Optional[dict]:
+        """The changes since the latest snapshot, if they lead up to `fingerprint`."""
+        try:
+            with open(self.changes_path) as f:
+                changes = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if changes['fingerprint'] != json.loads(json.dumps(fingerprint)):
+            return None
+        if changes['snapshot'] is None or changes['depth'] >= self.MAX_DELTAS:
+            return None
+        return changes
+
+    def _write_changes(self, changes: dict):
+        # Not synced: if it is lost, its fingerprint does not match and the
+        # next snapshot is a full one
+        with open_atomically(self.changes_path, sync=False) as f:
+            f.write(json.dumps(changes))
+
+    def _get_snapshot_files(self) -> Dict[str, str]:
+        """Name -> file name of all snapshots."""
+        try:
+            file_names = os.listdir(self.snapshots_dir_path)
+        except FileNotFoundError:
+            return {}
+        files = {}
+        for file_name in file_names:
+            if file_name.endswith(self.DELTA_SUFFIX):
+                files[file_name[:-len(self.DELTA_SUFFIX)]] = file_name
+            elif file_name.endswith('.json'):
+                files[file_name[:-len('.json')]] = file_name
+        return files
+
+    def _get_latest_snapshot(self) -> Optional[str]:
+        snapshots = self.list_snapshots()
+        return snapshots[-1] if snapshots else None
+
+    def _collect_garbage(self):
+        referenced = set()
+        referenced_shards = set()
+        for name in self.list_snapshots():
+            snapshot = self._read_snapshot(name)
+            for key in ('sections', 'replaced', 'changed'):
+                for entities in snapshot.get(key, {}).values():
+                    referenced.update(entities.values())
+            referenced_shards.update(snapshot.get('shards', {}).values())
+        for object_hash in os.listdir(self.objects_dir_path):
+            if object_hash not in referenced:
+                os.remove(os.path.join(self.objects_dir_path, object_hash))
+        if os.path.isdir(self.shards_dir_path):
+            for shard_name in os.listdir(self.shards_dir_path):
+                if shard_name not in referenced_shards:
+                    os.remove(os.path.join(self.shards_dir_path, shard_name))
+
+    def _write_object(self, secrets_data: dict) -> str:
+        object_hash = _hash_json(secrets_data)
+        object_path = os.path.join(self.objects_dir_path, object_hash)
+        if not os.path.exists(object_path):
+            # Objects are immutable and only referenced once the snapshot is
+            # written, so a rename is enough; no fsync per object.
+            with open_atomically(object_path, sync=False) as f:
+                json.dump(secrets_data, f)
+        return object_hash
+
+    def _read_object(self, object_hash: str) -> dict:
+        with open(os.path.join(self.objects_dir_path, object_hash)) as f:
+            return json.load(f)
+
+    def _read_snapshot(self, name: str) -> dict:
+        with open(os.path.join(self.snapshots_dir_path, self._get_snapshot_files()[name])) as f:
+            return json.load(f)
+
+
+def _add_changes(sections: Dict[str, Optional[dict]], record: dict):
+    """Add the entities that a journal record changes to {section: {entity: None}}
+    (None instead of the entities: the whole section)."""
+    if record['op'] == 'batch':
+        for batched_record in record['records']:
+            _add_changes(sections, batched_record)
+        return
+    section = record['section']
+    if record['op'] in ('create_section', 'remove_section'):
+        sections[section] = None
+    elif sections.get(section, {}) is not None:
+        sections.setdefault(section, {})[record['entity']] = None
+
+
+def _hash_json(data: dict) -> str:
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
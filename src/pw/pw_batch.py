@@ -0,0 +1,154 @@
+"""`pw get`: resolve many secrets in one process, for scripts and deploy tools.
+
+A reference names a secret as "<section>/<entity>/<key>" ("<section>/<entity>"
+for the password) and can be given a name as "<NAME>=<reference>". The
+values are written to stdout as json or dotenv, or substituted into a
+template with "{{ <reference> }}" placeholders. Nothing is copied to the
+clipboard. References that cannot be resolved are reported one per line on
+stderr and the other values are still written, except for templates, which
+are only written when every placeholder is resolved.
+"""
+import os
+import re
+import sys
+import json
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from .pw_config import PWConfig
+from .pw_trace import phase
+
+FORMATS = ('json', 'dotenv')
+PLACEHOLDER = re.compile(r'\{\{\s*([^{}\s=]+)\s*\}\}')
+
+
+class SecretRef(NamedTuple):
+    name: str
+    section: str
+    entity: str
+    key: str
+
+
+def get_command(args: List[str], pw_config: PWConfig):
+    """`pw get (<ref> ...) (--batch <file>) (--format json|dotenv) (--template <file>) (-o <file>)`"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pw get', description=(
+        'Print many secrets at once. References look like "section/entity/key", '
+        'optionally named as "NAME=section/entity/key".'))
+    parser.add_argument('refs', type=str, nargs='*')
+    parser.add_argument('--batch', type=str, nargs='?', const='-', metavar='FILE',
+                        help='Read references from FILE, one per line (default: stdin).')
+    parser.add_argument('--format', choices=FORMATS, default='json')
+    parser.add_argument('--template', type=str,
+                        help='Substitute "{{ section/entity/key }}" placeholders in this file.')
+    parser.add_argument('-o', '--output', type=str, help='Write to this file instead of stdout.')
+    args = parser.parse_args(args)
+
+    lines = list(args.refs)
+    if args.batch:
+        if args.batch == '-':
+            lines.extend(sys.stdin)
+        else:
+            with open(args.batch) as f:
+                lines.extend(f)
+    template = None
+    if args.template:
+        with open(args.template) as f:
+            template = f.read()
+        lines.extend(PLACEHOLDER.findall(template))
+
+    refs, errors = parse_refs(lines)
+    from .pw_vault import Vault
+    values, lookup_errors = resolve_refs(Vault.from_config(pw_config), refs)
+    errors.update(lookup_errors)
+    for ref, error in errors.items():
+        print(f'{ref}: {error}', file=sys.stderr)
+
+    if template is not None:
+        if errors:
+            return False
+        output = PLACEHOLDER.sub(lambda match: values[match.group(1)], template)
+    elif args.format == 'dotenv':
+        output = format_dotenv(values)
+    else:
+        output = json.dumps(values, indent=2) + '\n'
+
+    if args.output:
+        _write_private_file(args.output, output)
+    else:
+        sys.stdout.write(output)
+    return not errors
+
+
+def parse_refs(lines: Iterable[str]) -> Tuple[List[SecretRef], Dict[str, str]]:
+    """Parse references, skipping blank lines and "#" comments.
+
+    Returns the references and an error per line that is not a reference."""
+    refs = []
+    errors = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        name, _, ref = line.rpartition('=')
+        parts = ref.split('/')
+        if len(parts) == 2:
+            parts.append('password')
+        if len(parts) != 3 or not all(parts):
+            errors[line] = 'expected "section/entity/key"'
+            continue
+        refs.append(SecretRef(name or ref, *parts))
+    return refs, errors
+
+
+def resolve_refs(vault, refs: List[SecretRef]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Decrypt the values of `refs` from a Vault, one pass per section.
+
+    Returns {name: value} and {name: error} for the references that are missing."""
+    pw_dict = vault.pw_client.pw_dict
+    errors = {}
+    by_section: Dict[str, List[Tuple[SecretRef, str]]] = {}
+    for ref in refs:
+        entities = pw_dict.get(ref.section)
+        if entities is None:
+            errors[ref.name] = f'section "{ref.section}" not found'
+            continue
+        secrets_data = entities.get(ref.entity)
+        if secrets_data is None:
+            errors[ref.name] = f'entity "{ref.entity}" not found in section "{ref.section}"'
+            continue
+        if ref.key not in secrets_data:
+            errors[ref.name] = f'key "{ref.key}" not found for "{ref.entity}"'
+            continue
+        by_section.setdefault(ref.section, []).append((ref, secrets_data[ref.key]))
+
+    decrypted = {}
+    for section, items in by_section.items():
+        try:
+            crypto = vault.get_crypto(section)
+        except PermissionError as e:
+            errors.update((ref.name, str(e)) for ref, _ in items)
+            continue
+        with phase('decrypt'):
+            values = crypto.decrypt_many(encrypted for _, encrypted in items)
+        decrypted.update((ref.name, value) for (ref, _), value in zip(items, values))
+    values = {ref.name: decrypted[ref.name] for ref in refs if ref.name in decrypted}
+    return values, errors
+
+
+def format_dotenv(values: Dict[str, str]) -> str:
+    """Double quoted `NAME="value"` lines. `\\`, `"`, `$` and backticks are
+    escaped, so that neither shells nor dotenv loaders expand the values."""
+    lines = []
+    for name, value in values.items():
+        env_name = re.sub(r'[^A-Za-z0-9_]', '_', name).upper()
+        escaped = re.sub(r'([\\"$`])', r'\\\1', value).replace('\n', '\\n')
+        lines.append(f'{env_name}="{escaped}"\n')
+    return ''.join(lines)
+
+
+def _write_private_file(path: str, text: str):
+    """Write `text` to a file that only the owner can read."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
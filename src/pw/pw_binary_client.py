@@ -0,0 +1,121 @@
+"""Binary, memory mapped storage format for the secrets data.
+
+    magic "PWV1" | index length (uint32) | index | records
+
+The index is json: {section: {entity: offset of its record}}, offsets are
+relative to the first record. A record is a uint32 length followed by the
+json of the (encrypted) secrets data of one entity. Reading an entity only touches the index and its own record.
+"""
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+from typing import List
+
+from .pw_journal import apply_record
+from .pw_storage import SecretsDataClient
+from .pw_utils import open_atomically
+
+MAGIC = b'PWV1'
+LENGTH = struct.Struct('>I')
+
+
+class SecretsDataBinaryClient(SecretsDataClient):
+    """Reads from a memory mapped file; every change rewrites the file.
+
+    Meant for large, read mostly vaults. Convert with `pw convert`."""
+
+    def __init__(self, creds_dir_path: str, creds_file_name: str, compact: bool = False,
+                 lazy: bool = False, parse_cache: bool = False):
+        # The file is memory mapped, not parsed: there is nothing to cache
+        super().__init__(creds_dir_path, creds_file_name, compact, lazy)
+        self.load()
+
+    def _load(self):
+        return MmapSecretsData(self.creds_file_path)
+
+    def save_dict_to_file(self):
+        write_binary_file(self.creds_file_path, self.pw_dict)
+
+    def _write_record(self, record: dict):
+        self._materialize()
+        apply_record(self.pw_dict, record)
+        self.save_dict_to_file()
+
+    def _materialize(self):
+        # The mapped file is already compact and lazy, the options do not apply.
+        if isinstance(self.pw_dict, MmapSecretsData):
+            mapped = self.pw_dict
+            self.pw_dict = mapped.to_dict()
+            mapped.close()
+
+
+class MmapSecretsData(Mapping):
+    """Read-only mapping of section -> entity -> secrets data over a mapped file."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a binary secrets data file.')
+        start = len(MAGIC) + LENGTH.size
+        (index_length,) = LENGTH.unpack_from(self._mmap, len(MAGIC))
+        self._index = json.loads(self._mmap[start:start + index_length])
+        self._records_start = start + index_length
+
+    def __getitem__(self, section: str) -> 'MmapSection':
+        return MmapSection(self._mmap, self._index[section], self._records_start)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def to_dict(self) -> dict:
+        return {section: dict(entities.items()) for section, entities in self.items()}
+
+    def close(self):
+        self._mmap.close()
+
+
+class MmapSection(Mapping):
+    def __init__(self, mapped: mmap.mmap, offsets: dict, records_start: int):
+        self._mmap = mapped
+        self._offsets = offsets
+        self._records_start = records_start
+
+    def __getitem__(self, entity: str) -> dict:
+        offset = self._records_start + self._offsets[entity]
+        (length,) = LENGTH.unpack_from(self._mmap, offset)
+        start = offset + LENGTH.size
+        return json.loads(self._mmap[start:start + length])
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+
+def write_binary_file(path: str, pw_dict: Mapping):
+    """Write `pw_dict` to `path` atomically in the binary format."""
+    records = []
+    index = {}
+    offset = 0
+    for section, entities in pw_dict.items():
+        index[section] = {}
+        for entity, secrets_data in entities.items():
+            record = json.dumps(secrets_data, separators=(',', ':')).encode('utf-8')
+            records.append(LENGTH.pack(len(record)) + record)
+            index[section][entity] = offset
+            offset += LENGTH.size + len(record)
+
+    index_bytes = json.dumps(index, separators=(',', ':')).encode('utf-8')
+
+    with open_atomically(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(LENGTH.pack(len(index_bytes)))
+        f.write(index_bytes)
+        for record in records:
+            f.write(record)
@@ -1,32 +1,98 @@
+import time
+_import_started_at = time.perf_counter()  # for `pw --profile`
+
+import os
 import sys
-import argparse
-from pprint import pprint
+import importlib
+from types import SimpleNamespace
 from typing import List
 
-import pyperclip
-
+# Keep the imports of this module cheap: every `pw` call pays for them.
+# Heavy modules (argparse, pprint, pyperclip, cryptography) are imported
+# where they are needed.
 from pw.pw_config import PWConfig, get_prod_config
-from .pw_json_client import SecretsDataJSONClient
-from .pw_utils import generate_random_password, find_key, HelpTexts as h
-from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+from .pw_utils import generate_random_passwords, HelpTexts as h
+from .pw_vault import Vault
+from . import pw_trace
+
+_import_seconds = time.perf_counter() - _import_started_at
+
+# Parsed arguments of a plain `pw <entity>`, see `PasswordCommand.main`.
+# Must match the defaults of `PasswordCommand.parse_args`.
+DEFAULT_ARGS = {
+    'entity': None,
+    'debug': False,
+    'find': None,
+    'secret_key': 'password',
+    'available_keys': False,
+    'expressive': False,
+    'all_sections': False,
+    'list_keys': False,
+    'section': None,
+    'generate_random_pw': False,
+    'random_password_length': 42,
+    'no_special_characters': True,
+    'count': 1,
+    'min_digits': 0,
+    'min_symbols': 0,
+    'min_lowercase': 0,
+    'min_uppercase': 0,
+    'new_secrets_data': None,
+    'update': None,
+    'update_password': False,
+    'set_password': None,
+    'username': None,
+    'website': None,
+    'kwargs': None,
+    'overwrite': True,
+    'remove_entity': None,
+    'remove_section': None,
+    'list_backups': False,
+    'restore_backup': None,
+}
+
+# pw <subcommand> ...: module and function that implement the subcommand.
+# Entities with these names are looked up with `pw -- <entity>`.
+SUBCOMMANDS = {
+    'agent': ('pw.pw_agent', 'agent_command'),
+    'import': ('pw.pw_transfer', 'import_command'),
+    'export': ('pw.pw_transfer', 'export_command'),
+    'rotate-key': ('pw.pw_rotate', 'rotate_key_command'),
+    'convert': ('pw.pw_storage', 'convert_command'),
+    'share': ('pw.pw_share', 'share_command'),
+    'get': ('pw.pw_batch', 'get_command'),
+    'search': ('pw.pw_search', 'search_command'),
+    'audit': ('pw.pw_audit', 'audit_command'),
+    'history': ('pw.pw_history', 'history_command'),
+    'revert': ('pw.pw_history', 'revert_command'),
+}
+
+
+def copy_to_clipboard(text: str):
+    with pw_trace.phase('clipboard'):
+        import pyperclip
+        pyperclip.copy(text)
+
+
+def pprint(value):
+    from pprint import pprint
+    pprint(value)
 
 
 class PasswordCommand:
-    def __init__(self, pw_config: PWConfig = None):
+    """Command line adapter of `Vault`: reads the parsed arguments in `self.args`,
+    calls the vault and prints the results."""
+
+    def __init__(self, pw_config: PWConfig = None, crypto_cache=None):
         if pw_config is None:
             pw_config = get_prod_config()
 
-        self.pw_client = SecretsDataJSONClient(
-            pw_config.creds_dir, pw_config.creds_file_name)
-        self.crypto = SynchronousEncryptionFernet(pw_config.encryption_key)
-        self.args: argparse.Namespace = None # set later with "setattr()"
+        self.vault = Vault.from_config(pw_config, crypto_cache)
+        self.args: SimpleNamespace = None # set later with "setattr()"
     
     @staticmethod
     def main(args: List[str] = None, pw_config: PWConfig = None):
 
-        if pw_config is None:
-            pw_config = get_prod_config()
-        
         if args is None:
             args = sys.argv[1:]
         
@@ -34,8 +100,51 @@ class PasswordCommand:
             raise TypeError("Make sure to pass a list of strings. " \
                             f"You passed: {type(args)}")
 
+        # pw --profile ...
+        args = pw_trace.configure(args)
+        if pw_trace.tracer.enabled:
+            pw_trace.tracer.add('import', _import_seconds)
+        try:
+            with pw_trace.phase('config'):
+                if pw_config is None:
+                    pw_config = get_prod_config()
+            return PasswordCommand.run(args, pw_config)
+        finally:
+            pw_trace.finish()
+
+    @staticmethod
+    def run(args: List[str], pw_config: PWConfig):
+        """Dispatch the command to a subcommand, the agent or `execute`."""
+        # pw agent, pw import, ...
+        if args and args[0] in SUBCOMMANDS:
+            module_name, function_name = SUBCOMMANDS[args[0]]
+            subcommand = getattr(importlib.import_module(module_name), function_name)
+            return subcommand(args[1:], pw_config)
+
+        # Let a running agent handle the command if there is one
+        if (
+            os.environ.get('PW_NO_AGENT') is None
+            and os.path.exists(pw_config.get_agent_socket_path())
+        ):
+            from .pw_agent import forward_to_agent
+            with pw_trace.phase('agent'):
+                is_forwarded, result = forward_to_agent(args, pw_config)
+            if is_forwarded:
+                return result
+
         pw = PasswordCommand(pw_config)
-        args = PasswordCommand.parse_args(args)
+        return PasswordCommand.execute(pw, args)
+
+    @staticmethod
+    def execute(pw: 'PasswordCommand', args: List[str]):
+        """Run a single command against an existing PasswordCommand.
+
+        Used by `main` and by `pw agent`, which keeps one instance alive."""
+        if PasswordCommand.is_plain_lookup(args):
+            # pw (--) <entity>: skip building the argparse parser
+            args = SimpleNamespace(**dict(DEFAULT_ARGS, entity=args[-1]))
+        else:
+            args = PasswordCommand.parse_args(args)
         setattr(pw, "args", args)
 
         # pw -d
@@ -48,6 +157,15 @@ class PasswordCommand:
             pprint(pw.get_all_sections())
             return True
 
+        # pw -bl
+        if args.list_backups:
+            pw.print_backups()
+            return True
+
+        # pw -br <backup>
+        if args.restore_backup:
+            return pw.restore_backup()
+
         # pw --all_secrets
         if args.list_keys:
             pw.print_all_keys(args.section)
@@ -93,10 +211,20 @@ class PasswordCommand:
             # "-rl <int>" will activate "-r"
             args.generate_random_pw = True
 
+        # pw -rc <count: int>
+        if args.count != 1:
+            # "-rc <int>" will activate "-r"
+            args.generate_random_pw = True
+
         # pw -r
         if args.generate_random_pw:
+            if args.count != 1:
+                # Bulk provisioning: print instead of using the clipboard
+                for random_pw in pw.get_random_pws(args.count):
+                    print(random_pw)
+                return True
             random_pw = pw.get_random_pw()
-            pyperclip.copy(random_pw)
+            copy_to_clipboard(random_pw)
             print('The random password has been copied into your clipboard.')
             print('')
             return True
@@ -117,29 +245,41 @@ class PasswordCommand:
             print('Nothing happened. No flags used. No args passed after pw command.')
             return False
 
-        secrets_data = pw.get_secrets_data()
+        keys = pw.get_keys()
 
         # pw -ks
         if args.available_keys:
-            print(f'There are {len(secrets_data.keys())} available keys for {args.entity}:')
-            print(', '.join(secrets_data.keys()))
+            print(f'There are {len(keys)} available keys for {args.entity}:')
+            print(', '.join(keys))
             return True
 
         # pw -e <entity>
         args.expressive = True # default --expressive
         if args.expressive:
-            pw.print_secrets_data_values(secrets_data)
+            pw.print_secrets_data_values(keys)
 
         # pw <entity>
         if args.entity:
-            pw = pw.get_secrets_data_value(secrets_data)
-            pyperclip.copy(pw)
+            pw = pw.get_secrets_data_value()
+            copy_to_clipboard(pw)
             print(f'Copied {args.secret_key} for "{args.entity}" into your clipboard.')
             print('')
             return
     
+    @staticmethod
+    def is_plain_lookup(args: List[str]) -> bool:
+        if args[:1] == ['--']:  # pw -- get: an entity named like a subcommand
+            return len(args) == 2
+        return (
+            len(args) == 1
+            and not args[0].startswith('-')
+            and args[0] not in SUBCOMMANDS
+        )
+
     @staticmethod
     def parse_args(args):
+        import argparse
+
         parser = argparse.ArgumentParser(description='Manage your passwords from your terminal.')
         parser.add_argument('entity', type=str, help=h.entity, nargs='?')
 
@@ -156,6 +296,11 @@ class PasswordCommand:
         parser.add_argument('-r', '--generate_random_pw', action='store_true', help=h.generate_random_pw)
         parser.add_argument('-rl', '--random_password_length', type=int, default=42)
         parser.add_argument('-rn', '--no_special_characters', action='store_false')
+        parser.add_argument('-rc', '--count', type=int, default=1, help=h.count)
+        parser.add_argument('--min_digits', type=int, default=0)
+        parser.add_argument('--min_symbols', type=int, default=0)
+        parser.add_argument('--min_lowercase', type=int, default=0)
+        parser.add_argument('--min_uppercase', type=int, default=0)
 
         parser.add_argument('-n', '--new_secrets_data', type=str, help=h.add_new_password)
         parser.add_argument('-u', '--update', type=str)
@@ -169,66 +314,61 @@ class PasswordCommand:
         parser.add_argument('-rm', '--remove_entity', type=str, help=h.remove)
         parser.add_argument('-rms', '--remove_section', type=str, help=h.remove)
 
+        parser.add_argument('-bl', '--list_backups', action='store_true', help=h.list_backups)
+        parser.add_argument('-br', '--restore_backup', type=str, help=h.restore_backup)
+
         return parser.parse_args(args)
 
     def get_all_sections(self) -> List[str]:
         """Get all sections of the secrets data file (json)."""
-        return [pw for pw in self.pw_client.pw_dict.keys()]
-        # yield from self.pw_dict.keys()
+        return self.vault.sections()
 
     def print_keys_of_section(self):
         """Output all available keys of a section to the console."""
         if self.args.section is None:
             self.args.section = 'main'
-        for key in self.pw_client.pw_dict[self.args.section].keys():
+        for key in self.vault.entities(self.args.section):
             print(key)
     
     def print_all_keys(self, section: str = None):
         if section is None:
-            for section, entities in self.pw_client.pw_dict.items():
-                for entity in entities.keys():
+            for section in self.vault.sections():
+                for entity in self.vault.entities(section):
                     print(f"({section}) {entity}")
         else:
-            if self.pw_client.pw_dict.get(section) is None:
+            if not self.vault.has_section(section):
                 print(f"Didn't find section \"{section}\"")
-            for entity in self.pw_client.pw_dict[section].keys():
+            for entity in self.vault.entities(section):
                 print(entity)
             
 
     def create_section(self):
         """Creates a new section."""
         
-        if self._check_existence_of_section(self.args.section):
+        if self.vault.has_section(self.args.section):
             return print(f'Section {self.args.section} exists already.')
 
-        self.pw_client.pw_dict[self.args.section] = {}
-        self.pw_client.save_dict_to_file()
+        self.vault.create_section(self.args.section)
         print(f'Created a new section: "{self.args.section}".')
-    
-    def _check_existence_of_section(self, section: str):
-        if section in self.pw_client.pw_dict:
-            return True
 
     def add_new_secrets_data(self):
         secrets_data = {}
 
+        if self.args.section is None:
+            self.args.section = 'main'
+
         if self.args.set_password:
             new_password = self.args.set_password
         else:
-            new_password = generate_random_password(
-                password_length=self.args.random_password_length,
-                special_characters=self.args.no_special_characters)
-        pyperclip.copy(new_password)
-        encrypted_password = self.crypto.encrypt(new_password)
-        secrets_data['password'] = encrypted_password
+            new_password = self.get_random_pw()
+        copy_to_clipboard(new_password)
+        secrets_data['password'] = new_password
 
         if self.args.username:
-            encrypted_username = self.crypto.encrypt(self.args.username)
-            secrets_data['username'] = encrypted_username
+            secrets_data['username'] = self.args.username
 
         if self.args.website:
-            encrypted_website = self.crypto.encrypt(self.args.website)
-            secrets_data['website'] = encrypted_website
+            secrets_data['website'] = self.args.website
 
         if self.args.kwargs:
             kwargs_as_list = self.args.kwargs.split(',')
@@ -239,52 +379,37 @@ class PasswordCommand:
                     print('"pw --kwargs brand=fender,guitar=strat,string_gauge=0.10"')
                     print('')
                 key, value = kwarg.split('=')
-                encrypted_value = self.crypto.encrypt(value)
-                secrets_data[key] = encrypted_value
-
-        if self.args.section is None:
-            self.args.section = 'main'
-
-        if not self._check_existence_of_section(self.args.section):
-            self.create_section()
-
-        if (
-            self.args.entity in self.pw_client.pw_dict[self.args.section]
-            and self.args.overwrite is False
-        ):
-            print('Entity is already there. Nothing happened.')
-            print('Use the -ow / --overwrite option to update existing secrets data.')
-            return False
+                secrets_data[key] = value
+
+        # The new section and the entity are written at once
+        with self.vault.transaction():
+            if not self.vault.has_section(self.args.section):
+                self.create_section()
+
+            if (
+                self.vault.has_entity(self.args.section, self.args.entity)
+                and self.args.overwrite is False
+            ):
+                print('Entity is already there. Nothing happened.')
+                print('Use the -ow / --overwrite option to update existing secrets data.')
+                return False
 
-        entity = self.args.new_secrets_data
-        new_secrets_data = {entity: secrets_data}
+            entity = self.args.new_secrets_data
 
-        print(f'Created new password for "{entity}".')
-        print('')
+            print(f'Created new password for "{entity}".')
+            print('')
 
-        self.pw_client.pw_dict[self.args.section].update(new_secrets_data)
-        self.pw_client.save_dict_to_file()
+            self.vault.add(self.args.section, entity, secrets_data)
         return True
 
     def update_secrets_data(self):
         """`pw -u <key>=<value> (-s <section>="main") <entity>`"""
-        s = self.args.update
-        split_at: int
-        for i in range(len(s)):
-            if s[i] == "=":
-                split_at = i
-                break
-        
-        k = s[:split_at]
-        v = s[(split_at + 1):]
-        
-        new_data = {k: self.crypto.encrypt(v)}
+        k, _, v = self.args.update.partition('=')
         
         if self.args.section is None:
             self.args.section = 'main'
-              
-        self.pw_client.pw_dict[self.args.section][self.args.entity].update(new_data)
-        self.pw_client.save_dict_to_file()
+
+        self.vault.set_fields(self.args.section, self.args.entity, {k: v})
         print(f"Updated value of \"{k}\" of \"{self.args.entity}\"")
     
     def update_password(self):
@@ -301,55 +426,68 @@ class PasswordCommand:
         pw aws -upw -rl 10 -rn
         (change password of "aws" with a random pw with 10 chars and without special chars)
         """
-        secrets_data = self.get_secrets_data()
-        old_pw = self.get_secrets_data_value(secrets_data)
-        print(f"old pw: {old_pw}")
+        if self.args.section is None:
+            self.args.section = 'main'
         if self.args.set_password:
             new_pw = self.args.set_password
         else:
             new_pw = self.get_random_pw()
 
-        self.args.update = f"old_password={old_pw}"
-        self.update_secrets_data()
-
-        self.args.update = f"password={new_pw}"
-        self.update_secrets_data()
+        old_pw, new_pw = self.vault.rotate_password(self.args.section, self.args.entity, new_pw)
+        print(f"old pw: {old_pw}")
 
-        pyperclip.copy(new_pw)
+        copy_to_clipboard(new_pw)
         print("Copied new pw to your clipboard.")
 
-    def get_secrets_data(self):
+    def get_keys(self) -> List[str]:
+        """The keys of the secrets data of the entity."""
         if self.args.section is None:
             self.args.section = 'main'
-        secrets_data = self.pw_client.pw_dict[self.args.section][self.args.entity]
-        return secrets_data
+        return self.vault.keys(self.args.section, self.args.entity)
 
     def remove_secrets_data(self):
         key = self.args.remove_entity
         section = self.args.section or 'main'
-        self.pw_client.pw_dict[section].pop(key)
-        self.pw_client.save_dict_to_file()
+        self.vault.delete(section, key)
         print(f'Deleted {key} from {section}')
         print('')
         return True
 
     def remove_section(self):
         section = self.args.remove_section
-        self.pw_client.pw_dict.pop(section)
-        self.pw_client.save_dict_to_file()
+        self.vault.remove_section(section)
         print(f'Removed Section: "{section}"')
         return True
 
+    def print_backups(self):
+        backups = self.vault.list_backups()
+        if not backups:
+            print('There are no backups yet.')
+        for backup in backups:
+            print(backup)
+
+    def restore_backup(self):
+        backup = self.args.restore_backup
+        try:
+            self.vault.restore_backup(backup)
+        except KeyError:
+            print(f'Didn\'t find backup "{backup}". Use -bl to list all backups.')
+            return False
+        print(f'Restored backup "{backup}".')
+        return True
+
     def find_secrets_data(self):
-        results_as_generator = find_key(self.args.find, self.pw_client.pw_dict)
-        results = {}
-        for r in results_as_generator:
-            s = r["section"]
-            e = r["entity"]
-            if s not in results:
-                results[s] = [e]
-            else:
-                results[s].append(e)
+        results = self.vault.find(self.args.find)
+
+        if not results:
+            print(f'No results found for the given search term "{self.args.find}"')
+            suggestions = self.vault.suggest(self.args.find)
+            if suggestions:
+                print('Did you mean:')
+                for section, entity in suggestions:
+                    print(f'  ({section}) {entity}')
+            print('')
+            return False
 
         if self.args.section:
             priority_section = self.args.section
@@ -364,7 +502,7 @@ class PasswordCommand:
                 ordered_keys[0], ordered_keys[i] = ordered_keys[i], ordered_keys[0]
                 break
         
-        k = priority_section
+        k = priority_section if priority_section in results else ordered_keys[0]
         for i, v in enumerate(results[k]):
             if v == self.args.entity:
                 if i == 0:
@@ -377,41 +515,35 @@ class PasswordCommand:
                 print(f"  {entity}")
         print("")
 
-        if len(results) >= 1:
-            self.args.section = k
-            self.args.entity = results[k][0]
-            return True
-        else:
-            print(f'No results found for the given search term "{self.args.find}"')
-            print('')
-            return False
+        self.args.section = k
+        self.args.entity = results[k][0]
+        return True
 
     def get_random_pw(self):
-        if self.args.entity is not None:
-            random_pw = generate_random_password(
-                password_length=self.args.random_password_length,
-                special_characters=self.args.no_special_characters)
-        else:
-            random_pw = generate_random_password(
-                password_length=self.args.random_password_length,
-                special_characters=self.args.no_special_characters)
-        return random_pw
-
-    def print_secrets_data_values(self, secrets_data):
+        return self.get_random_pws(1)[0]
+
+    def get_random_pws(self, count: int) -> List[str]:
+        return generate_random_passwords(
+            count,
+            password_length=self.args.random_password_length,
+            special_characters=self.args.no_special_characters,
+            min_digits=self.args.min_digits,
+            min_symbols=self.args.min_symbols,
+            min_lowercase=self.args.min_lowercase,
+            min_uppercase=self.args.min_uppercase)
+
+    def print_secrets_data_values(self, keys: List[str]):
         print(f'Here are the values for "{self.args.entity}":')
-        for key, value in secrets_data.items():
-            if key == 'password':
-                value = 'sensitive'
-            else:
-                value = self.crypto.decrypt(value)
+        values = self.vault.get_fields(
+            self.args.section, self.args.entity, [key for key in keys if key != 'password'])
+        for key in keys:
+            value = values.get(key, 'sensitive')
             print(f'    {key}: {value}')
         print('')
         return True
 
-    def get_secrets_data_value(self, secrets_data):
-        encrypted_secret_value = secrets_data[self.args.secret_key]
-        decrypted_secret_value = self.crypto.decrypt(encrypted_secret_value)
-        return decrypted_secret_value
+    def get_secrets_data_value(self):
+        return self.vault.get(self.args.section, self.args.entity, self.args.secret_key)
 
 
 if __name__ == "__main__":
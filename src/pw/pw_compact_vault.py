@@ -0,0 +1,152 @@
+"""Compact in-memory representation of the secrets data for large vaults.
+
+`CompactSecretsData` behaves like the nested dict section -> entity -> key ->
+encrypted value, but stores it with far fewer objects:
+
+- Fernet tokens are kept as raw (base64 decoded) bytes in one shared buffer
+- every entity is an `EntryRecord` with `__slots__` instead of a dict
+- section, entity and key names are interned, and equal tuples of keys and
+  value lengths are shared between entities
+
+Entities are decoded into a fresh dict on every access, so changes to such a
+dict are not stored; assign the changed dict instead.
+"""
+import sys
+import base64
+import binascii
+from collections.abc import MutableMapping
+
+
+class EntryRecord:
+    __slots__ = ('keys', 'start', 'lengths', 'raw_mask')
+
+    def __init__(self, keys: tuple, start: int, lengths: tuple, raw_mask: int):
+        self.keys = keys  # names of the values
+        self.start = start  # offset of the first value in the buffer
+        self.lengths = lengths  # byte length of every value
+        self.raw_mask = raw_mask  # bit i set: value i is stored as text, not decoded
+
+
+class CompactSecretsData(MutableMapping):
+    def __init__(self):
+        self.buffer = bytearray()
+        self.unused_bytes = 0  # of removed or replaced values
+        self._sections = {}
+        self._shared_tuples = {}
+
+    @classmethod
+    def from_dict(cls, pw_dict: dict) -> 'CompactSecretsData':
+        compact = cls()
+        for section, entities in pw_dict.items():
+            compact[section] = entities
+        return compact
+
+    def to_dict(self) -> dict:
+        return {section: dict(entities.items()) for section, entities in self.items()}
+
+    def __getitem__(self, section: str) -> 'CompactSection':
+        return self._sections[section]
+
+    def __setitem__(self, section: str, entities):
+        compact_section = CompactSection(self)
+        for entity, secrets_data in entities.items():
+            compact_section[entity] = secrets_data
+        old_section = self._sections.get(section)
+        self._sections[sys.intern(section)] = compact_section
+        if old_section is not None:
+            old_section.clear()
+
+    def __delitem__(self, section: str):
+        self._sections.pop(section).clear()
+
+    def setdefault(self, section: str, entities=None) -> 'CompactSection':
+        """Unlike MutableMapping.setdefault, returns the stored section."""
+        if section not in self._sections:
+            self[section] = entities or {}
+        return self._sections[section]
+
+    def __iter__(self):
+        return iter(self._sections)
+
+    def __len__(self):
+        return len(self._sections)
+
+    def _encode(self, secrets_data: dict) -> EntryRecord:
+        start = len(self.buffer)
+        lengths = []
+        raw_mask = 0
+        for i, value in enumerate(secrets_data.values()):
+            try:
+                data = base64.urlsafe_b64decode(value)
+                if base64.urlsafe_b64encode(data).decode('ascii') != value:
+                    raise ValueError()
+            except (binascii.Error, ValueError):
+                # Not a (canonical) Fernet token, keep the text as is
+                data = value.encode('utf-8')
+                raw_mask |= 1 << i
+            self.buffer += data
+            lengths.append(len(data))
+        keys = self._share(tuple(sys.intern(key) for key in secrets_data))
+        return EntryRecord(keys, start, self._share(tuple(lengths)), raw_mask)
+
+    def _decode(self, record: EntryRecord) -> dict:
+        secrets_data = {}
+        offset = record.start
+        for i, (key, length) in enumerate(zip(record.keys, record.lengths)):
+            data = bytes(self.buffer[offset:offset + length])
+            if record.raw_mask & (1 << i):
+                secrets_data[key] = data.decode('utf-8')
+            else:
+                secrets_data[key] = base64.urlsafe_b64encode(data).decode('ascii')
+            offset += length
+        return secrets_data
+
+    def _release(self, *records: EntryRecord):
+        for record in records:
+            self.unused_bytes += sum(record.lengths)
+        if self.unused_bytes > len(self.buffer) // 2:
+            self._compact_buffer()
+
+    def _compact_buffer(self):
+        """Copy all values that are still used into a new buffer."""
+        old_buffer = self.buffer
+        self.buffer = bytearray()
+        for compact_section in self._sections.values():
+            for record in compact_section._records.values():
+                length = sum(record.lengths)
+                start = len(self.buffer)
+                self.buffer += old_buffer[record.start:record.start + length]
+                record.start = start
+        self.unused_bytes = 0
+
+    def _share(self, values: tuple) -> tuple:
+        return self._shared_tuples.setdefault(values, values)
+
+
+class CompactSection(MutableMapping):
+    def __init__(self, vault: CompactSecretsData):
+        self._vault = vault
+        self._records = {}
+
+    def __getitem__(self, entity: str) -> dict:
+        return self._vault._decode(self._records[entity])
+
+    def __setitem__(self, entity: str, secrets_data: dict):
+        record = self._vault._encode(secrets_data)
+        old_record = self._records.get(entity)
+        self._records[sys.intern(entity)] = record
+        if old_record is not None:
+            self._vault._release(old_record)
+
+    def __delitem__(self, entity: str):
+        self._vault._release(self._records.pop(entity))
+
+    def clear(self):
+        records, self._records = self._records, {}
+        self._vault._release(*records.values())
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
@@ -8,6 +8,26 @@ class PWConfig:
     creds_dir: str
     creds_file_name: str
     encryption_key: str
+    # Defaults to "<creds_dir>/.pw-agent.sock"
+    agent_socket_path: str = None
+    # Seconds without requests after which the agent locks itself
+    agent_timeout: int = 15 * 60
+    # Hold the secrets data in a CompactSecretsData, for large vaults
+    compact_memory: bool = False
+    # Parse only the entities that are read (json files), see pw_lazy_json
+    lazy_load: bool = False
+    # Keep the parsed json file in "<creds file>.cache", see pw_parse_cache
+    parse_cache: bool = True
+    # Versions kept per entity for "pw history" and "pw revert", 0 to keep none
+    history_depth: int = 10
+    # RSA private key (pem) and your name in "pw share", to read shared sections
+    private_key_path: str = None
+    recipient_name: str = None
+
+    def get_agent_socket_path(self) -> str:
+        if self.agent_socket_path:
+            return self.agent_socket_path
+        return os.path.join(self.creds_dir, '.pw-agent.sock')
 
 
 def get_test_config():
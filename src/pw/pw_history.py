@@ -0,0 +1,189 @@
+"""Version history of the entities, for `pw history` and `pw revert`.
+
+Before `Vault` changes or removes an entity, it appends the encrypted
+values that the change replaces, and only those, to
+"<creds file>.history.jsonl":
+
+    {"section": "main", "entity": "aws", "at": "2026-10-18T08:40:01Z",
+     "fields": {"password": "<encrypted>", "_modified": "<encrypted>", "port": null}}
+
+null marks a key that the change added. Applying the versions of an
+entity newest first to its current secrets data yields its earlier states.
+The history is kept out of the secrets data file, so reading a secret
+never pays for it. Once the file has grown to twice its size after the
+last compaction, it is compacted to the newest `depth` versions per
+entity. The first line is a header with that size.
+"""
+import os
+import json
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from .pw_config import PWConfig
+from .pw_utils import cut_torn_line, open_atomically, open_for_appending
+
+COMPACTION_MIN_BYTES = 64 * 1024
+
+
+class Version(NamedTuple):
+    at: str  # time of the change, see pw_vault.get_timestamp
+    fields: Dict[str, Optional[str]]  # encrypted values before the change, None: added
+
+
+def history_command(args: List[str], pw_config: PWConfig):
+    """`pw history <entity> (-s <section>) (--values)`"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pw history', description=(
+        'List the earlier versions of an entity, newest first. Restore one with "pw revert".'))
+    parser.add_argument('entity', type=str)
+    parser.add_argument('-s', '--section', type=str, default='main')
+    parser.add_argument('--values', action='store_true',
+                        help='Print the values that every change replaced (passwords excluded).')
+    args = parser.parse_args(args)
+
+    from .pw_vault import METADATA_KEYS, Vault
+    vault = Vault.from_config(pw_config)
+    versions = vault.get_history(args.section, args.entity)
+    if not versions:
+        print(f'There is no history of "{args.entity}" in section "{args.section}".')
+        return False
+    print(f'History of "{args.entity}" (section {args.section}), newest first:')
+    crypto = vault.get_crypto(args.section)
+    for number, version in enumerate(versions, 1):
+        keys = [key for key in version.fields if key not in METADATA_KEYS]
+        print(f'  {number}  {version.at}  changed: {", ".join(keys) or "metadata"}')
+        if args.values:
+            for key in keys:
+                print(f'       {key}: {_format_value(crypto, key, version.fields[key])}')
+    return True
+
+
+def revert_command(args: List[str], pw_config: PWConfig):
+    """`pw revert <entity> (-s <section>) (--version <n>)`"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pw revert', description=(
+        'Restore an entity as it was before a change. The revert is a change '
+        'itself and can be reverted as well.'))
+    parser.add_argument('entity', type=str)
+    parser.add_argument('-s', '--section', type=str, default='main')
+    parser.add_argument('--version', type=int, default=1,
+                        help='Number of the version in "pw history" (default: 1, the latest).')
+    args = parser.parse_args(args)
+
+    from .pw_vault import Vault
+    vault = Vault.from_config(pw_config)
+    try:
+        vault.revert(args.section, args.entity, args.version)
+    except (KeyError, ValueError) as e:
+        print(e.args[0])
+        return False
+    print(f'Reverted "{args.entity}" to version {args.version}.')
+    return True
+
+
+class VersionHistory:
+    """Callers of the methods that write hold the write lock of the secrets data."""
+
+    def __init__(self, path: str, depth: int):
+        self.path = path
+        self.depth = depth
+
+    def append(self, section: str, entity: str, at: str, fields: Dict[str, Optional[str]]):
+        """Record the values that a change of an entity replaces."""
+        if self.depth <= 0 or not fields:
+            return
+        line = json.dumps({'section': section, 'entity': entity, 'at': at, 'fields': fields},
+                          separators=(',', ':')) + '\n'
+        with open_for_appending(self.path) as f:
+            cut_torn_line(f)
+            if not f.seek(0, os.SEEK_END):
+                f.write(_get_header(0).encode('utf-8'))
+            f.write(line.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        # An unreadable header is replaced by the compaction
+        compacted_size = self._read_header() or 0
+        if os.path.getsize(self.path) > max(COMPACTION_MIN_BYTES, 2 * compacted_size):
+            self.compact()
+
+    def get_versions(self, section: str, entity: str) -> List[Version]:
+        """The newest `depth` versions of an entity, newest first."""
+        versions = [Version(record['at'], record['fields'])
+                    for record in self._read_records()
+                    if record['entity'] == entity and record['section'] == section]
+        return versions[::-1][:self.depth]
+
+    def compact(self):
+        """Keep the newest `depth` versions of every entity."""
+        kept: Dict[tuple, List[dict]] = {}
+        for record in self._read_records():
+            versions = kept.setdefault((record['section'], record['entity']), [])
+            versions.append(record)
+            if len(versions) > self.depth:
+                del versions[0]
+        records = sorted((r for versions in kept.values() for r in versions), key=lambda r: r['at'])
+        self._write(records, None)
+
+    def rotate(self, rotate_value: Callable[[str, str], str]):
+        """Re-encrypt all values with `rotate_value(section, value)`, e.g. for
+        a new vault key."""
+        records = list(self._read_records())
+        for record in records:
+            record['fields'] = {
+                key: None if value is None else rotate_value(record['section'], value)
+                for key, value in record['fields'].items()
+            }
+        self._write(records, None)
+
+    def _read_records(self) -> Iterator[dict]:
+        try:
+            f = open(self.path)
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if not line.endswith('\n'):  # torn by a crash during `append`
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and 'fields' in record:  # not the header
+                    yield record
+
+    def _read_header(self) -> Optional[int]:
+        try:
+            with open(self.path) as f:
+                return json.loads(f.readline())['compacted_size']
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _write(self, records: List[dict], compacted_size: Optional[int]):
+        """Replace the history with `records`; `compacted_size` defaults to their size."""
+        lines = [json.dumps(record, separators=(',', ':')) + '\n' for record in records]
+        if compacted_size is None:
+            compacted_size = sum(map(len, lines))
+        with open_atomically(self.path) as f:
+            f.write(_get_header(compacted_size))
+            f.writelines(lines)
+
+
+def get_history_path(pw_client) -> str:
+    return f'{pw_client.creds_file_path}.history.jsonl'
+
+
+def _get_header(compacted_size: int) -> str:
+    return json.dumps({'compacted_size': compacted_size}) + '\n'
+
+
+def _format_value(crypto, key: str, encrypted_value: Optional[str]) -> str:
+    if encrypted_value is None:
+        return '(added by the change)'
+    if key in ('password', 'old_password'):
+        return 'sensitive'
+    from cryptography.fernet import InvalidToken
+    try:
+        return crypto.decrypt(encrypted_value)
+    except InvalidToken:
+        return '(encrypted with an earlier key)'
@@ -0,0 +1,107 @@
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+Match = Tuple[str, str]  # (section, entity)
+
+
+def get_trigrams(text: str, padded: bool = False) -> Set[str]:
+    """Trigrams of `text`. Padding adds trigrams for the start and the end of
+    the text, which makes fuzzy matching of short or misspelled names work."""
+    if padded:
+        text = f'  {text} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class EntityIndex:
+    """Inverted trigram index over the (lower cased) entity names of all sections.
+
+    Names are indexed with padded trigrams, which are a superset of the
+    unpadded trigrams that substring searches look up.
+
+    Results are always sorted by section and entity, or by score for fuzzy
+    matches, so they do not depend on the order of the secrets data file.
+    """
+
+    def __init__(self):
+        self.entities: List[Optional[Match]] = []  # position is the id
+        self.ids: Dict[Match, int] = {}
+        self.trigrams: Dict[str, Set[int]] = {}
+
+    @classmethod
+    def build(cls, pw_dict: dict) -> 'EntityIndex':
+        index = cls()
+        for section, entities in pw_dict.items():
+            for entity in entities:
+                index.add(section, entity)
+        return index
+
+    def add(self, section: str, entity: str):
+        if (section, entity) in self.ids:
+            return
+        entity_id = len(self.entities)
+        self.entities.append((section, entity))
+        self.ids[(section, entity)] = entity_id
+        for trigram in get_trigrams(entity.lower(), padded=True):
+            self.trigrams.setdefault(trigram, set()).add(entity_id)
+
+    def remove(self, section: str, entity: str):
+        entity_id = self.ids.pop((section, entity), None)
+        if entity_id is None:
+            return
+        self.entities[entity_id] = None
+        for trigram in get_trigrams(entity.lower(), padded=True):
+            postings = self.trigrams[trigram]
+            postings.discard(entity_id)
+            if not postings:
+                del self.trigrams[trigram]
+
+    def remove_section(self, section: str):
+        for match in [m for m in self.ids if m[0] == section]:
+            self.remove(*match)
+
+    def apply_record(self, record: dict):
+        """Keep the index in sync with a journal record (see pw_journal)."""
+        if record['op'] == 'batch':
+            for batched_record in record['records']:
+                self.apply_record(batched_record)
+        elif record['op'] == 'set':
+            self.add(record['section'], record['entity'])
+        elif record['op'] == 'remove':
+            self.remove(record['section'], record['entity'])
+        elif record['op'] == 'remove_section':
+            self.remove_section(record['section'])
+
+    def find(self, term: str) -> List[Match]:
+        """All entities whose name contains `term` (case insensitive)."""
+        term = term.lower()
+        return sorted(m for m in self._candidates(term) if term in m[1].lower())
+
+    def find_prefix(self, term: str) -> List[Match]:
+        """All entities whose name starts with `term` (case insensitive)."""
+        term = term.lower()
+        # Left padded trigrams only match at the start of a name
+        candidates = self._candidates(f'  {term}')
+        return sorted(m for m in candidates if m[1].lower().startswith(term))
+
+    def find_fuzzy(self, term: str, limit: int = 5) -> List[Match]:
+        """Entities ranked by the share of trigrams they have in common with `term`."""
+        query = get_trigrams(term.lower(), padded=True)
+        shared = Counter()
+        for trigram in query:
+            shared.update(self.trigrams.get(trigram, ()))
+        scored = []
+        for entity_id, n_shared in shared.items():
+            section, entity = self.entities[entity_id]
+            n_trigrams = len(get_trigrams(entity.lower(), padded=True))
+            score = n_shared / (len(query) + n_trigrams - n_shared)
+            scored.append((-score, section, entity))
+        return [(section, entity) for _, section, entity in sorted(scored)[:limit]]
+
+    def _candidates(self, term: str):
+        trigrams = get_trigrams(term)
+        if not trigrams:
+            # Too short for trigrams, fall back to all entities
+            return self.ids.keys()
+        postings = sorted((self.trigrams.get(t, set()) for t in trigrams), key=len)
+        entity_ids = set.intersection(*postings)
+        return [self.entities[i] for i in entity_ids]
@@ -0,0 +1,93 @@
+import os
+import json
+from typing import Iterator
+
+from .pw_utils import cut_torn_line, open_for_appending
+
+
+class SecretsDataJournal:
+    """Append-only log of changes to the secrets data file.
+
+    Every mutation (or transaction, see `SecretsDataClient.transaction`) is
+    written as one JSON line. On load the records are
+    replayed on top of the secrets data file. Once the journal grows past
+    its threshold, the client compacts it into the secrets data file.
+    """
+
+    def __init__(self, journal_path: str):
+        self.journal_path = journal_path
+
+    def append(self, record: dict):
+        """Append a record and make sure it reached the disk.
+
+        A torn last line is cut off first. Callers hold the write lock."""
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with open_for_appending(self.journal_path) as journal:
+            cut_torn_line(journal)
+            journal.write(line.encode('utf-8'))
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def read(self) -> Iterator[dict]:
+        """Yield all complete records of the journal.
+
+        A torn last line (e.g. after a crash during `append`) is ignored."""
+        try:
+            journal = open(self.journal_path)
+        except FileNotFoundError:
+            return
+        with journal:
+            for line in journal:
+                if not line.endswith('\n'):
+                    break
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    break
+
+    def replay(self, pw_dict: dict) -> dict:
+        """Apply all records of the journal to `pw_dict`."""
+        for record in self.read():
+            apply_record(pw_dict, record)
+        return pw_dict
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def clear(self):
+        """Remove the journal, e.g. after it has been compacted."""
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+
+def apply_record(pw_dict: dict, record: dict):
+    """Apply a single journal record to `pw_dict`.
+
+    Records are idempotent, so replaying a journal that has already been
+    compacted into the secrets data file yields the same result. A "batch"
+    record holds the records of a transaction, which are applied together."""
+    op = record['op']
+    if op == 'batch':
+        for batched_record in record['records']:
+            apply_record(pw_dict, batched_record)
+        return
+    section = record['section']
+    if op == 'create_section':
+        pw_dict.setdefault(section, {})
+    elif op == 'remove_section':
+        pw_dict.pop(section, None)
+    elif op == 'set':
+        pw_dict.setdefault(section, {})[record['entity']] = record['data']
+    elif op == 'update':
+        entities = pw_dict.setdefault(section, {})
+        # Assigned instead of updated in place, for mappings that return copies
+        entities[record['entity']] = {**entities.get(record['entity'], {}), **record['data']}
+    elif op == 'remove':
+        pw_dict.get(section, {}).pop(record['entity'], None)
+    else:
+        raise ValueError(f'Unknown journal operation: "{op}"')
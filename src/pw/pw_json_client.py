@@ -1,29 +1,83 @@
 import os
 import json
-import datetime
+from typing import List
 
+from .pw_journal import SecretsDataJournal, apply_record
+from .pw_storage import SecretsDataClient, as_dict
+from .pw_utils import write_json_atomically
 
-class SecretsDataJSONClient:
-    def __init__(self, creds_dir_path: str, creds_file_name: str):
-        self.creds_dir_path = creds_dir_path
-        self.creds_file_name = creds_file_name
-        self.creds_file_path = os.path.join(creds_dir_path, creds_file_name)
-        self.pw_dict = self.get_pws_from_json_file()
-        self.create_backup()
+
+class SecretsDataJSONClient(SecretsDataClient):
+    # The journal is compacted into the secrets data file once it is larger
+    # than this fraction of the secrets data file (but at least MIN bytes).
+    JOURNAL_COMPACTION_RATIO = 0.5
+    JOURNAL_COMPACTION_MIN_BYTES = 64 * 1024
+
+    def __init__(self, creds_dir_path: str, creds_file_name: str, compact: bool = False,
+                 lazy: bool = False, parse_cache: bool = False):
+        super().__init__(creds_dir_path, creds_file_name, compact, lazy)
+        self.journal = SecretsDataJournal(f'{self.creds_file_path}.journal')
+        self.offsets_path = f'{self.creds_file_path}.offsets.json'
+        self.parse_cache = None
+        if parse_cache:
+            from .pw_parse_cache import ParseCache
+            self.parse_cache = ParseCache(f'{self.creds_file_path}.cache',
+                                          f'{self.creds_file_path}.cache.key')
+        self.load()
 
     def get_pws_from_json_file(self):
-        """Loads json data into python to retrieve passwords that are stored as key value pairs."""
-        with open(self.creds_file_path) as pws:
-            return json.load(pws)
-
-    def create_backup(self):
-        """Create a backup of the dictionary with the passwords."""
-        now = datetime.datetime.now().isoformat()
-        pretty_now = now.split('.')[0].replace(':', '.')
-        backup_path = os.path.join(self.creds_dir_path, ".backups", pretty_now)
-        with open(f'{backup_path}', 'w') as pw_file_json:
-            json.dump(self.pw_dict, pw_file_json)
+        """Loads json data into python to retrieve passwords that are stored as key value pairs.
+
+        With the parse cache, an unchanged file is not parsed again."""
+        if self.parse_cache is not None:
+            pw_dict = self.parse_cache.load(self.creds_file_path, json.loads)
+        else:
+            with open(self.creds_file_path) as pws:
+                pw_dict = json.load(pws)
+        return self.journal.replay(pw_dict)
+
+    def _load(self):
+        if self.lazy:
+            from .pw_lazy_json import load_lazily
+            pw_dict = load_lazily(self.creds_file_path, self.offsets_path)
+            if pw_dict is not None:
+                return self.journal.replay(pw_dict)
+        return self.get_pws_from_json_file()
 
     def save_dict_to_file(self):
-        with open(self.creds_file_path, 'w') as pw_file_json:
-            json.dump(self.pw_dict, pw_file_json)
+        """Write the whole dictionary to the secrets data file and compact the journal.
+
+        The secrets data file is replaced atomically before the journal is
+        removed. If the process dies in between, replaying the (idempotent)
+        journal on the next load yields the same data."""
+        write_json_atomically(self.creds_file_path, as_dict(self.pw_dict))
+        if self.parse_cache is not None:
+            self.parse_cache.invalidate()
+        self.journal.clear()
+
+    def _write_record(self, record: dict):
+        """Apply a change in memory and append it to the journal."""
+        self._materialize()
+        apply_record(self.pw_dict, record)
+        self.journal.append(record)
+        if self._journal_needs_compaction():
+            self.save_dict_to_file()
+
+    def _materialize(self):
+        # Writes work on the fully loaded secrets data
+        if self.lazy and not isinstance(self.pw_dict, dict):
+            from .pw_lazy_json import LazySecretsData
+            if isinstance(self.pw_dict, LazySecretsData):
+                self.pw_dict = self.pw_dict.to_dict()
+
+    def _get_file_paths(self) -> List[str]:
+        return [self.creds_file_path, self.journal.journal_path]
+
+    def _journal_needs_compaction(self) -> bool:
+        try:
+            creds_file_size = os.path.getsize(self.creds_file_path)
+        except FileNotFoundError:
+            creds_file_size = 0
+        threshold = max(self.JOURNAL_COMPACTION_MIN_BYTES,
+                        creds_file_size * self.JOURNAL_COMPACTION_RATIO)
+        return self.journal.size() > threshold
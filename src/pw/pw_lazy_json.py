@@ -0,0 +1,212 @@
+"""Lazy loading of the json secrets data file, one entity at a time.
+
+The byte offsets of the secrets data of every entity are cached in a
+sidecar file "<creds file>.offsets.json" together with the fingerprint of
+the secrets data file:
+
+    {"fingerprint": [inode, mtime_ns, size],
+     "sections": {section: [[entity, ...], [start, end, start, end, ...]]}}
+
+The secrets data file is memory mapped and an entity is only parsed when it
+is read, so a lookup costs the size of the entity (and of the sidecar, whose
+flat lists parse much faster than a dict per entity), not the size of the
+vault. If the sidecar is missing or outdated, it is rebuilt by scanning the
+file once.
+"""
+import os
+import re
+import json
+import mmap
+from collections.abc import MutableMapping
+from json.decoder import scanstring
+from typing import Callable, Container, Dict, Iterable, List, Optional, Tuple
+
+from .pw_utils import write_json_atomically
+
+SectionOffsets = Tuple[List[str], List[int]]  # entities, [start, end] of every entity
+Offsets = Dict[str, SectionOffsets]
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def load_lazily(path: str, offsets_path: str) -> Optional['LazySecretsData']:
+    """The secrets data file at `path` as LazySecretsData.
+
+    Returns None if the file cannot be loaded lazily: if it is empty, or not
+    ascii (json.dumps escapes everything else by default)."""
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            return None
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    fingerprint = [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+    offsets = _read_offsets(offsets_path, fingerprint)
+    if offsets is None:
+        try:
+            offsets = scan_offsets(data[:].decode('ascii'))
+        except ValueError:  # also UnicodeDecodeError
+            data.close()
+            return None
+        write_json_atomically(offsets_path, {'fingerprint': fingerprint, 'sections': offsets})
+    return LazySecretsData(data, offsets)
+
+
+def scan_offsets(text: str) -> Offsets:
+    """Find the offsets of the secrets data of every entity in `text`.
+
+    Only the secrets data of the entities is parsed, with the C decoder of
+    the json module. Raises ValueError if `text` is not a secrets data file."""
+    decode = json.JSONDecoder().raw_decode
+    sections: Offsets = {}
+
+    def scan_section(section: str, start: int) -> int:
+        entities, offsets = sections[section] = ([], [])
+
+        def scan_entity(entity: str, start: int) -> int:
+            _, end = decode(text, start)
+            entities.append(entity)
+            offsets.extend((start, end))
+            return end
+
+        return _scan_object(text, start, scan_entity)
+
+    end = _scan_object(text, 0, scan_section)
+    if _skip(text, end) != len(text):
+        raise ValueError('Extra data after the secrets data.')
+    return sections
+
+
+class LazySecretsData(MutableMapping):
+    """section -> entity -> secrets data, parsed entity by entity from the mapped file.
+
+    Changes, e.g. from replaying the journal, are kept in memory on top of
+    the file. The file stays mapped until this object is garbage collected."""
+
+    def __init__(self, data: mmap.mmap, offsets: Offsets):
+        self._data = data
+        self._offsets = offsets
+        self._sections = {}  # sections that were read or changed
+        self._removed = set()
+
+    def __getitem__(self, section: str) -> MutableMapping:
+        if section in self._sections:
+            return self._sections[section]
+        if section in self._removed or section not in self._offsets:
+            raise KeyError(section)
+        entities = self._sections[section] = LazySection(self._data, self._offsets[section])
+        return entities
+
+    def __setitem__(self, section: str, entities: MutableMapping):
+        self._sections[section] = entities
+        self._removed.discard(section)
+
+    def __delitem__(self, section: str):
+        self[section]  # raises KeyError if it does not exist
+        del self._sections[section]
+        self._removed.add(section)
+
+    def __iter__(self):
+        yield from _iter_keys(self._offsets, self._offsets, self._sections, self._removed)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> dict:
+        return {section: dict(entities.items()) for section, entities in self.items()}
+
+
+class LazySection(MutableMapping):
+    """entity -> secrets data of one section. Every read parses a new dict."""
+
+    def __init__(self, data: mmap.mmap, offsets: SectionOffsets):
+        self._data = data
+        self._entities, self._offsets = offsets
+        self._positions = None  # entity -> position in self._entities, built on first use
+        self._changed = {}
+        self._removed = set()
+
+    def __getitem__(self, entity: str) -> dict:
+        if entity in self._changed:
+            return self._changed[entity]
+        if entity in self._removed or entity not in self._get_positions():
+            raise KeyError(entity)
+        position = 2 * self._positions[entity]
+        return json.loads(self._data[self._offsets[position]:self._offsets[position + 1]])
+
+    def __setitem__(self, entity: str, secrets_data: dict):
+        self._changed[entity] = secrets_data
+        self._removed.discard(entity)
+
+    def __delitem__(self, entity: str):
+        self[entity]  # raises KeyError if it does not exist
+        self._changed.pop(entity, None)
+        self._removed.add(entity)
+
+    def __contains__(self, entity) -> bool:
+        if entity in self._changed:
+            return True
+        return entity in self._get_positions() and entity not in self._removed
+
+    def __iter__(self):
+        yield from _iter_keys(self._entities, self._get_positions(), self._changed, self._removed)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def _get_positions(self) -> Dict[str, int]:
+        if self._positions is None:
+            self._positions = {entity: i for i, entity in enumerate(self._entities)}
+        return self._positions
+
+
+def _iter_keys(keys: Iterable[str], known: Container[str], changed: dict, removed: set):
+    """`keys` of the file in their order, then the added keys."""
+    for key in keys:
+        if key not in removed:
+            yield key
+    for key in changed:
+        if key not in known:
+            yield key
+
+
+def _read_offsets(offsets_path: str, fingerprint: list) -> Optional[Offsets]:
+    try:
+        with open(offsets_path) as f:
+            offsets = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if offsets.get('fingerprint') != fingerprint:
+        return None
+    return offsets['sections']
+
+
+def _scan_object(text: str, position: int, scan_value: Callable[[str, int], int]) -> int:
+    """Scan the json object at `position`.
+
+    `scan_value(key, start)` is called for every member and returns the end
+    of its value. Returns the end of the object."""
+    position = _skip(text, position)
+    if text[position:position + 1] != '{':
+        raise ValueError(f'Expected an object at {position}.')
+    position = _skip(text, position + 1)
+    if text[position:position + 1] == '}':
+        return position + 1
+    while True:
+        if text[position:position + 1] != '"':
+            raise ValueError(f'Expected a key at {position}.')
+        key, position = scanstring(text, position + 1)
+        position = _skip(text, position)
+        if text[position:position + 1] != ':':
+            raise ValueError(f'Expected ":" at {position}.')
+        position = _skip(text, scan_value(key, _skip(text, position + 1)))
+        delimiter = text[position:position + 1]
+        if delimiter == '}':
+            return position + 1
+        if delimiter != ',':
+            raise ValueError(f'Expected "," or "}}" at {position}.')
+        position = _skip(text, position + 1)
+
+
+def _skip(text: str, position: int) -> int:
+    return WHITESPACE.match(text, position).end()
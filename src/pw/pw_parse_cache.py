@@ -0,0 +1,136 @@
+"""Cache of the parsed json secrets data file, so an unchanged file is not parsed again.
+
+"<creds file>.cache" holds the parsed file serialized with marshal, which
+loads about twice as fast as json:
+
+    magic "PWC2" | HMAC-SHA256 of the rest | header | payload
+
+The header is a fixed size struct with the (inode, mtime, size) of the
+parsed file and the sha256 of its content. The HMAC key is a random key in
+"<creds file>.cache.key" that only the owner can read. The HMAC is checked
+before anything else is decoded, so corrupt or foreign cache files are
+never loaded, nor handed to marshal.
+
+A cache whose (inode, mtime, size) matches the file is used without reading
+the file. Like git does for its index, that stat is only stored if the file
+was older than RACY_SECONDS when the cache was written, since a file that
+is changed twice within the resolution of its mtime keeps its stat.
+Otherwise, and whenever the stat differs, the content is hashed instead: a
+file that was touched or copied without changes still skips parsing.
+"""
+import os
+import hmac
+import time
+import struct
+import marshal
+import hashlib
+from typing import Callable, Optional, Tuple
+
+from .pw_utils import open_atomically
+
+MAGIC = b'PWC2'
+# Whether the stat is stored, inode, mtime in ns, size, sha256 of the content
+HEADER = struct.Struct('>?QqQ32s')
+DIGEST_SIZE = 32
+RACY_SECONDS = 2
+
+
+class ParseCache:
+    def __init__(self, path: str, key_path: str):
+        self.path = path
+        self.key_path = key_path
+        self._key = None
+
+    def load(self, source_path: str, parse: Callable[[bytes], dict]) -> dict:
+        """The parsed file at `source_path`: from the cache, or `parse(content)`,
+        which is cached then."""
+        cached = self._read()
+        with open(source_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if cached is not None and cached[0] == _get_stat_key(stat):
+                pw_dict = _unpack(cached[2])
+                if pw_dict is not None:
+                    return pw_dict
+            content = f.read()
+
+        content_hash = hashlib.sha256(content).digest()
+        if cached is not None and cached[1] == content_hash:
+            pw_dict = _unpack(cached[2])
+            if pw_dict is not None:
+                if not _is_racy(stat):  # store the stat, to skip hashing next time
+                    self._write(stat, content_hash, pw_dict)
+                return pw_dict
+        pw_dict = parse(content)
+        self._write(stat, content_hash, pw_dict)
+        return pw_dict
+
+    def invalidate(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _read(self) -> Optional[Tuple[Optional[tuple], bytes, bytes]]:
+        """(stat key, content hash, payload) of the cache file, or None if
+        it is missing or its HMAC is not valid."""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if not data.startswith(MAGIC):
+            return None
+        start = len(MAGIC) + DIGEST_SIZE
+        digest, signed = data[len(MAGIC):start], data[start:]
+        if len(signed) < HEADER.size or not hmac.compare_digest(digest, self._sign(signed)):
+            return None
+        has_stat, ino, mtime_ns, size, content_hash = HEADER.unpack_from(signed)
+        stat_key = (ino, mtime_ns, size) if has_stat else None
+        return stat_key, content_hash, signed[HEADER.size:]
+
+    def _write(self, stat: os.stat_result, content_hash: bytes, pw_dict: dict):
+        if _is_racy(stat):
+            header = HEADER.pack(False, 0, 0, 0, content_hash)
+        else:
+            header = HEADER.pack(True, *_get_stat_key(stat), content_hash)
+        data = header + marshal.dumps(pw_dict)
+        try:
+            # A torn cache fails its HMAC, so there is no need to fsync
+            with open_atomically(self.path, 'wb', sync=False) as f:
+                f.write(MAGIC + self._sign(data) + data)
+        except OSError:
+            pass  # e.g. a read only directory: go without the cache
+
+    def _sign(self, data: bytes) -> bytes:
+        return hmac.new(self._get_key(), data, hashlib.sha256).digest()
+
+    def _get_key(self) -> bytes:
+        if self._key is None:
+            try:
+                fd = os.open(self.key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                with open(self.key_path, 'rb') as f:
+                    self._key = f.read()
+            else:
+                self._key = os.urandom(DIGEST_SIZE)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(self._key)
+        return self._key
+
+
+def _get_stat_key(stat: os.stat_result) -> tuple:
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _unpack(payload: bytes) -> Optional[dict]:
+    """The parsed file in an authenticated payload, or None."""
+    try:
+        pw_dict = marshal.loads(payload)
+    except (EOFError, ValueError, TypeError):
+        return None
+    return pw_dict if isinstance(pw_dict, dict) else None
+
+
+def _is_racy(stat: os.stat_result) -> bool:
+    """Whether the file could still change without changing its stat."""
+    return time.time_ns() - stat.st_mtime_ns < RACY_SECONDS * 10**9
@@ -0,0 +1,178 @@
+"""`pw rotate-key`: re-encrypt every value of the vault with a new key.
+
+The entities of every section are split into chunks that are rotated in a
+process pool with `MultiFernet.rotate`. Every finished chunk is appended to
+a checkpoint file, so an interrupted rotation resumes where it stopped when
+it is started again with the same new key. Sections shared with `pw share`
+are encrypted with their own data keys and are left as they are. The
+version history (see pw_history) is rotated along with the vault.
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+from typing import Dict, Iterator, List, Tuple
+
+from .pw_config import PWConfig
+
+Chunk = Tuple[str, str, List[Tuple[str, dict]]]  # (chunk id, section, entities)
+
+
+def rotate_key_command(args: List[str], pw_config: PWConfig):
+    """`pw rotate-key (--new_key <key>) (--workers <n>) (--chunk_size <n>)`"""
+    parser = argparse.ArgumentParser(prog='pw rotate-key', description=(
+        'Re-encrypt all secrets with a new key. Pass the same --new_key again '
+        'to resume an interrupted rotation.'))
+    parser.add_argument('--new_key', type=str, help='Defaults to a newly generated key.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Size of the process pool, 0 to rotate in this process.')
+    parser.add_argument('--chunk_size', type=int, default=500,
+                        help='Number of entities per chunk.')
+    args = parser.parse_args(args)
+
+    from cryptography.fernet import Fernet
+    from .pw_storage import get_secrets_data_client
+
+    new_key = args.new_key.encode() if args.new_key else Fernet.generate_key()
+    print(f'New encryption key: {new_key.decode()}')
+    print('Keep it safe: it is needed to resume an interrupted rotation.')
+
+    pw_client = get_secrets_data_client(pw_config)
+    rotation = KeyRotation(pw_client, _to_bytes(pw_config.encryption_key), new_key)
+    n_values, seconds = rotation.run(args.workers, args.chunk_size)
+
+    print(f'Rotated {n_values} values in {seconds:.2f}s '
+          f'({n_values / max(seconds, 1e-9):.0f} values/s).')
+    print('Set encryption_key in your config to the new key.')
+    return True
+
+
+class KeyRotation:
+    def __init__(self, pw_client, old_key: bytes, new_key: bytes):
+        self.pw_client = pw_client
+        self.old_key = old_key
+        self.new_key = new_key
+        self.checkpoint_path = f'{pw_client.creds_file_path}.rotate.jsonl'
+        from .pw_share import SectionKeyring, get_keyring_path
+        self.shared_sections = set(SectionKeyring(get_keyring_path(pw_client)).get_shared_sections())
+
+    def run(self, workers: int, chunk_size: int) -> Tuple[int, float]:
+        """Rotate all values and write the vault. Returns (values, seconds)."""
+        started_at = time.perf_counter()
+        chunks = list(self._get_chunks(chunk_size))
+        done = self._load_checkpoint()
+        todo = [chunk for chunk in chunks if chunk[0] not in done]
+        if done:
+            print(f'Resuming: {len(done)} of {len(chunks)} chunks are rotated already.')
+
+        n_values = 0
+        with open(self.checkpoint_path, 'a') as checkpoint:
+            if not done:
+                self._write_line(checkpoint, self._get_checkpoint_header())
+            for chunk_id, rotated, n_rotated in self._rotate_chunks(todo, workers):
+                self._write_line(checkpoint, {'chunk': chunk_id, 'entities': rotated})
+                done[chunk_id] = rotated
+                n_values += n_rotated
+
+        rotated_dict = {
+            section: dict(entities) if section in self.shared_sections else {}
+            for section, entities in self.pw_client.pw_dict.items()
+        }
+        for chunk_id, section, _ in chunks:
+            rotated_dict[section].update(done[chunk_id])
+        header = self._get_checkpoint_header()
+        with self.pw_client.write_lock():
+            if self._get_checkpoint_header() != header:
+                raise RuntimeError('The secrets data was changed by another process during '
+                                   'the rotation. Run "pw rotate-key" again.')
+            self.pw_client.create_backup()
+            self.pw_client.pw_dict = rotated_dict
+            self.pw_client.save_dict_to_file()
+            self._rotate_history()
+        os.remove(self.checkpoint_path)
+        return n_values, time.perf_counter() - started_at
+
+    def _rotate_history(self):
+        from cryptography.fernet import Fernet, MultiFernet
+        from .pw_history import VersionHistory, get_history_path
+
+        history = VersionHistory(get_history_path(self.pw_client), depth=0)  # only rotated
+        if not os.path.exists(history.path):
+            return
+        multi_fernet = MultiFernet([Fernet(self.new_key), Fernet(self.old_key)])
+
+        def rotate_value(section: str, value: str) -> str:
+            if section in self.shared_sections:
+                return value
+            return multi_fernet.rotate(value.encode('utf-8')).decode('utf-8')
+
+        history.rotate(rotate_value)
+
+    def _rotate_chunks(self, chunks: List[Chunk], workers: int) -> Iterator[tuple]:
+        if not workers:
+            for chunk in chunks:
+                yield _rotate_chunk(self.old_key, self.new_key, chunk)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_rotate_chunk, self.old_key, self.new_key, chunk)
+                       for chunk in chunks]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _get_chunks(self, chunk_size: int) -> Iterator[Chunk]:
+        for section, entities in self.pw_client.pw_dict.items():
+            if section in self.shared_sections:
+                continue
+            items = list(entities.items())
+            for i in range(0, len(items), chunk_size):
+                yield f'{section}:{i}', section, items[i:i + chunk_size]
+
+    def _get_checkpoint_header(self) -> dict:
+        return {
+            'new_key_id': hashlib.sha256(self.new_key).hexdigest(),
+            'fingerprint': self.pw_client.get_fingerprint(),
+        }
+
+    def _load_checkpoint(self) -> Dict[str, dict]:
+        """Chunks rotated by an earlier, interrupted run with the same key and data."""
+        try:
+            with open(self.checkpoint_path) as f:
+                lines = [json.loads(line) for line in f if line.endswith('\n')]
+        except FileNotFoundError:
+            return {}
+        header = json.loads(json.dumps(self._get_checkpoint_header()))
+        if not lines or lines[0] != header:
+            os.remove(self.checkpoint_path)  # different key or changed data
+            return {}
+        return {line['chunk']: line['entities'] for line in lines[1:]}
+
+    @staticmethod
+    def _write_line(f, data: dict):
+        f.write(json.dumps(data) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _rotate_chunk(old_key: bytes, new_key: bytes, chunk: Chunk) -> Tuple[str, dict, int]:
+    from cryptography.fernet import Fernet, MultiFernet
+
+    # The new key comes first: MultiFernet encrypts with the first key and
+    # decrypts with any of them, so values that are rotated already pass too.
+    multi_fernet = MultiFernet([Fernet(new_key), Fernet(old_key)])
+    chunk_id, _, entities = chunk
+    rotated = {}
+    n_values = 0
+    for entity, secrets_data in entities:
+        rotated[entity] = {
+            key: multi_fernet.rotate(value.encode('utf-8')).decode('utf-8')
+            for key, value in secrets_data.items()
+        }
+        n_values += len(secrets_data)
+    return chunk_id, rotated, n_values
+
+
+def _to_bytes(key) -> bytes:
+    return key.encode() if isinstance(key, str) else key
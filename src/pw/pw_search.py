@@ -0,0 +1,231 @@
+"""`pw search`: find entities by the values of their fields, without decrypting them.
+
+The values of the fields other than the passwords (username, website and
+the keys added with -kwargs) are indexed as keyed hashes (HMAC-SHA256, a
+"blind index") of their normalized form in "<creds file>.search.json":
+
+    {
+        "key_id": "<identifies the key of the tokens>",
+        "entities": {section: {entity: {key: [crc32 of the encrypted value, [token, ...]]}}}
+    }
+
+A search hashes the search term the same way and looks up the tokens, so
+it decrypts nothing. The file reveals which entities share a value, but
+not the values. Websites are indexed with their domain suffixes as well,
+so "website=*.aws.com" finds every subdomain of aws.com.
+
+Changes do not write the index, which would rewrite a file the size of
+the vault on every change. They are noticed by the crc32 of the encrypted
+values, which changes with every encryption: the values of the changed
+fields are decrypted and indexed again on the next search. A `Vault` that
+has loaded the index applies its own changes to it instead.
+"""
+import hmac
+import zlib
+import hashlib
+import unicodedata
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .pw_config import PWConfig
+from .pw_utils import write_json_atomically
+from .pw_vault import METADATA_KEYS, Vault
+
+Match = Tuple[str, str]  # (section, entity)
+
+# Keys that are never indexed
+SENSITIVE_KEYS = ('password', 'old_password')
+UNINDEXED_KEYS = SENSITIVE_KEYS + METADATA_KEYS
+WEBSITE_KEY = 'website'
+# Prefix of the tokens of the domain suffixes of websites
+SUFFIX_PREFIX = '*.'
+
+
+def search_command(args: List[str], pw_config: PWConfig):
+    """`pw search (<key>=)<value> ... (-s <section>)`"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pw search', description=(
+        'Find entities by their username, website or other keys, e.g. '
+        '"pw search username=kuda website=*.aws.com". A term without a key '
+        'matches any key. Several terms must all match.'))
+    parser.add_argument('terms', type=str, nargs='+')
+    parser.add_argument('-s', '--section', type=str)
+    args = parser.parse_args(args)
+
+    vault = Vault.from_config(pw_config)
+    results = None
+    for term in args.terms:
+        key, _, value = term.rpartition('=')
+        matches = set(vault.search(value, key or None))
+        results = matches if results is None else results & matches
+    results = sorted(m for m in results if args.section in (None, m[0]))
+
+    if not results:
+        print(f'No entities found for {" ".join(args.terms)}.')
+        return False
+    by_section: Dict[str, List[str]] = {}
+    for section, entity in results:
+        by_section.setdefault(section, []).append(entity)
+    for section, entities in by_section.items():
+        print(f'section {section}:')
+        for entity in entities:
+            print(f'  {entity}')
+    return True
+
+
+def normalize(value: str) -> str:
+    return unicodedata.normalize('NFKC', value).strip().casefold()
+
+
+def get_domain_suffixes(website: str) -> List[str]:
+    """The host of `website` and its parent domains with at least two labels.
+
+    "https://console.aws.amazon.com/s3" -> console.aws.amazon.com, aws.amazon.com, amazon.com"""
+    host = normalize(website)
+    host = host.split('://', 1)[-1].split('/', 1)[0].rpartition('@')[2]
+    host = host.split(':', 1)[0].strip('.')
+    labels = host.split('.')
+    return ['.'.join(labels[i:]) for i in range(max(len(labels) - 1, 1))]
+
+
+class BlindIndex:
+    def __init__(self, path: str, secret: bytes):
+        self.path = path
+        # The tokens must not be the hashes of the vault key itself
+        self._key = hmac.new(secret, b'pw blind index', hashlib.sha256).digest()
+        self.key_id = hmac.new(self._key, b'key id', hashlib.sha256).hexdigest()[:16]
+        self.entities: Dict[str, Dict[str, Dict[str, list]]] = {}
+        self._postings: Optional[Dict[str, Set[Match]]] = None  # token -> matches, built on first search
+
+    @classmethod
+    def load(cls, path: str, secret: bytes) -> Optional['BlindIndex']:
+        """The saved index, or None if there is none (for the same key)."""
+        import json
+
+        index = cls(path, secret)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if data.get('key_id') != index.key_id:
+            return None
+        index.entities = data['entities']
+        return index
+
+    def save(self):
+        write_json_atomically(self.path, {'key_id': self.key_id, 'entities': self.entities})
+
+    def get_tokens(self, key: str, value: str) -> List[str]:
+        terms = [value]
+        if key == WEBSITE_KEY:
+            suffixes = get_domain_suffixes(value)
+            terms = suffixes[:1] + [SUFFIX_PREFIX + suffix for suffix in suffixes[1:]]
+        return [self._hash(key, term) for term in terms]
+
+    def get_query_tokens(self, key: str, value: str) -> List[str]:
+        """Tokens of which a match must have any.
+
+        For websites, "aws.com" matches aws.com and its subdomains,
+        "*.aws.com" only the subdomains."""
+        if key != WEBSITE_KEY:
+            return [self._hash(key, value)]
+        if value.startswith(SUFFIX_PREFIX):
+            return [self._hash(key, SUFFIX_PREFIX + get_domain_suffixes(value[2:])[0])]
+        host = get_domain_suffixes(value)[0]
+        return [self._hash(key, host), self._hash(key, SUFFIX_PREFIX + host)]
+
+    def set_fields(self, section: str, entity: str, fields: Dict[str, str],
+                   encrypted_fields: Dict[str, str], replace: bool = False):
+        """Index the `fields` of an entity; with `replace`, instead of its other fields."""
+        entry = self.entities.setdefault(section, {}).get(entity)
+        if entry is None or replace:
+            entry = self.entities[section][entity] = {}
+        for key, value in fields.items():
+            if key in UNINDEXED_KEYS:
+                continue
+            entry[key] = [get_crc(encrypted_fields[key]), self.get_tokens(key, value)]
+        self._postings = None
+
+    def remove(self, section: str, entity: str):
+        self.entities.get(section, {}).pop(entity, None)
+        self._postings = None
+
+    def remove_section(self, section: str):
+        self.entities.pop(section, None)
+        self._postings = None
+
+    def refresh(self, pw_dict, decrypt_fields: Callable[[str, Dict[str, Dict[str, str]]], dict]) -> bool:
+        """Index the fields that changed since they were indexed and drop the
+        entities that were removed. Returns whether anything changed.
+
+        `decrypt_fields(section, {entity: {key: encrypted value}})` returns
+        {entity: {key: value}}, or raises PermissionError (shared sections
+        that cannot be read are not indexed)."""
+        has_changed = False
+        for section in list(self.entities):
+            if section not in pw_dict:
+                del self.entities[section]
+                has_changed = True
+        for section, entities in pw_dict.items():
+            indexed = self.entities.get(section, {})
+            outdated = {}
+            for entity, secrets_data in entities.items():
+                entry = indexed.get(entity)
+                fields = {key: value for key, value in secrets_data.items()
+                          if key not in UNINDEXED_KEYS}
+                if entry is None or entry.keys() != fields.keys() or any(
+                        entry[key][0] != get_crc(value) for key, value in fields.items()):
+                    outdated[entity] = fields
+            removed = [entity for entity in indexed if entity not in entities]
+            for entity in removed:
+                del indexed[entity]
+            has_changed = has_changed or bool(removed)
+            if not outdated:
+                continue
+            try:
+                decrypted = decrypt_fields(section, outdated)
+            except PermissionError:
+                continue
+            for entity, fields in decrypted.items():
+                self.set_fields(section, entity, fields, outdated[entity], replace=True)
+            has_changed = True
+        if has_changed:
+            self._postings = None
+        return has_changed
+
+    def search(self, value: str, key: str = None) -> List[Match]:
+        """Entities with a `key` (default: any key) of the (normalized) `value`."""
+        postings = self._get_postings()
+        keys = [key] if key else self._get_keys()
+        matches = set()
+        for key in keys:
+            for token in self.get_query_tokens(key, value):
+                matches.update(postings.get(token, ()))
+        return sorted(matches)
+
+    def _get_postings(self) -> Dict[str, Set[Match]]:
+        if self._postings is None:
+            self._postings = {}
+            for section, entities in self.entities.items():
+                for entity, entry in entities.items():
+                    for _, tokens in entry.values():
+                        for token in tokens:
+                            self._postings.setdefault(token, set()).add((section, entity))
+        return self._postings
+
+    def _get_keys(self) -> Set[str]:
+        return {key for entities in self.entities.values()
+                for entry in entities.values() for key in entry}
+
+    def _hash(self, key: str, term: str) -> str:
+        message = f'{key}\0{normalize(term)}'.encode('utf-8')
+        return hmac.new(self._key, message, hashlib.sha256).hexdigest()[:32]
+
+
+def get_crc(encrypted_value: str) -> int:
+    return zlib.crc32(encrypted_value.encode('utf-8'))
+
+
+def get_search_index_path(pw_client) -> str:
+    return f'{pw_client.creds_file_path}.search.json'
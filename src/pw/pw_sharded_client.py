@@ -0,0 +1,186 @@
+"""Sharded storage format: a directory with one json file per section.
+
+    <creds_file_name>/
+        manifest.json                 {"generation": 7, "sections": {section: file name}}
+        main.7.json                   {entity: secrets data} of the section "main"
+        test.3.json
+
+A section is only read when it is first used, so listing the sections only
+reads the manifest. A change rewrites the files of the sections it touches
+under a new name and then replaces the manifest, which makes the change
+atomic, also across sections. Files that are no longer listed are removed
+afterwards, which is all removing a section takes.
+
+Point creds_file_name to the directory to use it; `pw convert` migrates
+between this and the other formats.
+"""
+import os
+import json
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+from .pw_journal import apply_record
+from .pw_storage import SecretsDataClient
+from .pw_utils import write_json_atomically
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class SecretsDataShardedClient(SecretsDataClient):
+    """Rewrites only the sections that a change touches."""
+
+    def __init__(self, creds_dir_path: str, creds_file_name: str, compact: bool = False,
+                 lazy: bool = False, parse_cache: bool = False):
+        # Sections are loaded lazily and small: the options do not apply
+        super().__init__(creds_dir_path, creds_file_name, compact, lazy)
+        self.manifest_path = os.path.join(self.creds_file_path, MANIFEST_NAME)
+        self.load()
+
+    def _load(self):
+        return ShardedSecretsData.open(self.creds_file_path)
+
+    def save_dict_to_file(self):
+        """Write the sections that were read or changed (the others cannot
+        have changed) and the manifest."""
+        if not isinstance(self.pw_dict, ShardedSecretsData):
+            # e.g. a restored backup
+            self.pw_dict = ShardedSecretsData.open(self.creds_file_path).replace(self.pw_dict)
+        self.pw_dict.save()
+
+    def _write_record(self, record: dict):
+        apply_record(self.pw_dict, record)
+        self.pw_dict.save(_get_sections(record))
+
+    def _get_file_paths(self) -> List[str]:
+        # Every change replaces the manifest
+        return [self.manifest_path]
+
+    def _get_section_files(self) -> Optional[Dict[str, str]]:
+        # Shards are written under a new name for every change
+        if isinstance(self.pw_dict, ShardedSecretsData):
+            return self.pw_dict.get_written_files()
+        return None
+
+
+class ShardedSecretsData(MutableMapping):
+    """section -> entity -> secrets data, read section by section from the shards.
+
+    Read sections are plain dicts; changes to them are written by `save`."""
+
+    def __init__(self, dir_path: str, manifest: dict):
+        self.dir_path = dir_path
+        self.generation = manifest['generation']
+        self._files: Dict[str, Optional[str]] = dict(manifest['sections'])  # None: not written yet
+        self._written = dict(manifest['sections'])  # the sections of the manifest on disk
+        self._sections: Dict[str, dict] = {}
+
+    @classmethod
+    def open(cls, dir_path: str) -> 'ShardedSecretsData':
+        """Open the sharded secrets data in `dir_path`, creating it if needed."""
+        return cls(dir_path, _read_manifest(dir_path))
+
+    def __getitem__(self, section: str) -> dict:
+        if section not in self._sections:
+            if section not in self._files:
+                raise KeyError(section)
+            self._sections[section] = self._read_section(section)
+        return self._sections[section]
+
+    def __setitem__(self, section: str, entities: dict):
+        self._sections[section] = entities
+        self._files.setdefault(section, None)
+
+    def __delitem__(self, section: str):
+        del self._files[section]
+        self._sections.pop(section, None)
+
+    def __contains__(self, section) -> bool:
+        return section in self._files
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
+
+    def replace(self, pw_dict) -> 'ShardedSecretsData':
+        """Replace all sections with those of `pw_dict`, to be written by `save`."""
+        self._files = {section: self._files.get(section) for section in pw_dict}
+        self._sections = {section: dict(entities.items()) for section, entities in pw_dict.items()}
+        return self
+
+    def get_written_files(self) -> Dict[str, str]:
+        """section -> path of its file, for the sections of the manifest on disk."""
+        return {section: os.path.join(self.dir_path, file_name)
+                for section, file_name in self._written.items()
+                if self._files.get(section) == file_name}
+
+    def save(self, sections: Iterable[str] = None):
+        """Write the `sections` (default: those that were read or changed), then
+        the manifest, then remove the files that are not listed anymore."""
+        sections = set(self._sections if sections is None else sections)
+        generation = self.generation + 1
+        files = {}
+        used_names = set()
+        for section, file_name in self._files.items():
+            if section in sections or file_name is None:
+                file_name = _get_file_name(section, generation, used_names)
+                write_json_atomically(os.path.join(self.dir_path, file_name), self[section])
+            files[section] = file_name
+            used_names.add(file_name.lower())
+
+        write_json_atomically(os.path.join(self.dir_path, MANIFEST_NAME),
+                              {'generation': generation, 'sections': files})
+        for file_name in set(self._written.values()) - set(files.values()):
+            try:
+                os.remove(os.path.join(self.dir_path, file_name))
+            except FileNotFoundError:
+                pass
+        self.generation = generation
+        self._files = files
+        self._written = dict(files)
+
+    def _read_section(self, section: str) -> dict:
+        try:
+            with open(os.path.join(self.dir_path, self._files[section])) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Replaced by another process since the manifest was read
+            manifest = _read_manifest(self.dir_path)
+            if manifest['sections'].get(section) in (None, self._files[section]):
+                raise
+            self._files[section] = self._written[section] = manifest['sections'][section]
+            return self._read_section(section)
+
+
+def write_sharded_file(dir_path: str, pw_dict):
+    """Write `pw_dict` to the directory `dir_path`, replacing its sections."""
+    ShardedSecretsData.open(dir_path).replace(pw_dict).save()
+
+
+def _read_manifest(dir_path: str) -> dict:
+    try:
+        with open(os.path.join(dir_path, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        os.makedirs(dir_path, exist_ok=True)
+        return {'generation': 0, 'sections': {}}
+
+
+def _get_file_name(section: str, generation: int, used_names: set) -> str:
+    """A file name for the section that is unique, also on case insensitive file systems."""
+    name = quote(section, safe='')
+    file_name = f'{name}.{generation}.json'
+    n = 1
+    while file_name.lower() in used_names:
+        n += 1
+        file_name = f'{name}~{n}.{generation}.json'
+    return file_name
+
+
+def _get_sections(record: dict) -> set:
+    """The sections that a journal record changes."""
+    if record['op'] == 'batch':
+        return set().union(*(_get_sections(r) for r in record['records']))
+    return {record['section']}
@@ -0,0 +1,297 @@
+"""`pw share`: share sections of the vault with other people.
+
+Every shared section has its own data key (a Fernet key) that encrypts the
+values of the section. The data key is stored once per recipient, encrypted
+with the recipient's RSA public key, in "<creds file>.recipients.json":
+
+    {
+        "public_keys": {"<name>": "<pem>"},
+        "sections": {"<section>": {"<name>": "<base64 encrypted data key>"}},
+        "pending": {"<section>": {"<name>": "<base64 encrypted data key>"}}
+    }
+
+Adding a recipient only encrypts the data key for them. Removing one
+replaces the data key and re-encrypts the values of the section, since the
+removed recipient may have kept the old one. The new key is saved under
+"pending" first and replaces the old one once the values are written: if
+that is interrupted, both keys decrypt the section until the command is run
+again. Reading a shared section costs a single RSA decryption per process: the private key
+and the decrypted data keys are cached.
+"""
+import os
+import base64
+from typing import Dict, List
+
+from .pw_config import PWConfig
+from .pw_utils import write_json_atomically
+
+
+def share_command(args: List[str], pw_config: PWConfig):
+    """`pw share (<section>) (--to <name> ...) (--revoke <name> ...) (--add_key <name> <pem>) (--generate_key <path>)`"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pw share', description=(
+        'Share sections with other people. Without options, lists the recipients of a section.'))
+    parser.add_argument('section', type=str, nargs='?')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--to', type=str, nargs='+', metavar='NAME',
+                       help='Share the section with these recipients.')
+    group.add_argument('--revoke', type=str, nargs='+', metavar='NAME', help=(
+        'Remove these recipients. The section gets a new data key and its values are '
+        're-encrypted. They keep what they have seen already: change those secrets too.'))
+    group.add_argument('--add_key', type=str, nargs=2, metavar=('NAME', 'PEM_FILE'),
+                       help='Register the public key of a recipient.')
+    group.add_argument('--generate_key', type=str, metavar='PATH',
+                       help='Write a new private key to PATH and its public key to PATH.pub.')
+    args = parser.parse_args(args)
+
+    if args.generate_key:
+        generate_key_pair(args.generate_key)
+        print(f'Wrote your private key to {args.generate_key} and your public key to '
+              f'{args.generate_key}.pub. Set private_key_path in your config.')
+        return True
+
+    from .pw_storage import get_secrets_data_client
+    pw_client = get_secrets_data_client(pw_config)
+    keyring = SectionKeyring.for_client(pw_client, pw_config)
+
+    if args.add_key:
+        name, pem_path = args.add_key
+        with open(pem_path, 'rb') as f:
+            keyring.add_public_key(name, f.read())
+        print(f'Added the public key of "{name}".')
+        return True
+
+    if args.section is None:
+        parser.error('the following arguments are required: section')
+    if args.section not in pw_client.pw_dict:
+        print(f'Didn\'t find section "{args.section}".')
+        return False
+
+    if args.to:
+        if args.section in keyring.get_shared_sections():
+            keyring.add_recipients(args.section, args.to)
+        else:
+            from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+            keyring.share_section(pw_client, args.section, args.to,
+                                  SynchronousEncryptionFernet(pw_config.encryption_key))
+        print(f'Shared section "{args.section}" with {", ".join(args.to)}.')
+        return True
+
+    if args.revoke:
+        keyring.remove_recipients(pw_client, args.section, args.revoke)
+        print(f'Removed {", ".join(args.revoke)} from section "{args.section}".')
+        return True
+
+    if not keyring.is_shared(args.section):
+        print(f'Section "{args.section}" is not shared.')
+        return True
+    for name in keyring.get_recipients(args.section):
+        print(name)
+    return True
+
+
+def generate_key_pair(path: str):
+    from crypto.asymmetric_encryption import (
+        generate_private_rsa_2048_key, serialize_private_key, serialize_public_key)
+
+    private_key = generate_private_rsa_2048_key()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(serialize_private_key(private_key))
+    with open(f'{path}.pub', 'wb') as f:
+        f.write(serialize_public_key(private_key.public_key()))
+
+
+class SectionKeyring:
+    """The data keys of the shared sections, encrypted for every recipient."""
+
+    def __init__(self, path: str, private_key_path: str = None, recipient_name: str = None):
+        self.path = path
+        self.private_key_path = private_key_path
+        self.recipient_name = recipient_name
+        self._data = None
+        self._cryptos = {}  # section -> SynchronousEncryptionFernet with the data key
+
+    @classmethod
+    def for_client(cls, pw_client, pw_config: PWConfig) -> 'SectionKeyring':
+        return cls(get_keyring_path(pw_client),
+                   pw_config.private_key_path, pw_config.recipient_name)
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            import json
+            try:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+            except FileNotFoundError:
+                self._data = {'public_keys': {}, 'sections': {}}
+        return self._data
+
+    @property
+    def pending(self) -> dict:
+        """The new data keys of the sections whose values may not be re-encrypted yet."""
+        return self.data.setdefault('pending', {})
+
+    def is_shared(self, section: str) -> bool:
+        return section in self.data['sections'] or section in self.pending
+
+    def get_shared_sections(self) -> List[str]:
+        return list(self.data['sections'])
+
+    def get_recipients(self, section: str) -> List[str]:
+        return sorted(self.data['sections'].get(section) or self.pending[section])
+
+    def get_crypto(self, section: str, cache=None, vault_crypto=None):
+        """The SynchronousEncryptionFernet of a shared section.
+
+        With a pending data key, it encrypts with the pending key and decrypts
+        with both that and the old one, which is `vault_crypto` if the section
+        was not shared before."""
+        if section not in self._cryptos:
+            from cryptography.fernet import MultiFernet
+            from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+
+            keys = [self._get_data_key(section, wrapped) for wrapped in (self.pending, self.data['sections'])
+                    if self.recipient_name in wrapped.get(section, {})]
+            if not keys:
+                keys.append(self._get_data_key(section))  # raises the PermissionError
+            crypto = SynchronousEncryptionFernet(keys[0], cache)
+            ciphers = [SynchronousEncryptionFernet(key).cipher for key in keys[1:]]
+            if section not in self.data['sections'] and vault_crypto is not None:
+                ciphers.append(vault_crypto.cipher)
+            if ciphers:
+                crypto.cipher = MultiFernet([crypto.cipher, *ciphers])
+            self._cryptos[section] = crypto
+        return self._cryptos[section]
+
+    def add_public_key(self, name: str, pem: bytes):
+        from crypto.asymmetric_encryption import load_public_key
+        load_public_key(pem)  # fail early on an invalid key
+        self.data['public_keys'][name] = pem.decode('ascii')
+        self.save()
+
+    def share_section(self, pw_client, section: str, names: List[str], vault_crypto):
+        """Give the section a new data key, re-encrypt its values with it and
+        encrypt the data key for the recipients and yourself."""
+        self._add_own_public_key()
+        names = sorted({*names, *self.pending.get(section, {}), self.recipient_name})
+        self._check_public_keys(names)
+        if section in self.pending:  # sharing it was interrupted
+            vault_crypto = self.get_crypto(section, vault_crypto=vault_crypto)
+        self._replace_data_key(pw_client, section, names, vault_crypto)
+
+    def add_recipients(self, section: str, names: List[str]):
+        self._check_public_keys(names)
+        for wrapped in (self.data['sections'], self.pending):
+            if section in wrapped:
+                wrapped[section].update(self._wrap(self._get_data_key(section, wrapped), names))
+        self.save()
+
+    def remove_recipients(self, pw_client, section: str, names: List[str]):
+        """Remove recipients and give the section a new data key for the others."""
+        recipients = self.data['sections'].get(section) or self.pending[section]
+        for name in names:
+            if name not in recipients:
+                raise KeyError(name)
+        if set(recipients) <= set(names):
+            raise ValueError(f'At least one recipient must be left for section "{section}".')
+        remaining = sorted(name for name in recipients if name not in names)
+        self._replace_data_key(pw_client, section, remaining, self.get_crypto(section))
+
+    def save(self):
+        write_json_atomically(self.path, self.data)
+
+    def _replace_data_key(self, pw_client, section: str, names: List[str], old_crypto):
+        """Re-encrypt the values of the section with a new data key and encrypt
+        that key for `names`.
+
+        The new key is saved as pending before the values are written and
+        replaces the old one after, so that a crash in between never leaves
+        values encrypted with a key that was not saved."""
+        from cryptography.fernet import Fernet
+        from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+
+        data_key = Fernet.generate_key()
+        section_crypto = SynchronousEncryptionFernet(data_key)
+        with pw_client.write_lock():
+            items = [
+                (section, entity, self._reencrypt(secrets_data, old_crypto, section_crypto))
+                for entity, secrets_data in pw_client.pw_dict[section].items()
+            ]
+            self.pending[section] = self._wrap(data_key, names)
+            self.save()
+            pw_client.set_many_secrets_data(items)
+            self._reencrypt_history(pw_client, section, old_crypto, section_crypto)
+            self.data['sections'][section] = self.pending.pop(section)
+            self.save()
+        self._cryptos[section] = section_crypto
+
+    def _get_data_key(self, section: str, keys: dict = None) -> bytes:
+        """Decrypt your data key of the section in `keys` (the saved ones by default)."""
+        from crypto.asymmetric_encryption import decrypt, load_existing_key
+
+        if keys is None:
+            keys = self.data['sections']
+        encrypted_key = keys.get(section, {}).get(self.recipient_name)
+        if encrypted_key is None or self.private_key_path is None:
+            raise PermissionError(f'Section "{section}" is not shared with you. '
+                                  'Check recipient_name and private_key_path in your config.')
+        private_key = load_existing_key(os.path.expanduser(self.private_key_path))
+        return decrypt(base64.b64decode(encrypted_key), private_key)
+
+    def _wrap(self, data_key: bytes, names: List[str]) -> Dict[str, str]:
+        from crypto.asymmetric_encryption import encrypt, load_public_key
+
+        return {
+            name: base64.b64encode(encrypt(
+                data_key, load_public_key(self.data['public_keys'][name].encode('ascii'))
+            )).decode('ascii')
+            for name in names
+        }
+
+    def _add_own_public_key(self):
+        from crypto.asymmetric_encryption import load_existing_key, serialize_public_key
+
+        if self.recipient_name is None or self.private_key_path is None:
+            raise PermissionError('Set recipient_name and private_key_path in your config to share sections.')
+        if self.recipient_name not in self.data['public_keys']:
+            private_key = load_existing_key(os.path.expanduser(self.private_key_path))
+            public_key = serialize_public_key(private_key.public_key())
+            self.data['public_keys'][self.recipient_name] = public_key.decode('ascii')
+
+    def _check_public_keys(self, names: List[str]):
+        missing = [name for name in names if name not in self.data['public_keys']]
+        if missing:
+            raise KeyError(f'No public key for {", ".join(missing)}. Add it with "pw share --add_key".')
+
+    @staticmethod
+    def _reencrypt_history(pw_client, section: str, old_crypto, new_crypto):
+        """Re-encrypt the versions of the section in the history (see pw_history)."""
+        from cryptography.fernet import InvalidToken
+        from .pw_history import VersionHistory, get_history_path
+
+        history = VersionHistory(get_history_path(pw_client), depth=0)  # only rotated
+        if not os.path.exists(history.path):
+            return
+
+        def reencrypt_value(value_section: str, value: str) -> str:
+            if value_section != section:
+                return value
+            try:
+                return new_crypto.encrypt(old_crypto.decrypt(value))
+            except InvalidToken:  # encrypted with a key from before the last one
+                return value
+
+        history.rotate(reencrypt_value)
+
+    @staticmethod
+    def _reencrypt(secrets_data: dict, old_crypto, new_crypto) -> dict:
+        keys = list(secrets_data)
+        values = old_crypto.decrypt_many(secrets_data[key] for key in keys)
+        return dict(zip(keys, new_crypto.encrypt_many(values)))
+
+
+def get_keyring_path(pw_client) -> str:
+    return f'{pw_client.creds_file_path}.recipients.json'
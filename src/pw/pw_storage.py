@@ -0,0 +1,330 @@
+import os
+import contextlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .pw_config import PWConfig
+from .pw_index import EntityIndex
+from .pw_journal import apply_record
+from .pw_trace import phase
+from .pw_utils import file_lock
+
+
+def get_secrets_data_client(pw_config: PWConfig) -> 'SecretsDataClient':
+    """Client for the storage format of `pw_config.creds_file_name`.
+
+    Directories use the sharded format, "*.pwv" files the binary format,
+    everything else json."""
+    client_class = _get_client_class(os.path.join(pw_config.creds_dir, pw_config.creds_file_name))
+    return client_class(pw_config.creds_dir, pw_config.creds_file_name,
+                        compact=pw_config.compact_memory, lazy=pw_config.lazy_load,
+                        parse_cache=pw_config.parse_cache)
+
+
+def as_dict(pw_dict) -> dict:
+    """`pw_dict` as nested plain dicts, e.g. to serialize it."""
+    if isinstance(pw_dict, dict):
+        return pw_dict
+    return {section: dict(entities.items()) for section, entities in pw_dict.items()}
+
+
+def convert_command(args: List[str], pw_config: PWConfig):
+    """`pw convert <source> <target>`"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pw convert', description=(
+        'Convert a secrets data file between the json, the binary (*.pwv) and the '
+        'sharded format (a directory with a file per section, e.g. "vault/").'))
+    parser.add_argument('source', type=str)
+    parser.add_argument('target', type=str)
+    args = parser.parse_args(args)
+
+    convert_secrets_data(args.source, args.target)
+    print(f'Converted {args.source} to {args.target}.')
+    print('Point creds_file_name in your config to the new file to use it.')
+    return True
+
+
+def convert_secrets_data(source_path: str, target_path: str):
+    """Losslessly convert between the storage formats, based on the file names.
+
+    Directories, and paths ending with a "/", are sharded."""
+    source_dir, source_name = os.path.split(os.path.abspath(source_path))
+    source = _get_client_class(source_path)(source_dir, source_name)
+    pw_dict = as_dict(source.pw_dict)
+    if _is_sharded(target_path):
+        from .pw_sharded_client import write_sharded_file
+        write_sharded_file(target_path, pw_dict)
+    elif target_path.endswith('.pwv'):
+        from .pw_binary_client import write_binary_file
+        write_binary_file(target_path, pw_dict)
+    else:
+        from .pw_utils import write_json_atomically
+        write_json_atomically(target_path, pw_dict)
+
+
+def _get_client_class(creds_file_path: str):
+    if _is_sharded(creds_file_path):
+        from .pw_sharded_client import SecretsDataShardedClient
+        return SecretsDataShardedClient
+    if creds_file_path.endswith('.pwv'):
+        from .pw_binary_client import SecretsDataBinaryClient
+        return SecretsDataBinaryClient
+    from .pw_json_client import SecretsDataJSONClient
+    return SecretsDataJSONClient
+
+
+def _is_sharded(path: str) -> bool:
+    return path.endswith(os.sep) or os.path.isdir(path)
+
+
+class SecretsDataClient:
+    """Storage independent part of the secrets data clients.
+
+    `pw_dict` maps section -> entity -> key -> encrypted value. It is a dict,
+    a mapping that reads from the file until the first change (binary
+    format, or json with `lazy`; see `_materialize`) or, with `compact`, a
+    CompactSecretsData.
+    Subclasses load it and write changes to their storage format.
+
+    Several processes can use the same secrets data: loads hold a shared
+    lock and changes an exclusive lock on "<creds_file>.lock". The
+    fingerprint of the files at load time serves as version stamp. If it
+    changed by the time of a write, `pw_dict` is reloaded first and the
+    change is applied on top, so changes of other processes to other
+    entities (or other keys of the same entity) are kept.
+
+    Changes made within `transaction` are written together, in one write.
+    """
+
+    def __init__(self, creds_dir_path: str, creds_file_name: str, compact: bool = False,
+                 lazy: bool = False):
+        self.compact = compact
+        self.lazy = lazy
+        self.creds_dir_path = creds_dir_path
+        self.creds_file_name = creds_file_name
+        self.creds_file_path = os.path.join(creds_dir_path, creds_file_name)
+        self._backups = None
+        self._index = None
+        self._has_backup = False
+        self.lock_path = f'{self.creds_file_path}.lock'
+        self._fingerprint = None  # of the files pw_dict was loaded from
+        self._write_lock_depth = 0
+        self._transaction = None  # records of the open transaction
+        self._is_bulk_transaction = False  # written as a whole, see set_many_secrets_data
+
+    def load(self):
+        """(Re)load `pw_dict` from the secrets data file."""
+        with phase('load'), file_lock(self.lock_path, exclusive=False):
+            self._reload()
+
+    def _reload(self):
+        """`load` for callers that hold a lock already."""
+        self.pw_dict = self._load()
+        self._fingerprint = self.get_fingerprint()
+        self._index = None
+        if self.compact and isinstance(self.pw_dict, dict):
+            from .pw_compact_vault import CompactSecretsData
+            self.pw_dict = CompactSecretsData.from_dict(self.pw_dict)
+
+    @contextlib.contextmanager
+    def write_lock(self):
+        """Exclusive lock for changes to the secrets data.
+
+        Reloads `pw_dict` first if another process changed the files since
+        they were loaded. Can be nested."""
+        if self._write_lock_depth:
+            self._write_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._write_lock_depth -= 1
+            return
+
+        with file_lock(self.lock_path, exclusive=True):
+            self._write_lock_depth = 1
+            try:
+                if self.has_changed():
+                    self._reload()
+                yield
+            finally:
+                self._write_lock_depth = 0
+                self._fingerprint = self.get_fingerprint()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Write all changes made within as a single, atomic record.
+
+        The changes are applied to `pw_dict` right away, so they can be read
+        within the transaction, but are only written when it ends. If it
+        ends with an exception, nothing is written and `pw_dict` is
+        reloaded. Holds the write lock for its duration. Can be nested.
+        Transactions with `set_many_secrets_data` rewrite the whole file instead."""
+        if self._transaction is not None:
+            yield
+            return
+
+        with self.write_lock():
+            self._transaction = []
+            try:
+                yield
+            except BaseException:
+                self._transaction = None
+                self._is_bulk_transaction = False
+                self._reload()
+                raise
+            records, self._transaction = self._transaction, None
+            is_bulk, self._is_bulk_transaction = self._is_bulk_transaction, False
+            if is_bulk:
+                self._save_records(records)
+            elif len(records) == 1:
+                self._write(records[0])
+            elif records:
+                self._write({'op': 'batch', 'records': records})
+
+    def _load(self):
+        """Read `pw_dict` from the storage format."""
+        raise NotImplementedError()
+
+    def save_dict_to_file(self):
+        """Write the whole `pw_dict` to the secrets data file.
+
+        Callers that change `pw_dict` themselves must hold `write_lock`."""
+        raise NotImplementedError()
+
+    def _write_record(self, record: dict):
+        """Apply a journal record (see pw_journal) to `pw_dict` and persist it."""
+        raise NotImplementedError()
+
+    def _get_file_paths(self) -> List[str]:
+        """Files whose changes are reflected by `get_fingerprint`."""
+        return [self.creds_file_path]
+
+    def _get_section_files(self) -> Optional[Dict[str, str]]:
+        """Immutable files with the entities of a section, which backups link
+        instead of reading, see pw_backup."""
+        return None
+
+    def _materialize(self):
+        """Turn `pw_dict` into a plain dict before it is changed."""
+
+    @property
+    def backups(self):
+        """The SecretsDataBackups, created on first use (only writes need them)."""
+        if self._backups is None:
+            from .pw_backup import SecretsDataBackups
+            self._backups = SecretsDataBackups(os.path.join(self.creds_dir_path, '.backups'))
+        return self._backups
+
+    def get_index(self) -> EntityIndex:
+        """The trigram index of all entity names, built on first use.
+
+        It is kept in memory only, in sync with the changes of this client,
+        so long-lived processes (the agent, AsyncVault) build it once."""
+        if self._index is None:
+            self._index = EntityIndex.build(self.pw_dict)
+        return self._index
+
+    def get_fingerprint(self) -> tuple:
+        """Changes whenever one of the files of the secrets data is written."""
+        fingerprint = ()
+        for path in self._get_file_paths():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                fingerprint += (None,)
+            else:
+                fingerprint += ((stat.st_ino, stat.st_mtime_ns, stat.st_size),)
+        return fingerprint
+
+    def has_changed(self) -> bool:
+        """Whether the files were written since `pw_dict` was loaded."""
+        return self.get_fingerprint() != self._fingerprint
+
+    def create_backup(self):
+        """Snapshot the secrets data, unless it is unchanged since the last backup.
+
+        Called once before the first change of a process, so read-only
+        invocations never write a backup."""
+        with phase('backup'):
+            self.backups.create_snapshot(self.pw_dict, self.get_fingerprint(),
+                                         self._get_section_files())
+        self._has_backup = True
+
+    def list_backups(self):
+        return self.backups.list_snapshots()
+
+    def restore_backup(self, name: str):
+        """Replace the secrets data with the backup `name`."""
+        pw_dict = self.backups.load_snapshot(name)
+        with self.write_lock():
+            # Keep the current state restorable as well
+            self.create_backup()
+            self.pw_dict = pw_dict
+            self._index = None
+            with phase('save'):
+                self.save_dict_to_file()
+
+    def create_section(self, section: str):
+        self._commit({'op': 'create_section', 'section': section})
+
+    def remove_section(self, section: str):
+        self._commit({'op': 'remove_section', 'section': section})
+
+    def set_secrets_data(self, section: str, entity: str, secrets_data: dict):
+        """Add or replace all secrets data of an entity."""
+        self._commit({'op': 'set', 'section': section,
+                      'entity': entity, 'data': secrets_data})
+
+    def update_secrets_data(self, section: str, entity: str, new_data: dict):
+        """Add or overwrite single keys of the secrets data of an entity."""
+        self._commit({'op': 'update', 'section': section,
+                      'entity': entity, 'data': new_data})
+
+    def remove_secrets_data(self, section: str, entity: str):
+        self._commit({'op': 'remove', 'section': section, 'entity': entity})
+
+    def set_many_secrets_data(self, items: Iterable[Tuple[str, str, dict]]) -> int:
+        """Add or replace the secrets data of many entities with one write of
+        the secrets data file, instead of one record per entity.
+
+        `items` are (section, entity, secrets_data) tuples. Returns their count.
+        Within a transaction, they are written with the transaction, which
+        then rewrites the file as well."""
+        if self._transaction is None:
+            with self.transaction():
+                return self.set_many_secrets_data(items)
+        self._is_bulk_transaction = True
+        n_items = 0
+        for section, entity, secrets_data in items:
+            self.set_secrets_data(section, entity, secrets_data)
+            n_items += 1
+        return n_items
+
+    def _commit(self, record: dict):
+        with self.write_lock():
+            if not self._has_backup:
+                self.create_backup()
+            if self._transaction is not None:
+                self._materialize()
+                apply_record(self.pw_dict, record)
+                self._transaction.append(record)
+                return
+            self._write(record)
+
+    def _save_records(self, records: List[dict]):
+        """Persist `records`, which `pw_dict` has already, with one write of the
+        whole secrets data file instead of journal records."""
+        with self.write_lock(), phase('save'):
+            fingerprint = self.get_fingerprint()
+            self.save_dict_to_file()
+            self.backups.record_changes(records, fingerprint, self.get_fingerprint())
+            self._index = None  # rebuilt on the next search
+
+    def _write(self, record: dict):
+        with self.write_lock(), phase('save'):
+            fingerprint = self.get_fingerprint()
+            self._write_record(record)
+            self.backups.record_changes([record], fingerprint, self.get_fingerprint())
+            # A built index is updated instead of being rebuilt on the next search
+            if self._index is not None:
+                self._index.apply_record(record)
@@ -0,0 +1,136 @@
+"""Timings of the phases of a `pw` call, to find out where the time goes.
+
+    pw --profile guitar                    # table on stderr
+    pw --profile=json guitar               # json on stderr
+    pw --profile --profile_dump=pw.prof guitar  # and cProfile stats
+
+PW_TRACE=1 (or PW_TRACE=json) and PW_TRACE_DUMP=<path> do the same for
+every call. While tracing is off, `phase` returns a shared no-op context
+manager, so the instrumented code paths cost next to nothing.
+"""
+import os
+import sys
+import time
+import contextlib
+from typing import Dict, List
+
+# In the order of a typical call
+PHASES = ('import', 'config', 'agent', 'load', 'search', 'backup',
+          'decrypt', 'encrypt', 'save', 'clipboard')
+
+_DISABLED = contextlib.nullcontext()
+
+# The values of PW_TRACE that turn tracing on, any other leaves it off
+_TRACE_FORMATS = {'1': 'text', 'text': 'text', 'json': 'json'}
+
+
+class Tracer:
+    def __init__(self):
+        self.output_format = None  # "text" or "json" while tracing
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self._started_at = None
+        self._profile = None
+        self._dump_path = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.output_format is not None
+
+    def start(self, output_format: str = 'text', dump_path: str = None):
+        self.output_format = output_format
+        self.seconds = {}
+        self.calls = {}
+        self._started_at = time.perf_counter()
+        self._dump_path = dump_path
+        if dump_path:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def phase(self, name: str):
+        """Context manager that adds its duration to the phase `name`."""
+        if self.output_format is None:
+            return _DISABLED
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started_at)
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def stop(self) -> dict:
+        """End tracing and return the report."""
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self._dump_path)
+            self._profile = None
+        # The imports happen before tracing starts
+        total_seconds = time.perf_counter() - self._started_at + self.seconds.get('import', 0.0)
+        report = {
+            'total_ms': total_seconds * 1000,
+            'phases': {
+                name: {'ms': self.seconds[name] * 1000, 'calls': self.calls[name]}
+                for name in sorted(self.seconds, key=_phase_order)
+            },
+        }
+        self.output_format = None
+        return report
+
+
+def configure(args: List[str]) -> List[str]:
+    """Start tracing if the environment or `args` ask for it.
+
+    Returns `args` without the --profile options that come before `--`."""
+    output_format = _TRACE_FORMATS.get(os.environ.get('PW_TRACE', ''))
+    dump_path = os.environ.get('PW_TRACE_DUMP') or None
+    remaining = []
+    for i, arg in enumerate(args):
+        if arg == '--':
+            remaining.extend(args[i:])
+            break
+        elif arg == '--profile':
+            output_format = 'text'
+        elif arg.startswith('--profile='):
+            output_format = arg[len('--profile='):]
+        elif arg.startswith('--profile_dump='):
+            dump_path = arg[len('--profile_dump='):]
+        else:
+            remaining.append(arg)
+    if output_format or dump_path:
+        tracer.start('json' if output_format == 'json' else 'text', dump_path)
+    return remaining
+
+
+def finish():
+    """Stop tracing and print the report to stderr."""
+    if not tracer.enabled:
+        return
+    output_format = tracer.output_format
+    report = tracer.stop()
+    if output_format == 'json':
+        import json
+        print(json.dumps(report), file=sys.stderr)
+        return
+    print('pw timings:', file=sys.stderr)
+    for name, phase in report['phases'].items():
+        print(f'  {name:<10} {phase["ms"]:9.2f} ms  ({phase["calls"]}x)', file=sys.stderr)
+    print(f'  {"total":<10} {report["total_ms"]:9.2f} ms', file=sys.stderr)
+
+
+def phase(name: str):
+    return tracer.phase(name)
+
+
+def _phase_order(name: str) -> int:
+    return PHASES.index(name) if name in PHASES else len(PHASES)
+
+
+tracer = Tracer()
@@ -0,0 +1,238 @@
+"""`pw import` and `pw export`: move many secrets in and out of the vault.
+
+Records flow through generators, so neither the plaintext input nor the
+decrypted output is ever held in memory as a whole. A record is a flat dict
+with the keys "section" (optional), "entity" and one key per secret. Values
+of shared sections (see pw_share) are encrypted with the data key of their
+section. The metadata keys of entities (see pw_vault) are neither exported
+nor imported: imported entities get their own.
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+import contextlib
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from .pw_config import PWConfig
+from .pw_vault import METADATA_KEYS
+
+FORMATS = ('csv', 'jsonl')
+RECORD_KEYS = ('section', 'entity')
+
+
+def import_command(args: List[str], pw_config: PWConfig):
+    """`pw import <file> (--format csv|jsonl) (-s <section>) (--workers <n>) (-ow)`"""
+    parser = argparse.ArgumentParser(prog='pw import', description=(
+        'Import secrets from a csv or json lines file. Use "-" to read from stdin.'))
+    parser.add_argument('file', type=str)
+    parser.add_argument('--format', choices=FORMATS)
+    parser.add_argument('-s', '--section', type=str, default='main',
+                        help='Section of records that do not name their section.')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Encrypt in a pool of this many processes.')
+    parser.add_argument('--batch_size', type=int, default=1000)
+    parser.add_argument('-ow', '--overwrite', action='store_true',
+                        help='Overwrite entities that exist already.')
+    args = parser.parse_args(args)
+
+    from .pw_vault import Vault
+    vault = Vault.from_config(pw_config)
+
+    with _open(args.file, 'r') as f:
+        records = read_records(f, args.format or _guess_format(args.file), args.section)
+        try:
+            n_imported = vault.add_many(
+                ((r['section'], r['entity'], r['secrets_data']) for r in records),
+                args.overwrite, args.batch_size, args.workers)
+        except (PermissionError, ValueError) as e:
+            print(f'{e.args[0]} Nothing was imported.', file=sys.stderr)
+            return False
+    print(f'Imported {n_imported} entities.')
+    return True
+
+
+def export_command(args: List[str], pw_config: PWConfig):
+    """`pw export <file> (--format csv|jsonl) (-s <section>) (--encrypted | --encryption_key <key>)`"""
+    parser = argparse.ArgumentParser(prog='pw export', description=(
+        'Export secrets to a csv or json lines file. Use "-" to write to stdout.'))
+    parser.add_argument('file', type=str)
+    parser.add_argument('--format', choices=FORMATS)
+    parser.add_argument('-s', '--section', type=str, help='Only export this section.')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--encrypted', action='store_true',
+                       help='Export the values as they are stored (encrypted).')
+    group.add_argument('--encryption_key', type=str,
+                       help='Re-encrypt the exported values with this key.')
+    args = parser.parse_args(args)
+
+    from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+    from .pw_vault import Vault
+    vault = Vault.from_config(pw_config)
+    new_crypto = None
+    if args.encryption_key:
+        new_crypto = SynchronousEncryptionFernet(args.encryption_key)
+
+    sections = [args.section] if args.section else vault.sections()
+    if not args.encrypted:
+        sections = _get_readable_sections(vault, sections)
+        if args.section and not sections:
+            return False
+    pw_dict = {section: vault.pw_client.pw_dict[section] for section in sections}
+    records = export_records(pw_dict, None if args.encrypted else vault.get_crypto, new_crypto)
+
+    file_format = args.format or _guess_format(args.file)
+    with _open(args.file, 'w') as f:
+        n_exported = write_records(f, records, file_format, _get_field_names(pw_dict))
+    print(f'Exported {n_exported} entities.', file=sys.stderr)
+    return True
+
+
+def read_records(f, file_format: str, default_section: str = 'main') -> Iterator[dict]:
+    """Yield {"section", "entity", "secrets_data"} dicts with plaintext secrets.
+
+    Raises ValueError, with the line number, for rows without an entity."""
+    if file_format == 'csv':
+        reader = csv.DictReader(f)
+        rows = ((reader.line_num, row) for row in reader)
+    else:
+        rows = _read_json_lines(f)
+    for line_number, row in rows:
+        section = row.pop('section', None) or default_section
+        entity = row.pop('entity', None)
+        if not entity:
+            raise ValueError(f'Line {line_number} has no entity.')
+        secrets_data = {k: v for k, v in row.items()
+                        if v not in (None, '') and k not in METADATA_KEYS}
+        yield {'section': section, 'entity': entity, 'secrets_data': secrets_data}
+
+
+def encrypt_records(records: Iterable[dict], get_cipher: Callable[[str], object],
+                    batch_size: int = 1000, workers: int = 0) -> Iterator[dict]:
+    """Encrypt the secrets data of `records` in batches, keeping their order.
+
+    `get_cipher(section)` returns the Fernet of a section. With `workers`,
+    batches are encrypted in a process pool. At most two batches per worker
+    are in flight, so the input is still streamed."""
+    batches = ((batch, {r['section']: get_cipher(r['section']) for r in batch})
+               for batch in _batched(records, batch_size))
+    if not workers:
+        for batch, ciphers in batches:
+            yield from _encrypt_batch(batch, ciphers)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for batch, ciphers in batches:
+            in_flight.append(pool.submit(_encrypt_batch, batch, ciphers))
+            if len(in_flight) >= 2 * workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def export_records(pw_dict: dict, get_crypto: Callable[[str], object] = None,
+                   new_crypto=None) -> Iterator[dict]:
+    """Yield one flat record per entity.
+
+    Values are decrypted with the crypto that `get_crypto(section)` returns
+    (or left encrypted if it is None) and then re-encrypted with
+    `new_crypto`, if given."""
+    for section, entities in pw_dict.items():
+        crypto = get_crypto(section) if get_crypto is not None else None
+        for entity, secrets_data in entities.items():
+            keys = [key for key in secrets_data if key not in METADATA_KEYS]
+            values = [secrets_data[key] for key in keys]
+            if crypto is not None:
+                values = crypto.decrypt_many(values)
+                if new_crypto is not None:
+                    values = new_crypto.encrypt_many(values)
+            yield dict(section=section, entity=entity, **dict(zip(keys, values)))
+
+
+def write_records(f, records: Iterable[dict], file_format: str, field_names: List[str]) -> int:
+    n_records = 0
+    if file_format == 'csv':
+        writer = csv.DictWriter(f, fieldnames=list(RECORD_KEYS) + field_names)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+            n_records += 1
+    else:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+            n_records += 1
+    return n_records
+
+
+def _encrypt_batch(batch: List[dict], ciphers: Dict[str, object]) -> List[dict]:
+    """Encrypt the records of a batch with the Fernet of their section."""
+    for record in batch:
+        encrypt = ciphers[record['section']].encrypt
+        record['secrets_data'] = {k: encrypt(v.encode('utf-8')).decode('utf-8')
+                                  for k, v in record['secrets_data'].items()}
+    return batch
+
+
+def _get_readable_sections(vault, sections: List[str]) -> List[str]:
+    """`sections` without the shared sections that cannot be decrypted."""
+    readable = []
+    for section in sections:
+        try:
+            vault.get_crypto(section)
+        except PermissionError as e:
+            print(f'Skipped section "{section}": {e.args[0]}', file=sys.stderr)
+            continue
+        readable.append(section)
+    return readable
+
+
+def _batched(iterable: Iterable, batch_size: int) -> Iterator[list]:
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _read_json_lines(f) -> Iterator[Tuple[int, dict]]:
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise ValueError(f'Line {line_number} is not valid json.') from None
+        if not isinstance(row, dict):
+            raise ValueError(f'Line {line_number} is not a json object.')
+        yield line_number, row
+
+
+def _get_field_names(pw_dict: dict) -> List[str]:
+    """All keys of all entities but the metadata (without decrypting
+    anything), password first."""
+    field_names: Dict[str, None] = {'password': None}
+    for entities in pw_dict.values():
+        for secrets_data in entities.values():
+            field_names.update(dict.fromkeys(secrets_data))
+    return [key for key in field_names if key not in METADATA_KEYS]
+
+
+def _guess_format(path: str) -> str:
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+
+def _open(path: str, mode: str):
+    if path == '-':
+        return contextlib.nullcontext(sys.stdin if mode == 'r' else sys.stdout)
+    if mode == 'r':
+        return open(path, mode, newline='')
+    # Exports hold decrypted secrets: only the owner may read them
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    return os.fdopen(fd, mode, newline='')
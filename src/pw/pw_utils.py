@@ -1,7 +1,14 @@
+import os
 import json
-import random
+import stat
 import string
-from typing import Generator
+import contextlib
+from typing import Generator, List
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
 
 
 class HelpTexts:
@@ -22,17 +29,86 @@ class HelpTexts:
     Example: "pw -d GitHub -s dev" -> Remove the password for GitHub
     from the section "dev".''',
     set_password = 'Set your own password instead of generating a random password. Use it with "-n".'
+    list_backups = 'Print all backups, oldest first.'
+    restore_backup = 'Restore the secrets data from a backup listed by "-bl".'
+    count = 'Print this many random passwords, one per line, e.g. "pw -rc 1000 --min_digits 2".'
+
+
+PUNCTUATION = r"!#$%&()*+:,-./;<=>?@[]^_{|}~"
 
 
 def generate_random_password(special_characters=True, 
-                             password_length: int = 42) -> str:
-        """Generates a random password and returns it as a string."""
-        digits = string.digits
-        letters = string.ascii_letters
-        punctuation = r"!#$%&()*+:,-./;<=>?@[]^_{|}~" if special_characters else ''
-        characters = digits + letters + punctuation
-        random_password = ''.join(random.choice(characters) for i in range(password_length))
-        return random_password
+                             password_length: int = 42, **policy) -> str:
+        """Generates a random password and returns it as a string.
+
+        See `generate_random_passwords` for the policy keyword arguments."""
+        return generate_random_passwords(1, special_characters, password_length, **policy)[0]
+
+
+def generate_random_passwords(count: int, special_characters=True, password_length: int = 42,
+                              min_digits: int = 0, min_symbols: int = 0,
+                              min_lowercase: int = 0, min_uppercase: int = 0) -> List[str]:
+    """Generates `count` random passwords with a CSPRNG.
+
+    The characters of all passwords are drawn at once from os.urandom (see
+    `random_characters`). Characters required by the policy (`min_*`) are
+    drawn from their class and mixed into the rest by sorting them by random
+    64 bit keys (a shuffle), so no password has to be generated twice."""
+    charsets = {
+        string.digits: min_digits,
+        PUNCTUATION: min_symbols,
+        string.ascii_lowercase: min_lowercase,
+        string.ascii_uppercase: min_uppercase,
+    }
+    if min_symbols and not special_characters:
+        raise ValueError('Symbols are required but special characters are disabled.')
+    n_required = sum(charsets.values())
+    if n_required > password_length:
+        raise ValueError(f'The policy requires {n_required} characters, '
+                         f'but the password length is {password_length}.')
+
+    characters = string.digits + string.ascii_letters + (PUNCTUATION if special_characters else '')
+    n_free = password_length - n_required
+    free = random_characters(characters, count * n_free)
+    if not n_required:
+        return [free[i * n_free:(i + 1) * n_free] for i in range(count)]
+
+    required = ''.join(random_characters(charset, count * n) for charset, n in charsets.items() if n)
+    # required holds the characters of all passwords per class; regroup them per password
+    offsets, start = [], 0
+    for n in charsets.values():
+        if n:
+            offsets.append((start, n))
+            start += count * n
+    sort_keys = memoryview(os.urandom(8 * count * password_length)).cast('Q')
+    passwords = []
+    for i in range(count):
+        password = list(free[i * n_free:(i + 1) * n_free])
+        for start, n in offsets:
+            password.extend(required[start + i * n:start + (i + 1) * n])
+        keys = sort_keys[i * password_length:(i + 1) * password_length]
+        passwords.append(''.join(c for _, c in sorted(zip(keys, password))))
+    return passwords
+
+
+def random_characters(characters: str, n: int) -> str:
+    """`n` characters drawn uniformly from `characters` (ascii) with os.urandom.
+
+    Random bytes are mapped to characters with `bytes.translate` over whole
+    buffers. Bytes above the largest multiple of len(characters) are deleted
+    (rejection sampling), which keeps the distribution uniform."""
+    n_characters = len(characters)
+    limit = 256 - 256 % n_characters
+    table = bytes(ord(characters[b % n_characters]) if b < limit else 0 for b in range(256))
+    rejected = bytes(range(limit, 256))
+
+    result = b''
+    while len(result) < n:
+        missing = n - len(result)
+        # Draw a bit more than the expected need, to rarely need a second round
+        buffer = os.urandom(missing * 256 // limit + 16)
+        result += buffer.translate(table, rejected)
+    return result[:n].decode('ascii')
     
 
 def my_exchandler(type, value, traceback):
@@ -42,9 +118,102 @@ def my_exchandler(type, value, traceback):
     print(value)
 
 
-def find_key(key: str, dictionary: dict) -> Generator[dict, None, None]:
-    """Iterate a dict recursively and yield all values if key matches."""
-    for section, secrets in dictionary.items():
-        for secret in secrets:
-            if key.lower() in secret.lower():
-                yield {'entity': secret, 'section': section}
+def find_key(key: str, dictionary: dict, index=None) -> Generator[dict, None, None]:
+    """Iterate a dict recursively and yield all values if key matches.
+
+    If an `EntityIndex` is passed, it is used instead of scanning the dict.
+    Either way, the matches are sorted by section and entity."""
+    if index is not None:
+        matches = index.find(key)
+    else:
+        key = key.lower()
+        matches = sorted((section, secret) for section, secrets in dictionary.items()
+                         for secret in secrets if key in secret.lower())
+    for section, secret in matches:
+        yield {'entity': secret, 'section': section}
+
+
+@contextlib.contextmanager
+def open_atomically(path: str, mode: str = 'w', sync: bool = True, permissions: int = 0o600):
+    """Open a temporary file next to `path` that is renamed over `path` once
+    it is written, so there is never a half-written file at `path`.
+
+    With `sync`, the file and its directory are flushed to disk too. Leave it
+    off for files whose loss is harmless, e.g. caches that are checked on load.
+    The file keeps the permissions of the file it replaces; a new file gets
+    `permissions` (before the umask), by default only the owner can read it."""
+    tmp_path = f'{path}.tmp'
+    try:
+        existing_permissions = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        existing_permissions = None
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                 permissions if existing_permissions is None else existing_permissions)
+    try:
+        with os.fdopen(fd, mode) as f:
+            if existing_permissions is not None:
+                os.chmod(tmp_path, existing_permissions)  # regardless of the umask
+            yield f
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    if sync:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def write_json_atomically(path: str, data: dict):
+    """Write `data` to `path` without ever leaving a half-written file behind,
+    see `open_atomically`."""
+    with open_atomically(path) as f:
+        # json.dumps uses the C encoder, json.dump does not
+        f.write(json.dumps(data))
+
+
+def open_for_appending(path: str):
+    """Open `path` with "a+b"; a new file is only readable by its owner."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+    return os.fdopen(fd, 'a+b')
+
+
+def cut_torn_line(f):
+    """Truncate the file `f` (opened with "a+b") after its last newline.
+
+    A crash while appending a line can leave a part of it at the end of the
+    file. Appending to that part would merge it with the next line."""
+    end = f.seek(0, os.SEEK_END)
+    position = end
+    while position > 0:
+        start = max(position - 4096, 0)
+        f.seek(start)
+        block = f.read(position - start)
+        if position == end and block.endswith(b'\n'):
+            return
+        newline = block.rfind(b'\n')
+        if newline >= 0:
+            f.truncate(start + newline + 1)
+            return
+        position = start
+    f.truncate(0)
+
+
+@contextlib.contextmanager
+def file_lock(path: str, exclusive: bool):
+    """Hold a shared (readers) or exclusive (writer) lock on the file `path`.
+
+    Without fcntl (windows) this does not lock."""
+    with open(path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
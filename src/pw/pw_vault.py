@@ -0,0 +1,400 @@
+"""The operations on the secrets data, with plain arguments and results.
+
+`Vault` is what `PasswordCommand`, `pw get` and `AsyncVault` are built on,
+and what scripts should use instead of faking command line arguments:
+
+    vault = Vault.from_config(pw_config)
+    vault.set_fields('main', 'postgres', {'username': 'admin', 'port': '5432'})
+    old_password, new_password = vault.rotate_password('main', 'postgres')
+    vault.revert('main', 'postgres')  # the old password again
+
+Values go in and come out decrypted. Missing sections, entities and keys
+raise KeyError. Entities carry the times they were created, last
+modified and their password was last changed as the metadata keys
+"_created", "_modified" and "_password_modified" (UTC, ISO 8601), which
+`keys` and `get_fields` leave out; see `get_metadata`. The values
+that changes replace are kept in a history (see pw_history). Every change
+is written on its own, unless it is made within `transaction`:
+
+    with vault.transaction():
+        for entity in entities:
+            vault.rotate_password('main', entity)
+"""
+import os
+import time
+import contextlib
+from typing import Dict, Iterable, List, Tuple
+
+from .pw_config import PWConfig
+from .pw_history import Version, VersionHistory, get_history_path
+from .pw_storage import get_secrets_data_client
+from .pw_trace import phase
+from .pw_utils import find_key, generate_random_password
+
+CREATED_KEY = '_created'
+MODIFIED_KEY = '_modified'
+PASSWORD_MODIFIED_KEY = '_password_modified'
+METADATA_KEYS = (CREATED_KEY, MODIFIED_KEY, PASSWORD_MODIFIED_KEY)
+
+
+class Vault:
+    def __init__(self, pw_client, pw_config: PWConfig, crypto_cache=None):
+        self.pw_client = pw_client
+        self.pw_config = pw_config
+        self._crypto_cache = crypto_cache
+        self._crypto = None
+        self._keyring = None
+        self._search_index = None
+        self._search_index_changed = False
+        self._transaction_depth = 0
+        self._history = None
+        self._has_searched = False
+        self._versions = []  # recorded within the open transaction
+
+    @classmethod
+    def from_config(cls, pw_config: PWConfig, crypto_cache=None) -> 'Vault':
+        return cls(get_secrets_data_client(pw_config), pw_config, crypto_cache)
+
+    def close(self):
+        """Drop the decrypted values that are cached."""
+        if self._crypto_cache is not None:
+            self._crypto_cache.clear()
+
+    @property
+    def crypto(self):
+        """The SynchronousEncryptionFernet of the vault key, created on first use."""
+        if self._crypto is None:
+            from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+            self._crypto = SynchronousEncryptionFernet(
+                self.pw_config.encryption_key, self._crypto_cache)
+        return self._crypto
+
+    def get_crypto(self, section: str):
+        """The crypto of a section: shared sections have their own data key."""
+        if self._keyring is None:
+            from .pw_share import SectionKeyring, get_keyring_path
+            if not os.path.exists(get_keyring_path(self.pw_client)):
+                return self.crypto
+            self._keyring = SectionKeyring.for_client(self.pw_client, self.pw_config)
+        if self._keyring.is_shared(section):
+            return self._keyring.get_crypto(section, self._crypto_cache, self.crypto)
+        return self.crypto
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Context manager that writes the changes made within at once, or
+        none of them if it ends with an exception."""
+        self._transaction_depth += 1
+        try:
+            with self.pw_client.transaction():
+                yield
+                if self._transaction_depth == 1:
+                    self._save_versions()
+        finally:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self._versions = []
+
+    def sections(self) -> List[str]:
+        return list(self.pw_client.pw_dict)
+
+    def has_section(self, section: str) -> bool:
+        return section in self.pw_client.pw_dict
+
+    def has_entity(self, section: str, entity: str) -> bool:
+        return entity in self.pw_client.pw_dict.get(section, {})
+
+    def entities(self, section: str) -> List[str]:
+        return list(self.pw_client.pw_dict[section])
+
+    def keys(self, section: str, entity: str) -> List[str]:
+        """The keys of an entity, without the metadata keys."""
+        return [key for key in self.pw_client.pw_dict[section][entity] if key not in METADATA_KEYS]
+
+    def get(self, section: str, entity: str, key: str = 'password') -> str:
+        encrypted_value = self.pw_client.pw_dict[section][entity][key]
+        with phase('decrypt'):
+            return self.get_crypto(section).decrypt(encrypted_value)
+
+    def get_fields(self, section: str, entity: str, keys: Iterable[str] = None) -> Dict[str, str]:
+        """The decrypted values of `keys` (default: all keys but the metadata) of an entity."""
+        secrets_data = self.pw_client.pw_dict[section][entity]
+        if keys is None:
+            keys = [key for key in secrets_data if key not in METADATA_KEYS]
+        keys = list(keys)
+        with phase('decrypt'):
+            values = self.get_crypto(section).decrypt_many(secrets_data[key] for key in keys)
+        return dict(zip(keys, values))
+
+    def get_metadata(self, section: str, entity: str) -> Dict[str, str]:
+        """The metadata keys that the entity has (entities written before
+        they existed have none)."""
+        secrets_data = self.pw_client.pw_dict[section][entity]
+        return self.get_fields(section, entity, [key for key in METADATA_KEYS if key in secrets_data])
+
+    def add(self, section: str, entity: str, fields: Dict[str, str], overwrite: bool = True) -> bool:
+        """Add an entity, creating its section if needed. Returns False if the
+        entity exists already and `overwrite` is False."""
+        if self.has_entity(section, entity) and not overwrite:
+            return False
+        now = get_timestamp()
+        fields = {CREATED_KEY: now, MODIFIED_KEY: now, **fields}
+        if 'password' in fields:
+            fields[PASSWORD_MODIFIED_KEY] = now
+        with self.transaction():
+            if not self.has_section(section):
+                self.pw_client.create_section(section)
+            current = self.pw_client.pw_dict[section].get(entity)
+            if current is not None:
+                self._record_version(section, entity, dict.fromkeys([*current, *fields]))
+            encrypted_fields = self._encrypt(section, fields)
+            self.pw_client.set_secrets_data(section, entity, encrypted_fields)
+            self._update_search_index(
+                'set_fields', section, entity, fields, encrypted_fields, replace=True)
+        return True
+
+    def add_many(self, items: Iterable[Tuple[str, str, Dict[str, str]]], overwrite: bool = False,
+                 batch_size: int = 1000, workers: int = 0) -> int:
+        """Add many (section, entity, fields) entities like `add`, in one
+        transaction that writes the secrets data file once. Returns how
+        many were added; existing entities are skipped unless `overwrite`.
+
+        The values are encrypted in batches, in a pool of `workers`
+        processes if given (see pw_transfer.encrypt_records), and `items`
+        are streamed. The search index picks them up on the next search."""
+        from .pw_transfer import encrypt_records
+
+        now = get_timestamp()
+
+        def to_records():
+            for section, entity, fields in items:
+                if not overwrite and self.has_entity(section, entity):
+                    continue
+                fields = {CREATED_KEY: now, MODIFIED_KEY: now, **fields}
+                if 'password' in fields:
+                    fields[PASSWORD_MODIFIED_KEY] = now
+                yield {'section': section, 'entity': entity, 'secrets_data': fields}
+
+        def record_versions(records):
+            for record in records:
+                section, entity, secrets_data = record['section'], record['entity'], record['secrets_data']
+                current = self.pw_client.pw_dict.get(section, {}).get(entity)
+                if current is not None:
+                    self._record_version(section, entity, dict.fromkeys([*current, *secrets_data]))
+                yield section, entity, secrets_data
+
+        with self.transaction():
+            encrypted = encrypt_records(to_records(), lambda section: self.get_crypto(section).cipher,
+                                        batch_size, workers)
+            return self.pw_client.set_many_secrets_data(record_versions(encrypted))
+
+    def set_fields(self, section: str, entity: str, fields: Dict[str, str]):
+        """Add or change several keys of an existing entity in one write."""
+        now = get_timestamp()
+        fields = {MODIFIED_KEY: now, **fields}
+        if 'password' in fields:
+            fields[PASSWORD_MODIFIED_KEY] = now
+        encrypted_fields = self._encrypt(section, fields)
+        with self.pw_client.write_lock():
+            if entity not in self.pw_client.pw_dict[section]:
+                raise KeyError(entity)
+            self._record_version(section, entity, fields)
+            self.pw_client.update_secrets_data(section, entity, encrypted_fields)
+        self._update_search_index('set_fields', section, entity, fields, encrypted_fields)
+
+    def rotate_password(self, section: str, entity: str, new_password: str = None,
+                        **policy) -> Tuple[str, str]:
+        """Replace the password of an entity. The current one is kept in its
+        history, see `revert`.
+
+        `new_password` defaults to a random password; `policy` is passed to
+        `generate_random_password`. Returns (old password, new password)."""
+        old_password = self.get(section, entity)
+        if new_password is None:
+            new_password = generate_random_password(**policy)
+        self.set_fields(section, entity, {'password': new_password})
+        return old_password, new_password
+
+    def delete(self, section: str, entity: str):
+        with self.pw_client.write_lock():
+            if entity not in self.pw_client.pw_dict[section]:
+                raise KeyError(entity)
+            self._record_version(section, entity, self.pw_client.pw_dict[section][entity])
+            self.pw_client.remove_secrets_data(section, entity)
+        self._update_search_index('remove', section, entity)
+
+    def get_history(self, section: str, entity: str) -> List[Version]:
+        """The versions of an entity before its latest changes, newest first.
+        The values stay encrypted."""
+        return self.history.get_versions(section, entity)
+
+    def revert(self, section: str, entity: str, version: int = 1):
+        """Restore an entity as it was before the `version`-th latest change
+        (see `get_history`), also if it was deleted since. The revert is
+        recorded as a change itself, so it can be reverted as well."""
+        if version < 1:
+            raise ValueError(f'There is no version {version}, the latest is 1.')
+        with self.transaction():
+            versions = self.get_history(section, entity)
+            if version > len(versions):
+                raise KeyError(f'"{entity}" has {len(versions)} earlier versions in section '
+                               f'"{section}", not {version}.')
+            current = self.pw_client.pw_dict.get(section, {}).get(entity) or {}
+            secrets_data = dict(current)
+            for earlier in versions[:version]:
+                for key, value in earlier.fields.items():
+                    if value is None:
+                        secrets_data.pop(key, None)
+                    else:
+                        secrets_data[key] = value
+            if not secrets_data:  # the version before the entity was restored
+                if current:
+                    self._record_version(section, entity, current)
+                    self.pw_client.remove_secrets_data(section, entity)
+                return
+            secrets_data.update(self._encrypt(section, {MODIFIED_KEY: get_timestamp()}))
+            self._record_version(section, entity, dict.fromkeys([*current, *secrets_data]))
+            if not self.has_section(section):
+                self.pw_client.create_section(section)
+            self.pw_client.set_secrets_data(section, entity, secrets_data)
+        # The search index picks up the restored values on the next search
+
+    @property
+    def history(self) -> VersionHistory:
+        """The VersionHistory of the vault, created on first use. Reads do not touch it."""
+        if self._history is None:
+            self._history = VersionHistory(
+                get_history_path(self.pw_client), self.pw_config.history_depth)
+        return self._history
+
+    def create_section(self, section: str):
+        self.pw_client.create_section(section)
+
+    def remove_section(self, section: str):
+        """Remove a section. Its entities are kept in their history, so each
+        of them can be restored with `revert`."""
+        with self.transaction():
+            if section not in self.pw_client.pw_dict:
+                raise KeyError(section)
+            for entity, secrets_data in self.pw_client.pw_dict[section].items():
+                self._record_version(section, entity, secrets_data)
+            self.pw_client.remove_section(section)
+        self._update_search_index('remove_section', section)
+
+    def find(self, term: str) -> Dict[str, List[str]]:
+        """Entities whose name contains `term`, grouped by section.
+
+        The first search scans the names, which is faster than building the
+        trigram index; later searches of the same vault use the index."""
+        index = self.pw_client.get_index() if self._has_searched else None
+        self._has_searched = True
+        results = {}
+        with phase('search'):
+            for result in find_key(term, self.pw_client.pw_dict, index):
+                results.setdefault(result['section'], []).append(result['entity'])
+        return results
+
+    def suggest(self, term: str, limit: int = 5) -> List[Tuple[str, str]]:
+        """(section, entity) of the entities with names similar to `term`."""
+        with phase('search'):
+            return self.pw_client.get_index().find_fuzzy(term, limit)
+
+    def search(self, value: str, key: str = None) -> List[Tuple[str, str]]:
+        """(section, entity) of the entities with a `key` (default: any key
+        but the passwords) of `value`, case insensitive. See pw_search."""
+        with phase('search'):
+            return self.get_search_index().search(value, key)
+
+    def get_search_index(self):
+        """The BlindIndex of the vault, brought up to date with the secrets data.
+
+        Created on first use, which decrypts all values but the passwords once."""
+        from .pw_search import BlindIndex
+        index = self._load_search_index()
+        is_new = index is None
+        if is_new:
+            index = self._search_index = BlindIndex(self._search_index_path(), self._get_secret())
+        if index.refresh(self.pw_client.pw_dict, self._decrypt_fields) or is_new \
+                or self._search_index_changed:
+            index.save()
+            self._search_index_changed = False
+        return index
+
+    def list_backups(self) -> List[str]:
+        return self.pw_client.list_backups()
+
+    def restore_backup(self, name: str):
+        if name not in self.pw_client.list_backups():
+            raise KeyError(name)
+        self.pw_client.restore_backup(name)
+
+    def _record_version(self, section: str, entity: str, keys: Iterable[str]):
+        """Keep the current values of the `keys` of an entity, which a change
+        is about to replace, in its history. Callers hold the write lock."""
+        if self.pw_config.history_depth <= 0:
+            return
+        current = self.pw_client.pw_dict.get(section, {}).get(entity) or {}
+        version = (section, entity, get_timestamp(), {key: current.get(key) for key in keys})
+        if self._transaction_depth:
+            self._versions.append(version)
+        else:
+            self.history.append(*version)
+
+    def _save_versions(self):
+        for version in self._versions:
+            self.history.append(*version)
+        self._versions = []
+
+    def _search_index_path(self) -> str:
+        from .pw_search import get_search_index_path
+        return get_search_index_path(self.pw_client)
+
+    def _get_secret(self) -> bytes:
+        key = self.pw_config.encryption_key
+        return key if isinstance(key, bytes) else key.encode('utf-8')
+
+    def _load_search_index(self):
+        if self._search_index is None:
+            from .pw_search import BlindIndex
+            self._search_index = BlindIndex.load(self._search_index_path(), self._get_secret())
+        return self._search_index
+
+    def _update_search_index(self, method: str, *args, **kwargs):
+        """Apply a change to the search index if it is loaded already (e.g. in
+        `pw agent`), which saves decrypting the changed values again on the
+        next search. It is saved by that search: writes never load or
+        rewrite the index file, the next search notices their changes."""
+        if self._search_index is not None:
+            getattr(self._search_index, method)(*args, **kwargs)
+            self._search_index_changed = True
+
+    def _decrypt_fields(self, section: str,
+                        encrypted: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+        """Decrypt {entity: {key: encrypted value}} of a section in one pass."""
+        crypto = self.get_crypto(section)
+        items = [(entity, key, value) for entity, fields in encrypted.items()
+                 for key, value in fields.items()]
+        with phase('decrypt'):
+            values = crypto.decrypt_many(value for _, _, value in items)
+        decrypted = {entity: {} for entity in encrypted}
+        for (entity, key, _), value in zip(items, values):
+            decrypted[entity][key] = value
+        return decrypted
+
+    def _encrypt(self, section: str, fields: Dict[str, str]) -> Dict[str, str]:
+        keys = list(fields)
+        with phase('encrypt'):
+            values = self.get_crypto(section).encrypt_many(fields[key] for key in keys)
+        return dict(zip(keys, values))
+
+
+def get_timestamp() -> str:
+    """The current time in UTC as ISO 8601, as stored in the metadata keys."""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """Seconds since the epoch of a timestamp from `get_timestamp`."""
+    import calendar
+    return calendar.timegm((int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                            int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19])))
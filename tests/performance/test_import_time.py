@@ -0,0 +1,40 @@
+"""Cold start regression benchmark of the `pw` command.
+
+Every `pw` call imports `pw.pw_cli` in a fresh interpreter, so its import
+time is part of the latency of every lookup. The budget can be adjusted
+for slow machines with PW_IMPORT_TIME_BUDGET_MS.
+"""
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "src")
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("PW_IMPORT_TIME_BUDGET_MS", 150))
+# Only imported on the code paths that need them
+DEFERRED_MODULES = ("argparse", "pprint", "pyperclip", "cryptography", "pw.pw_agent", "pw.pw_backup")
+
+
+def _import_times(statement: str) -> dict:
+    """Cumulative import time in microseconds per module, from `python -X importtime`."""
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(SRC_DIR))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_time_is_within_budget():
+    # Best of three to keep noise from other processes out
+    import_time_ms = min(_import_times("import pw.pw_cli")["pw.pw_cli"] for _ in range(3)) / 1000
+    assert import_time_ms < IMPORT_TIME_BUDGET_MS
+
+
+def test_cli_defers_heavy_imports():
+    times = _import_times("import pw.pw_cli")
+    assert [m for m in DEFERRED_MODULES if m in times] == []
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+from pw.pw_config import PWConfig, get_test_config
+from pw.pw_vault import Vault
+
+
+@pytest.fixture
+def write_vault(tmp_path):
+    """Write a vault file into tmp_path and return its PWConfig.
+
+    The values of `pw_dict` are encrypted with the key of the test config,
+    unless `encrypt` is False (values that are encrypted already, or tests
+    of the storage that never decrypt)."""
+    def write_vault(pw_dict: dict, file_name: str = "vault.json",
+                    encrypt: bool = True, indent: int = None) -> PWConfig:
+        key = get_test_config().encryption_key
+        if encrypt:
+            crypto = SynchronousEncryptionFernet(key)
+            pw_dict = {
+                section: {entity: {k: crypto.encrypt(v) for k, v in secrets_data.items()}
+                          for entity, secrets_data in entities.items()}
+                for section, entities in pw_dict.items()
+            }
+        with open(tmp_path / file_name, "w") as f:
+            json.dump(pw_dict, f, indent=indent)
+        return PWConfig(str(tmp_path), file_name, key)
+    return write_vault
+
+
+@pytest.fixture
+def pw_config(write_vault):
+    return write_vault({"main": {"guitar": {"password": "pink_floyd"}}})
+
+
+@pytest.fixture
+def vault(pw_config):
+    return Vault.from_config(pw_config)
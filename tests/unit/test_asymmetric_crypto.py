@@ -12,3 +12,13 @@ def test_asymmetric_crypto():
     encrypted_message = encrypt(bytes(message.encode("UTF-8")), pubk)
     decrypted_message = decrypt(encrypted_message, prik)
     assert message == decrypted_message.decode("UTF-8")
+
+
+def test_load_existing_key(tmp_path):
+    from src.crypto.asymmetric_encryption import load_existing_key, serialize_private_key
+
+    prik = generate_private_rsa_2048_key()
+    path = tmp_path / "key.pem"
+    path.write_bytes(serialize_private_key(prik))
+    loaded = load_existing_key(str(path))
+    assert decrypt(encrypt(b"riff", prik.public_key()), loaded) == b"riff"
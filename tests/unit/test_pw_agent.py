@@ -0,0 +1,57 @@
+import os
+import json
+import socket
+import threading
+import time
+
+from pw import pw_agent
+from pw.pw_agent import PasswordAgent, forward_to_agent, _send
+from pw.pw_config import get_test_config
+
+
+def test_commands_are_forwarded_to_the_agent(write_vault, tmp_path, capsys):
+    with open(os.path.join(get_test_config().creds_dir, "test_data.json")) as f:
+        pw_config = write_vault(json.load(f), encrypt=False)
+    socket_path = str(tmp_path / "agent.sock")
+    pw_config.agent_socket_path = socket_path
+    agent = PasswordAgent(pw_config, socket_path, timeout=10)
+    thread = threading.Thread(target=agent.serve)
+    thread.start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+
+    try:
+        is_forwarded, result = forward_to_agent(["-as"], pw_config)
+        assert is_forwarded and result is True
+        assert "['main', 'test']" in capsys.readouterr().out
+
+        is_forwarded, result = forward_to_agent(["--no-such-option"], pw_config)
+        assert is_forwarded and result == 2
+        captured = capsys.readouterr()
+        assert "usage:" in captured.err and not captured.out
+        assert "usage:" in _send(socket_path, {"args": ["--no-such-option"]})["stderr"]
+    finally:
+        _send(socket_path, {"stop": True})
+        thread.join()
+
+    assert not os.path.exists(socket_path)
+    assert forward_to_agent(["-as"], pw_config) == (False, None)
+
+
+def test_stalled_connections_do_not_block_the_agent(pw_config, tmp_path, monkeypatch):
+    monkeypatch.setattr(pw_agent, "CONNECTION_TIMEOUT", 0.1)
+    socket_path = str(tmp_path / "agent.sock")
+    pw_config.agent_socket_path = socket_path
+    thread = threading.Thread(target=PasswordAgent(pw_config, socket_path, timeout=10).serve)
+    thread.start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled:
+        stalled.connect(socket_path)  # and never sends a request
+        try:
+            assert _send(socket_path, {"ping": True}) == {"pong": True}
+            assert stalled.recv(1) == b""  # closed by the agent
+        finally:
+            _send(socket_path, {"stop": True})
+            thread.join()
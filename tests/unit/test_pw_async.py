@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+from pw.pw_async import AsyncVault
+from pw.pw_json_client import SecretsDataJSONClient
+
+
+@pytest.fixture
+def pw_config(write_vault):
+    return write_vault({"main": {"guitar": {"password": "pink_floyd", "brand": "fender"}}})
+
+
+def test_concurrent_reads_share_one_decryption(pw_config):
+    async def main():
+        vault = await AsyncVault.open(pw_config)
+        calls = []
+        decrypt = vault.vault.crypto.decrypt
+        vault.vault.crypto.decrypt = lambda value: calls.append(value) or decrypt(value)
+
+        values = await asyncio.gather(*(vault.get("main", "guitar") for _ in range(10)))
+
+        assert values == ["pink_floyd"] * 10
+        assert len(calls) == 1
+        assert await vault.get_fields("main", "guitar") == {
+            "password": "pink_floyd", "brand": "fender"}
+        with pytest.raises(KeyError):
+            await vault.get("main", "amp")
+
+    asyncio.run(main())
+
+
+def test_writes_and_reloads_after_changes_on_disk(pw_config):
+    async def main():
+        async with await AsyncVault.open(pw_config, check_interval=0) as vault:
+            await vault.add("main", "amp", {"password": "marshall"})
+            assert await vault.get("main", "amp") == "marshall"
+
+            other = SecretsDataJSONClient(pw_config.creds_dir, "vault.json")
+            crypto = SynchronousEncryptionFernet(pw_config.encryption_key)
+            other.set_secrets_data("main", "bass", {"password": crypto.encrypt("jazz")})
+
+            assert await vault.get("main", "bass") == "jazz"
+            assert sorted(await vault.entities("main")) == ["amp", "bass", "guitar"]
+
+    asyncio.run(main())
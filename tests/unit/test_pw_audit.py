@@ -0,0 +1,68 @@
+import json
+import time
+
+import pytest
+
+from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+from pw.pw_audit import audit_command, audit_vault, estimate_entropy
+from pw.pw_config import get_test_config
+from pw.pw_vault import Vault
+
+STRONG = "kL9#mQ2$vX7!pR4&wZ8^"
+
+
+@pytest.fixture
+def pw_config(write_vault):
+    crypto = SynchronousEncryptionFernet(get_test_config().encryption_key)
+    old_token = crypto.cipher.encrypt_at_time(b"Tr0ub4dor&3xyzAB", int(time.time()) - 400 * 86400)
+    return write_vault({
+        "main": {
+            "aws": {"password": crypto.encrypt(STRONG)},
+            "guitar": {"password": crypto.encrypt("pinkfloyd")},
+            "amp": {"password": old_token.decode()},
+        },
+        "dev": {"aws_dev": {"password": crypto.encrypt(STRONG)}},
+    }, encrypt=False)
+
+
+def test_estimate_entropy():
+    assert estimate_entropy("") == 0
+    assert estimate_entropy("aaaaaaaaaaaa") == 0
+    assert estimate_entropy("abcabcabcabc") < estimate_entropy("abcdefghijkl") < 60
+    assert estimate_entropy(STRONG) > 100
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_audit_vault(pw_config, workers):
+    report = audit_vault(Vault.from_config(pw_config), workers=workers, chunk_size=1)
+
+    assert report.n_passwords == 4
+    assert report.reused == [[("dev", "aws_dev"), ("main", "aws")]]
+    assert [(a.entity, a.length) for a in report.weak] == [("guitar", 9)]
+    assert [(a.entity, round(a.age_days), a.age_is_estimated) for a in report.old] == [
+        ("amp", 400, True)]
+
+
+def test_metadata_ages_and_hides(pw_config):
+    vault = Vault.from_config(pw_config)
+    vault.add("main", "drums", {"password": STRONG + "!"})
+    assert vault.keys("main", "drums") == ["password"]
+    assert set(vault.get_metadata("main", "drums")) == {"_created", "_modified", "_password_modified"}
+
+    vault.rotate_password("main", "amp", STRONG + "?")
+    report = audit_vault(vault, section="main")
+    assert report.old == [] and report.reused == []
+
+
+def test_other_changes_do_not_refresh_the_password_age(pw_config):
+    vault = Vault.from_config(pw_config)
+    vault.set_fields("main", "amp", {"website": "marshall.com"})
+    assert [a.entity for a in audit_vault(vault, section="main").old] == ["amp"]
+    assert "_password_modified" not in vault.get_metadata("main", "amp")
+
+
+def test_audit_command(pw_config, capsys):
+    assert not audit_command(["--workers", "0", "--format", "json"], pw_config)
+    report = json.loads(capsys.readouterr().out)
+    assert report["weak"] == [{"section": "main", "entity": "guitar", "length": 9, "entropy": 42.3}]
+    assert "pinkfloyd" not in json.dumps(report)
@@ -0,0 +1,82 @@
+import os
+
+from pw.pw_backup import SecretsDataBackups
+
+
+def test_unchanged_secrets_data_is_not_snapshotted_twice(tmp_path):
+    backups = SecretsDataBackups(str(tmp_path))
+    pw_dict = {"main": {"guitar": {"password": "a"}, "amp": {"password": "b"}}}
+
+    first = backups.create_snapshot(pw_dict)
+    assert backups.create_snapshot(pw_dict) is None
+
+    pw_dict["main"]["amp"] = {"password": "c"}
+    second = backups.create_snapshot(pw_dict)
+
+    assert backups.list_snapshots() == [first, second]
+    # "guitar" is shared by both snapshots
+    assert len(os.listdir(backups.objects_dir_path)) == 3
+    assert backups.load_snapshot(first)["main"]["amp"] == {"password": "b"}
+    assert backups.load_snapshot(second) == pw_dict
+
+
+def test_retention_drops_old_snapshots_and_objects(tmp_path):
+    backups = SecretsDataBackups(str(tmp_path), keep_last=2, keep_daily=0)
+    for i in range(4):
+        backups.create_snapshot({"main": {"guitar": {"password": str(i)}}})
+
+    snapshots = backups.list_snapshots()
+    assert len(snapshots) == 2
+    assert backups.load_snapshot(snapshots[-1]) == {"main": {"guitar": {"password": "3"}}}
+    assert len(os.listdir(backups.objects_dir_path)) == 2
+
+
+def _snapshot_file(backups, name):
+    return next(f for f in os.listdir(backups.snapshots_dir_path) if f.startswith(name))
+
+
+def test_recorded_changes_give_delta_snapshots(tmp_path):
+    backups = SecretsDataBackups(str(tmp_path))
+    pw_dict = {"main": {"guitar": {"password": "a"}, "amp": {"password": "b"}}, "old": {"x": {}}}
+    full = backups.create_snapshot(pw_dict, ("v", 1))
+
+    pw_dict["main"]["amp"] = {"password": "c"}
+    del pw_dict["main"]["guitar"]
+    del pw_dict["old"]
+    pw_dict["new"] = {"drums": {"password": "d"}}
+    backups.record_changes([
+        {"op": "set", "section": "main", "entity": "amp"},
+        {"op": "batch", "records": [{"op": "remove", "section": "main", "entity": "guitar"},
+                                    {"op": "remove_section", "section": "old"}]},
+        {"op": "create_section", "section": "new"},
+        {"op": "set", "section": "new", "entity": "drums"},
+    ], ("v", 1), ("v", 2))
+    delta = backups.create_snapshot(pw_dict, ("v", 2))
+
+    assert _snapshot_file(backups, delta).endswith(".delta.json")
+    snapshot = backups._read_snapshot(delta)
+    assert snapshot["removed"] == ["old"] and list(snapshot["replaced"]) == ["new"]
+    assert list(snapshot["changed"]) == ["main"] and snapshot["changed"]["main"]["guitar"] is None
+    assert backups.load_snapshot(delta) == pw_dict
+    assert backups.load_snapshot(full)["main"]["guitar"] == {"password": "a"}
+    assert backups.create_snapshot(pw_dict, ("v", 2)) is None  # nothing changed since
+
+
+def test_unrecorded_changes_give_a_full_snapshot(tmp_path):
+    backups = SecretsDataBackups(str(tmp_path))
+    backups.create_snapshot({"main": {"guitar": {"password": "a"}}}, ("v", 1))
+    name = backups.create_snapshot({"main": {"guitar": {"password": "b"}}}, ("v", 2))
+
+    assert not _snapshot_file(backups, name).endswith(".delta.json")
+
+
+def test_retention_keeps_the_snapshots_that_deltas_build_on(tmp_path):
+    backups = SecretsDataBackups(str(tmp_path), keep_last=2, keep_daily=0)
+    backups.create_snapshot({"main": {"guitar": {"password": "0"}}}, ("v", 0))
+    for i in range(1, 4):
+        backups.record_changes([{"op": "set", "section": "main", "entity": "guitar"}],
+                               ("v", i - 1), ("v", i))
+        backups.create_snapshot({"main": {"guitar": {"password": str(i)}}}, ("v", i))
+
+    assert len(backups.list_snapshots()) == 4  # the full one and its three deltas
+    assert backups.load_snapshot(backups.list_snapshots()[-1]) == {"main": {"guitar": {"password": "3"}}}
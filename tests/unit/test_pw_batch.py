@@ -0,0 +1,63 @@
+import io
+import json
+import os
+import subprocess
+
+import pytest
+
+from pw.pw_batch import get_command, parse_refs
+
+
+@pytest.fixture
+def pw_config(write_vault):
+    return write_vault({
+        "main": {"guitar": {"password": "pink_floyd", "brand": "fender"}},
+        "test": {"kafka": {"password": 'a"b'}, "deploy": {"password": "${HOME}$HOME`id`\\"}},
+    })
+
+
+def test_parse_refs():
+    refs, errors = parse_refs(["main/guitar/brand\n", "DB=test/kafka", "# comment", "", "guitar"])
+    assert [tuple(ref) for ref in refs] == [
+        ("main/guitar/brand", "main", "guitar", "brand"),
+        ("DB", "test", "kafka", "password"),
+    ]
+    assert list(errors) == ["guitar"]
+
+
+def test_batch_from_stdin_as_json(pw_config, capsys, monkeypatch):
+    monkeypatch.setattr("sys.stdin", io.StringIO("main/guitar/brand\nmain/guitar/model\nmain/amp\n"))
+
+    assert get_command(["--batch"], pw_config) is False
+
+    out, err = capsys.readouterr()
+    assert json.loads(out) == {"main/guitar/brand": "fender"}
+    assert err.splitlines() == [
+        'main/guitar/model: key "model" not found for "guitar"',
+        'main/amp: entity "amp" not found in section "main"',
+    ]
+
+
+def test_dotenv(pw_config, capsys):
+    assert get_command(["--format", "dotenv", "main/guitar", "db_password=test/kafka"], pw_config)
+    assert capsys.readouterr().out == 'MAIN_GUITAR="pink_floyd"\nDB_PASSWORD="a\\"b"\n'
+
+
+def test_dotenv_values_are_not_expanded(pw_config, tmp_path):
+    output = tmp_path / ".env"
+    assert get_command(["--format", "dotenv", "-o", str(output), "test/deploy"], pw_config)
+
+    assert output.read_text() == 'TEST_DEPLOY="\\${HOME}\\$HOME\\`id\\`\\\\"\n'
+    sourced = subprocess.run(["sh", "-c", f'. "{output}" && printf %s "$TEST_DEPLOY"'],
+                             capture_output=True, text=True, check=True)
+    assert sourced.stdout == "${HOME}$HOME`id`\\"
+
+
+def test_template(pw_config, tmp_path):
+    (tmp_path / "app.conf.tpl").write_text("user = {{ main/guitar/brand }}\npassword = {{main/guitar}}\n")
+    output = tmp_path / "app.conf"
+
+    assert get_command(["--template", str(tmp_path / "app.conf.tpl"), "-o", str(output)], pw_config)
+
+    assert output.read_text() == "user = fender\npassword = pink_floyd\n"
+    assert os.stat(output).st_mode & 0o777 == 0o600
@@ -0,0 +1,56 @@
+import json
+import os
+
+from pw.pw_binary_client import SecretsDataBinaryClient
+from pw.pw_config import get_test_config
+from pw.pw_storage import convert_secrets_data
+
+TEST_DATA_PATH = os.path.join(get_test_config().creds_dir, "test_data.json")
+
+
+def test_conversion_is_lossless(tmp_path):
+    convert_secrets_data(TEST_DATA_PATH, str(tmp_path / "vault.pwv"))
+    convert_secrets_data(str(tmp_path / "vault.pwv"), str(tmp_path / "vault.json"))
+
+    with open(TEST_DATA_PATH) as f:
+        expected = json.load(f)
+    with open(tmp_path / "vault.json") as f:
+        actual = json.load(f)
+    assert actual == expected
+    assert list(actual["main"]) == list(expected["main"])
+
+
+def test_binary_client_reads_and_writes(tmp_path):
+    convert_secrets_data(TEST_DATA_PATH, str(tmp_path / "vault.pwv"))
+    client = SecretsDataBinaryClient(str(tmp_path), "vault.pwv")
+    with open(TEST_DATA_PATH) as f:
+        expected = json.load(f)
+    assert client.pw_dict["main"]["guitar"] == expected["main"]["guitar"]
+    assert list(client.pw_dict) == ["main", "test"]
+
+    client.create_section("dev")
+    client.set_secrets_data("dev", "amp", {"password": "x"})
+    client.remove_secrets_data("main", "guitar")
+
+    reloaded = SecretsDataBinaryClient(str(tmp_path), "vault.pwv")
+    assert reloaded.pw_dict["dev"]["amp"] == {"password": "x"}
+    assert "guitar" not in reloaded.pw_dict["main"]
+    assert reloaded.pw_dict["test"]["kafka"] == expected["test"]["kafka"]
+
+
+def test_transaction_rewrites_the_file_once(tmp_path, monkeypatch):
+    convert_secrets_data(TEST_DATA_PATH, str(tmp_path / "vault.pwv"))
+    client = SecretsDataBinaryClient(str(tmp_path), "vault.pwv")
+    saves = []
+    save = client.save_dict_to_file
+    monkeypatch.setattr(client, "save_dict_to_file", lambda: saves.append(1) or save())
+
+    with client.transaction():
+        client.create_section("dev")
+        client.set_secrets_data("dev", "amp", {"password": "x"})
+        client.remove_secrets_data("main", "guitar")
+
+    assert len(saves) == 1
+    reloaded = SecretsDataBinaryClient(str(tmp_path), "vault.pwv")
+    assert reloaded.pw_dict["dev"]["amp"] == {"password": "x"}
+    assert "guitar" not in reloaded.pw_dict["main"]
@@ -0,0 +1,22 @@
+from pw.pw_cli import DEFAULT_ARGS, PasswordCommand
+
+
+def test_default_args_match_parser_defaults():
+    assert DEFAULT_ARGS == vars(PasswordCommand.parse_args([]))
+
+
+def test_plain_lookup_detection():
+    assert PasswordCommand.is_plain_lookup(["guitar"])
+    assert not PasswordCommand.is_plain_lookup(["guitar", "-k", "brand"])
+    assert not PasswordCommand.is_plain_lookup(["-as"])
+    assert not PasswordCommand.is_plain_lookup(["agent"])
+    assert PasswordCommand.is_plain_lookup(["--", "agent"])
+    assert not PasswordCommand.is_plain_lookup(["--", "agent", "-k", "brand"])
+
+
+def test_entities_named_like_a_subcommand(write_vault, monkeypatch, capsys):
+    monkeypatch.setenv("PW_NO_AGENT", "1")
+    pw_config = write_vault({"main": {"get": {"password": "x", "username": "kuda"}}})
+
+    assert PasswordCommand.run(["-ks", "--", "get"], pw_config)
+    assert "password, username" in capsys.readouterr().out
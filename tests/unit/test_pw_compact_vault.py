@@ -0,0 +1,50 @@
+import json
+import os
+
+from pw.pw_compact_vault import CompactSecretsData
+from pw.pw_config import get_test_config
+from pw.pw_journal import apply_record
+from pw.pw_json_client import SecretsDataJSONClient
+
+with open(os.path.join(get_test_config().creds_dir, "test_data.json")) as f:
+    TEST_DATA = json.load(f)
+
+
+def test_roundtrip_keeps_tokens_and_other_values():
+    pw_dict = dict(TEST_DATA, plain={"note": {"text": "not a token ü", "empty": ""}})
+    compact = CompactSecretsData.from_dict(pw_dict)
+    assert compact.to_dict() == pw_dict
+    assert compact["main"]["guitar"] == TEST_DATA["main"]["guitar"]
+    # Fernet tokens are stored decoded, i.e. smaller than their text
+    n_text_bytes = sum(len(v) for s in TEST_DATA.values() for e in s.values() for v in e.values())
+    assert len(compact.buffer) < n_text_bytes
+
+
+def test_journal_records_apply_to_compact_data():
+    compact = CompactSecretsData.from_dict(TEST_DATA)
+    expected = json.loads(json.dumps(TEST_DATA))
+    records = [
+        {"op": "create_section", "section": "dev"},
+        {"op": "set", "section": "dev", "entity": "amp", "data": {"password": "x"}},
+        {"op": "update", "section": "main", "entity": "guitar", "data": {"brand": "gibson"}},
+        {"op": "remove", "section": "main", "entity": "pytest"},
+        {"op": "remove_section", "section": "test"},
+    ]
+    for record in records:
+        apply_record(compact, record)
+        apply_record(expected, record)
+    assert compact.to_dict() == expected
+    # released values are dropped from the buffer eventually
+    assert compact.unused_bytes <= len(compact.buffer)
+
+
+def test_client_with_compact_memory(tmp_path):
+    with open(tmp_path / "vault.json", "w") as f:
+        json.dump(TEST_DATA, f)
+    client = SecretsDataJSONClient(str(tmp_path), "vault.json", compact=True)
+    assert isinstance(client.pw_dict, CompactSecretsData)
+    client.set_secrets_data("main", "amp", {"password": "x"})
+    client.save_dict_to_file()
+
+    with open(tmp_path / "vault.json") as f:
+        assert json.load(f) == dict(TEST_DATA, main=dict(TEST_DATA["main"], amp={"password": "x"}))
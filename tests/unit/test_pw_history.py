@@ -0,0 +1,117 @@
+import pytest
+
+from pw import pw_history
+from pw.pw_history import VersionHistory, history_command, revert_command
+from pw.pw_vault import Vault
+
+
+def test_versions_keep_only_the_changed_fields(vault):
+    vault.set_fields("main", "guitar", {"brand": "fender"})
+    vault.rotate_password("main", "guitar", "wish_you_were_here")
+
+    latest, first = vault.get_history("main", "guitar")
+    assert set(latest.fields) == {"password", "_modified", "_password_modified"}
+    assert vault.crypto.decrypt(latest.fields["password"]) == "pink_floyd"
+    assert first.fields == {"brand": None, "_modified": None}  # added by the change
+
+
+def test_revert(vault):
+    vault.set_fields("main", "guitar", {"brand": "fender"})
+    vault.rotate_password("main", "guitar", "wish_you_were_here")
+
+    vault.revert("main", "guitar", version=2)
+    assert vault.get_fields("main", "guitar") == {"password": "pink_floyd"}
+    vault.revert("main", "guitar")  # the revert itself
+    assert vault.get_fields("main", "guitar") == {
+        "password": "wish_you_were_here", "brand": "fender"}
+
+    with pytest.raises(KeyError):
+        vault.revert("main", "guitar", version=5)
+    with pytest.raises(ValueError):
+        vault.revert("main", "guitar", version=0)
+
+
+def test_revert_a_deleted_entity(vault):
+    vault.delete("main", "guitar")
+    vault.revert("main", "guitar")
+    assert vault.get("main", "guitar") == "pink_floyd"
+
+    vault.revert("main", "guitar")
+    assert not vault.has_entity("main", "guitar")
+
+
+def test_transaction_records_nothing_on_an_exception(vault):
+    with pytest.raises(RuntimeError):
+        with vault.transaction():
+            vault.rotate_password("main", "guitar")
+            raise RuntimeError()
+    assert vault.get_history("main", "guitar") == []
+
+
+def test_depth_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(pw_history, "COMPACTION_MIN_BYTES", 0)
+    history = VersionHistory(str(tmp_path / "history.jsonl"), depth=3)
+    for i in range(10):
+        history.append("main", "guitar", f"2026-10-18T08:00:{i:02d}Z", {"password": str(i)})
+        history.append("main", "amp", f"2026-10-18T08:00:{i:02d}Z", {"password": str(i)})
+
+    assert [v.fields["password"] for v in history.get_versions("main", "guitar")] == ["9", "8", "7"]
+    with open(history.path) as f:
+        assert len(f.readlines()) <= 1 + 2 * 2 * 3  # header, twice the compacted versions
+
+
+def test_torn_lines_are_skipped_and_cut(vault, monkeypatch):
+    vault.set_fields("main", "guitar", {"brand": "fender"})
+    with open(vault.history.path, "a") as f:
+        f.write('{"section": "main", "entity": "gui')
+    vault.set_fields("main", "guitar", {"brand": "gibson"})
+    with open(vault.history.path, "a") as f:
+        f.write('{"section": "main"}\n')  # damaged some other way
+    assert len(vault.get_history("main", "guitar")) == 2
+
+    monkeypatch.setattr(pw_history, "COMPACTION_MIN_BYTES", 0)
+    vault.set_fields("main", "guitar", {"brand": "ibanez"})  # compacts
+    assert len(vault.get_history("main", "guitar")) == 3
+
+
+def test_unreadable_header_keeps_the_history(vault):
+    vault.set_fields("main", "guitar", {"brand": "fender"})
+    with open(vault.history.path) as f:
+        lines = f.readlines()
+    with open(vault.history.path, "w") as f:
+        f.writelines(["garbage\n"] + lines[1:])
+    vault.set_fields("main", "guitar", {"brand": "gibson"})
+    assert len(vault.get_history("main", "guitar")) == 2
+
+
+def test_lookups_do_not_read_the_history(vault, monkeypatch):
+    vault.rotate_password("main", "guitar")
+    reader = Vault.from_config(vault.pw_config)
+    monkeypatch.setattr(VersionHistory, "_read_records", None)
+
+    assert reader.get_fields("main", "guitar")
+    assert reader._history is None
+
+
+def test_commands(pw_config, capsys):
+    vault = Vault.from_config(pw_config)
+    vault.set_fields("main", "guitar", {"brand": "fender"})
+    vault.set_fields("main", "guitar", {"brand": "gibson"})
+
+    assert history_command(["guitar", "--values"], pw_config)
+    out = capsys.readouterr().out
+    assert "brand: fender" in out and "brand: (added by the change)" in out
+
+    assert revert_command(["guitar", "--version", "2"], pw_config)
+    assert Vault.from_config(pw_config).keys("main", "guitar") == ["password"]
+    assert not revert_command(["amp"], pw_config)
+    assert not history_command(["amp"], pw_config)
+
+
+def test_revert_an_entity_of_a_removed_section(vault):
+    vault.add("music", "amp", {"password": "marshall", "brand": "vox"})
+    vault.remove_section("music")
+    assert not vault.has_section("music")
+
+    vault.revert("music", "amp")
+    assert vault.get_fields("music", "amp") == {"password": "marshall", "brand": "vox"}
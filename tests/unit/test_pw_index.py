@@ -0,0 +1,29 @@
+from pw.pw_index import EntityIndex
+
+PW_DICT = {
+    "main": {"GitHub": {}, "gitlab": {}, "guitar": {}, "aws-prod": {}},
+    "test": {"github-actions": {}, "kafka": {}},
+}
+
+
+def test_find_substring_and_prefix():
+    index = EntityIndex.build(PW_DICT)
+    assert index.find("git") == [("main", "GitHub"), ("main", "gitlab"), ("test", "github-actions")]
+    assert index.find("hub") == [("main", "GitHub"), ("test", "github-actions")]
+    assert index.find("ka") == [("test", "kafka")]
+    assert index.find_prefix("gi") == [("main", "GitHub"), ("main", "gitlab"), ("test", "github-actions")]
+    assert index.find("nothing") == []
+
+
+def test_find_fuzzy_ranks_closest_names_first():
+    index = EntityIndex.build(PW_DICT)
+    assert index.find_fuzzy("githbu", limit=2) == [("main", "GitHub"), ("main", "gitlab")]
+
+
+def test_incremental_updates():
+    index = EntityIndex.build(PW_DICT)
+    index.apply_record({"op": "set", "section": "main", "entity": "kafka-ui", "data": {}})
+    index.apply_record({"op": "remove_section", "section": "test"})
+
+    assert index.find("kafka") == [("main", "kafka-ui")]
+    assert index.find("github") == [("main", "GitHub")]
@@ -0,0 +1,63 @@
+import json
+import os
+
+import pytest
+
+from pw.pw_json_client import SecretsDataJSONClient
+
+
+@pytest.fixture
+def client(write_vault, tmp_path):
+    write_vault({"main": {"guitar": {"password": "a"}}}, encrypt=False)
+    return SecretsDataJSONClient(str(tmp_path), "vault.json")
+
+
+def test_mutations_are_appended_to_journal(client, tmp_path):
+    client.create_section("dev")
+    client.set_secrets_data("dev", "kafka", {"password": "b"})
+    client.update_secrets_data("main", "guitar", {"brand": "c"})
+    client.remove_secrets_data("main", "guitar")
+
+    with open(tmp_path / "vault.json") as f:
+        assert json.load(f) == {"main": {"guitar": {"password": "a"}}}
+
+    reloaded = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    assert reloaded.pw_dict == {"main": {}, "dev": {"kafka": {"password": "b"}}}
+
+
+def test_compaction_rewrites_file_and_clears_journal(client, tmp_path):
+    client.set_secrets_data("main", "amp", {"password": "d"})
+    client.save_dict_to_file()
+
+    assert not os.path.exists(client.journal.journal_path)
+    with open(tmp_path / "vault.json") as f:
+        assert json.load(f)["main"]["amp"] == {"password": "d"}
+
+
+def test_torn_journal_record_is_ignored(client, tmp_path):
+    client.set_secrets_data("main", "amp", {"password": "d"})
+    with open(client.journal.journal_path, "a") as f:
+        f.write('{"op": "remove", "section": "ma')
+
+    reloaded = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    assert reloaded.pw_dict["main"]["amp"] == {"password": "d"}
+
+
+def test_torn_journal_record_is_cut_before_the_next_append(client, tmp_path):
+    client.set_secrets_data("main", "amp", {"password": "d"})
+    with open(client.journal.journal_path, "a") as f:
+        f.write('{"op": "remove", "section": "ma')
+    client.set_secrets_data("main", "drums", {"password": "e"})
+
+    reloaded = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    assert reloaded.pw_dict["main"]["amp"] == {"password": "d"}
+    assert reloaded.pw_dict["main"]["drums"] == {"password": "e"}
+
+
+def test_rewrites_keep_the_permissions_of_the_file(client, tmp_path):
+    os.chmod(tmp_path / "vault.json", 0o600)
+    client.set_secrets_data("main", "amp", {"password": "d"})
+    assert os.stat(client.journal.journal_path).st_mode & 0o777 == 0o600
+    with client.write_lock():
+        client.save_dict_to_file()
+    assert os.stat(tmp_path / "vault.json").st_mode & 0o777 == 0o600
@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from pw import pw_lazy_json
+from pw.pw_config import get_test_config
+from pw.pw_json_client import SecretsDataJSONClient
+from pw.pw_lazy_json import LazySecretsData, scan_offsets
+
+with open(os.path.join(get_test_config().creds_dir, "test_data.json")) as f:
+    TEST_DATA = json.load(f)
+
+
+@pytest.mark.parametrize("indent", [None, 4])
+def test_offsets_point_at_the_secrets_data(indent):
+    text = json.dumps(dict(TEST_DATA, empty={}), indent=indent)
+    offsets = scan_offsets(text)
+    assert list(offsets) == ["main", "test", "empty"]
+    for section, (entities, positions) in offsets.items():
+        assert entities == list(dict(TEST_DATA, empty={})[section])
+        for i, entity in enumerate(entities):
+            start, end = positions[2 * i:2 * i + 2]
+            assert json.loads(text[start:end]) == TEST_DATA[section][entity]
+    with pytest.raises(ValueError):
+        scan_offsets('{"main": []}')
+
+
+def test_lazy_client_parses_only_what_is_read(write_vault, tmp_path, monkeypatch):
+    write_vault(TEST_DATA, encrypt=False, indent=2)
+    SecretsDataJSONClient(str(tmp_path), "vault.json", lazy=True)  # writes the sidecar
+    assert os.path.exists(tmp_path / "vault.json.offsets.json")
+
+    def fail(*args):
+        raise AssertionError("parsed the whole file")
+    monkeypatch.setattr(pw_lazy_json, "scan_offsets", fail)
+    monkeypatch.setattr(SecretsDataJSONClient, "get_pws_from_json_file", fail)
+
+    client = SecretsDataJSONClient(str(tmp_path), "vault.json", lazy=True)
+    assert isinstance(client.pw_dict, LazySecretsData)
+    assert client.pw_dict["main"]["guitar"] == TEST_DATA["main"]["guitar"]
+    assert "kafka" in client.pw_dict["test"]
+
+
+def test_journal_and_writes_with_lazy_loading(write_vault, tmp_path):
+    write_vault(TEST_DATA, encrypt=False)
+    client = SecretsDataJSONClient(str(tmp_path), "vault.json", lazy=True)
+    client.set_secrets_data("dev", "amp", {"password": "x"})
+    client.remove_secrets_data("main", "guitar")
+    assert isinstance(client.pw_dict, dict)  # writes use the full secrets data
+
+    # the journal is replayed on top of the lazily loaded file
+    reloaded = SecretsDataJSONClient(str(tmp_path), "vault.json", lazy=True)
+    assert isinstance(reloaded.pw_dict, LazySecretsData)
+    assert reloaded.pw_dict["dev"]["amp"] == {"password": "x"}
+    assert "guitar" not in reloaded.pw_dict["main"]
+    assert reloaded.pw_dict.to_dict() == client.pw_dict
+
+
+def test_non_ascii_files_are_loaded_completely(tmp_path):
+    with open(tmp_path / "vault.json", "w", encoding="utf-8") as f:
+        json.dump({"main": {"café": {"password": "a"}}}, f, ensure_ascii=False)
+    client = SecretsDataJSONClient(str(tmp_path), "vault.json", lazy=True)
+    assert client.pw_dict == {"main": {"café": {"password": "a"}}}
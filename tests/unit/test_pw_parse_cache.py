@@ -0,0 +1,107 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from pw import pw_json_client, pw_parse_cache
+from pw.pw_json_client import SecretsDataJSONClient
+from pw.pw_parse_cache import ParseCache
+
+PW_DICT = {"main": {"guitar": {"password": "gAAAA-1"}}, "test": {"amp": {"password": "gAAAA-2"}}}
+
+
+@pytest.fixture
+def vault_path(write_vault):
+    pw_config = write_vault(PW_DICT, encrypt=False)
+    return os.path.join(pw_config.creds_dir, pw_config.creds_file_name)
+
+
+def _parse_counter():
+    calls = []
+
+    def parse(content):
+        calls.append(content)
+        return json.loads(content)
+    return parse, calls
+
+
+def _age(path, seconds=10):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - seconds * 10**9))
+
+
+def test_unchanged_file_is_not_parsed_again(vault_path):
+    _age(vault_path)
+    cache = ParseCache(f"{vault_path}.cache", f"{vault_path}.cache.key")
+    parse, calls = _parse_counter()
+
+    assert cache.load(vault_path, parse) == PW_DICT
+    assert cache.load(vault_path, parse) == PW_DICT
+    os.utime(vault_path)  # touched, but not changed: hashed instead of parsed
+    assert cache.load(vault_path, parse) == PW_DICT
+    assert len(calls) == 1
+
+    with open(vault_path, "w") as f:
+        json.dump({"main": {}}, f)
+    assert cache.load(vault_path, parse) == {"main": {}}
+    assert len(calls) == 2
+    assert os.stat(f"{vault_path}.cache.key").st_mode & 0o777 == 0o600
+
+
+def test_recently_changed_file_is_hashed(vault_path):
+    cache = ParseCache(f"{vault_path}.cache", f"{vault_path}.cache.key")
+    cache.load(vault_path, json.loads)
+
+    # Same stat, other content, e.g. two writes within the resolution of the mtime
+    stat = os.stat(vault_path)
+    with open(vault_path, "r+") as f:
+        f.write(json.dumps(PW_DICT).replace("gAAAA-1", "gAAAA-3"))
+    os.utime(vault_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert cache.load(vault_path, json.loads)["main"]["guitar"]["password"] == "gAAAA-3"
+
+
+def test_tampered_cache_is_not_loaded(vault_path):
+    _age(vault_path)
+    cache = ParseCache(f"{vault_path}.cache", f"{vault_path}.cache.key")
+    cache.load(vault_path, json.loads)
+    with open(cache.path, "rb") as f:
+        data = f.read()
+    with open(cache.path, "wb") as f:
+        f.write(data.replace(b"gAAAA-1", b"gAAAA-3"))
+
+    parse, calls = _parse_counter()
+    assert cache.load(vault_path, parse) == PW_DICT
+    assert len(calls) == 1
+
+
+def test_client_invalidates_the_cache_on_save(vault_path, monkeypatch):
+    vault_dir, vault_name = os.path.split(vault_path)
+    client = SecretsDataJSONClient(vault_dir, vault_name, parse_cache=True)
+    assert os.path.exists(f"{vault_path}.cache")
+
+    client.set_secrets_data("main", "amp", {"password": "gAAAA-4"})  # journal only
+    client.save_dict_to_file()
+    assert not os.path.exists(f"{vault_path}.cache")
+
+    monkeypatch.setattr(pw_parse_cache, "RACY_SECONDS", 0)
+    reloaded = SecretsDataJSONClient(vault_dir, vault_name, parse_cache=True)
+    assert reloaded.pw_dict["main"]["amp"] == {"password": "gAAAA-4"}
+    reloaded.set_secrets_data("main", "drums", {"password": "gAAAA-5"})
+
+    # Served from the cache, with the journal replayed on top
+    monkeypatch.setattr(pw_json_client, "json", SimpleNamespace(load=None, loads=None))
+    cached = SecretsDataJSONClient(vault_dir, vault_name, parse_cache=True)
+    assert cached.pw_dict["main"]["drums"] == {"password": "gAAAA-5"}
+
+
+def test_forged_cache_is_not_unmarshalled(vault_path, monkeypatch):
+    _age(vault_path)
+    ParseCache(f"{vault_path}.cache", f"{vault_path}.other.key").load(vault_path, json.loads)
+
+    def loads(data):
+        raise AssertionError("unmarshalled before the HMAC was checked")
+    monkeypatch.setattr(pw_parse_cache.marshal, "loads", loads)
+    cache = ParseCache(f"{vault_path}.cache", f"{vault_path}.cache.key")
+    assert cache.load(vault_path, json.loads) == PW_DICT
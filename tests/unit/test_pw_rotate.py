@@ -0,0 +1,49 @@
+import json
+import os
+
+from cryptography.fernet import Fernet
+
+from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+from pw.pw_json_client import SecretsDataJSONClient
+from pw.pw_rotate import KeyRotation, _rotate_chunk
+
+
+def _client(tmp_path, old_key):
+    crypto = SynchronousEncryptionFernet(old_key)
+    pw_dict = {
+        "main": {f"entity{i}": {"password": crypto.encrypt(f"pw{i}")} for i in range(5)},
+        "empty": {},
+    }
+    with open(tmp_path / "vault.json", "w") as f:
+        json.dump(pw_dict, f)
+    return SecretsDataJSONClient(str(tmp_path), "vault.json")
+
+
+def test_rotation_reencrypts_every_value(tmp_path):
+    old_key, new_key = Fernet.generate_key(), Fernet.generate_key()
+    client = _client(tmp_path, old_key)
+
+    n_values, _ = KeyRotation(client, old_key, new_key).run(workers=2, chunk_size=2)
+
+    assert n_values == 5
+    reloaded = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    crypto = SynchronousEncryptionFernet(new_key)
+    assert crypto.decrypt(reloaded.pw_dict["main"]["entity3"]["password"]) == "pw3"
+    assert reloaded.pw_dict["empty"] == {}
+    assert not os.path.exists(tmp_path / "vault.json.rotate.jsonl")
+
+
+def test_interrupted_rotation_resumes_from_checkpoint(tmp_path):
+    old_key, new_key = Fernet.generate_key(), Fernet.generate_key()
+    client = _client(tmp_path, old_key)
+    rotation = KeyRotation(client, old_key, new_key)
+    chunks = list(rotation._get_chunks(2))
+    chunk_id, rotated, _ = _rotate_chunk(old_key, new_key, chunks[0])
+    with open(rotation.checkpoint_path, "w") as f:
+        rotation._write_line(f, rotation._get_checkpoint_header())
+        rotation._write_line(f, {"chunk": chunk_id, "entities": rotated})
+
+    n_values, _ = rotation.run(workers=0, chunk_size=2)
+
+    assert n_values == 3  # the first chunk was not rotated again
+    assert client.pw_dict["main"]["entity0"] == rotated["entity0"]
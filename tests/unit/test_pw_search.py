@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+from pw.pw_search import BlindIndex, get_domain_suffixes, search_command
+from pw.pw_vault import Vault
+
+@pytest.fixture
+def pw_config(write_vault):
+    return write_vault({
+        "main": {
+            "aws": {"password": "x", "username": "Kuda", "website": "https://console.aws.com/s3"},
+            "guitar": {"password": "pink_floyd", "brand": "fender"},
+        },
+        "dev": {"aws_dev": {"password": "y", "username": "kuda ", "website": "aws.com"}},
+    })
+
+
+def test_get_domain_suffixes():
+    assert get_domain_suffixes("https://user@Console.AWS.amazon.com:443/s3") == [
+        "console.aws.amazon.com", "aws.amazon.com", "amazon.com"]
+    assert get_domain_suffixes("localhost") == ["localhost"]
+
+
+def test_search(pw_config):
+    vault = Vault.from_config(pw_config)
+
+    assert vault.search("KUDA", "username") == [("dev", "aws_dev"), ("main", "aws")]
+    assert vault.search("aws.com", "website") == [("dev", "aws_dev"), ("main", "aws")]
+    assert vault.search("*.aws.com", "website") == [("main", "aws")]
+    assert vault.search("fender") == [("main", "guitar")]
+    assert vault.search("pink_floyd") == []  # passwords are not indexed
+
+
+def test_index_stores_no_values(pw_config):
+    Vault.from_config(pw_config).search("kuda")
+
+    with open(os.path.join(pw_config.creds_dir, "vault.json.search.json")) as f:
+        text = f.read()
+    assert "kuda" not in text.lower() and "fender" not in text
+
+
+def _change(vault):
+    vault.add("main", "amp", {"password": "z", "username": "kuda"})
+    vault.set_fields("main", "guitar", {"brand": "gibson"})
+    vault.delete("dev", "aws_dev")
+
+
+def _assert_changed(vault):
+    assert vault.search("kuda", "username") == [("main", "amp"), ("main", "aws")]
+    assert vault.search("gibson", "brand") == [("main", "guitar")]
+
+
+def test_changes_do_not_write_the_index(pw_config):
+    Vault.from_config(pw_config).search("kuda")
+    path = os.path.join(pw_config.creds_dir, "vault.json.search.json")
+    stat = os.stat(path)
+
+    _change(Vault.from_config(pw_config))
+    assert os.stat(path).st_mtime_ns == stat.st_mtime_ns
+    _assert_changed(Vault.from_config(pw_config))  # noticed by the crc32
+
+
+def test_loaded_index_takes_changes_without_decryption(pw_config):
+    vault = Vault.from_config(pw_config)
+    vault.search("kuda")
+    _change(vault)
+
+    vault._decrypt_fields = None  # a search must not need to decrypt anything
+    _assert_changed(vault)
+    reader = Vault.from_config(pw_config)
+    reader._decrypt_fields = None  # saved by the search
+    _assert_changed(reader)
+
+
+def test_outside_changes_are_indexed_again(pw_config):
+    vault = Vault.from_config(pw_config)
+    vault.search("kuda")
+    vault.pw_client.update_secrets_data(
+        "main", "guitar", {"brand": SynchronousEncryptionFernet(pw_config.encryption_key).encrypt("gibson")})
+
+    assert Vault.from_config(pw_config).search("gibson") == [("main", "guitar")]
+    assert BlindIndex.load(
+        os.path.join(pw_config.creds_dir, "vault.json.search.json"), b"other key") is None
+
+
+def test_search_command(pw_config, capsys):
+    assert search_command(["username=kuda", "website=*.aws.com"], pw_config)
+    assert capsys.readouterr().out == "section main:\n  aws\n"
+    assert not search_command(["kuda", "-s", "test"], pw_config)
@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+from pw.pw_config import PWConfig, get_test_config
+from pw.pw_sharded_client import MANIFEST_NAME, SecretsDataShardedClient
+from pw.pw_storage import convert_secrets_data, get_secrets_data_client
+
+with open(os.path.join(get_test_config().creds_dir, "test_data.json")) as f:
+    TEST_DATA = json.load(f)
+
+
+@pytest.fixture
+def vault_dir(write_vault, tmp_path):
+    write_vault(TEST_DATA, encrypt=False)
+    convert_secrets_data(str(tmp_path / "vault.json"), str(tmp_path / "vault") + os.sep)
+    return str(tmp_path / "vault")
+
+
+def _manifest(vault_dir):
+    with open(os.path.join(vault_dir, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def test_convert_both_ways(vault_dir, tmp_path):
+    assert sorted(os.listdir(vault_dir)) == ["main.1.json", MANIFEST_NAME, "test.1.json"]
+    client = get_secrets_data_client(PWConfig(str(tmp_path), "vault", b""))
+    assert isinstance(client, SecretsDataShardedClient)
+
+    convert_secrets_data(vault_dir, str(tmp_path / "back.json"))
+    with open(tmp_path / "back.json") as f:
+        assert json.load(f) == TEST_DATA
+
+
+def test_reads_and_writes_touch_one_section(vault_dir):
+    client = SecretsDataShardedClient(*os.path.split(vault_dir))
+    assert list(client.pw_dict) == ["main", "test"]
+    assert client.pw_dict._sections == {}  # the manifest is enough to list the sections
+
+    client.set_secrets_data("test", "amp", {"password": "gAAAA"})
+    assert list(client.pw_dict._sections) == ["test"]  # the backup links the shards
+    shards = os.listdir(os.path.join(os.path.dirname(vault_dir), ".backups", "shards"))
+    assert sorted(name.rpartition("-")[2] for name in shards) == ["main.1.json", "test.1.json"]
+    assert _manifest(vault_dir)["sections"] == {"main": "main.1.json", "test": "test.2.json"}
+
+    client.remove_section("test")
+    assert sorted(os.listdir(vault_dir)) == ["main.1.json", MANIFEST_NAME]
+
+
+def test_transaction_and_other_processes(vault_dir):
+    client = SecretsDataShardedClient(*os.path.split(vault_dir))
+    other = SecretsDataShardedClient(*os.path.split(vault_dir))
+    with client.transaction():
+        client.create_section("new")
+        client.set_secrets_data("new", "amp", {"password": "gAAAA"})
+        client.remove_secrets_data("main", next(iter(TEST_DATA["main"])))
+    assert _manifest(vault_dir)["generation"] == 2
+
+    assert other.has_changed()
+    other.load()
+    assert other.pw_dict["new"] == {"amp": {"password": "gAAAA"}}
+    assert len(other.pw_dict["main"]) == len(TEST_DATA["main"]) - 1
+
+    with pytest.raises(RuntimeError):
+        with client.transaction():
+            client.remove_section("new")
+            raise RuntimeError()
+    assert "new" in client.pw_dict and "new" in _manifest(vault_dir)["sections"]
+
+
+def test_restore_backup(vault_dir):
+    client = SecretsDataShardedClient(*os.path.split(vault_dir))
+    client.remove_section("main")
+    client.restore_backup(client.list_backups()[-1])
+
+    reloaded = SecretsDataShardedClient(*os.path.split(vault_dir))
+    assert {section: dict(entities) for section, entities in reloaded.pw_dict.items()} == TEST_DATA
@@ -0,0 +1,138 @@
+import pytest
+
+from crypto.asymmetric_encryption import load_existing_key
+from crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+from pw.pw_json_client import SecretsDataJSONClient
+from pw.pw_share import SectionKeyring, generate_key_pair, get_keyring_path, share_command
+
+@pytest.fixture
+def pw_config(write_vault, tmp_path):
+    pw_config = write_vault({
+        "main": {"guitar": {"password": "pink_floyd"}},
+        "team": {"kafka": {"password": "secret", "username": "ops"}},
+    })
+    for name in ("alice", "bob", "carol"):
+        generate_key_pair(str(tmp_path / f"{name}.pem"))
+    pw_config.private_key_path = str(tmp_path / "alice.pem")
+    pw_config.recipient_name = "alice"
+    return pw_config
+
+
+def _keyring(tmp_path, name):
+    client = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    return client, SectionKeyring(get_keyring_path(client), str(tmp_path / f"{name}.pem"), name)
+
+
+def test_shared_section_is_readable_by_every_recipient(pw_config, tmp_path):
+    share_command(["--add_key", "bob", str(tmp_path / "bob.pem.pub")], pw_config)
+    share_command(["team", "--to", "bob"], pw_config)
+
+    for name in ("alice", "bob"):
+        client, keyring = _keyring(tmp_path, name)
+        assert keyring.get_recipients("team") == ["alice", "bob"]
+        crypto = keyring.get_crypto("team")
+        assert crypto.decrypt(client.pw_dict["team"]["kafka"]["username"]) == "ops"
+        assert crypto is keyring.get_crypto("team")  # one RSA decryption per section
+
+    # other sections still use the vault key
+    client, keyring = _keyring(tmp_path, "carol")
+    assert not keyring.is_shared("main")
+    assert SynchronousEncryptionFernet(pw_config.encryption_key).decrypt(
+        client.pw_dict["main"]["guitar"]["password"]) == "pink_floyd"
+    with pytest.raises(PermissionError):
+        keyring.get_crypto("team")
+
+
+def test_adding_recipients_does_not_touch_the_values(pw_config, tmp_path):
+    share_command(["--add_key", "carol", str(tmp_path / "carol.pem.pub")], pw_config)
+    share_command(["team", "--to", "alice"], pw_config)
+    with open(tmp_path / "vault.json") as f:
+        shared_data = f.read()
+
+    share_command(["team", "--to", "carol"], pw_config)
+
+    with open(tmp_path / "vault.json") as f:
+        assert f.read() == shared_data
+    _, keyring = _keyring(tmp_path, "carol")
+    assert keyring.get_recipients("team") == ["alice", "carol"]
+
+
+def test_revoking_replaces_the_data_key(pw_config, tmp_path):
+    from cryptography.fernet import InvalidToken
+    from pw.pw_vault import Vault
+
+    for name in ("bob", "carol"):
+        share_command(["--add_key", name, str(tmp_path / f"{name}.pem.pub")], pw_config)
+    share_command(["team", "--to", "bob", "carol"], pw_config)
+    Vault.from_config(pw_config).set_fields("team", "kafka", {"username": "admin"})
+    _, keyring = _keyring(tmp_path, "bob")
+    bobs_crypto = keyring.get_crypto("team")
+
+    share_command(["team", "--revoke", "bob"], pw_config)
+
+    client, keyring = _keyring(tmp_path, "carol")
+    assert keyring.get_recipients("team") == ["alice", "carol"]
+    assert keyring.get_crypto("team").decrypt(client.pw_dict["team"]["kafka"]["username"]) == "admin"
+    with pytest.raises(InvalidToken):
+        bobs_crypto.decrypt(client.pw_dict["team"]["kafka"]["username"])
+    _, keyring = _keyring(tmp_path, "bob")
+    with pytest.raises(PermissionError):
+        keyring.get_crypto("team")
+
+    vault = Vault.from_config(pw_config)
+    vault.revert("team", "kafka")  # the history is re-encrypted as well
+    assert vault.get("team", "kafka", "username") == "ops"
+
+
+def _interrupt(*args, **kwargs):
+    raise KeyboardInterrupt
+
+
+@pytest.mark.parametrize("step", ["set_many_secrets_data", "_reencrypt_history"])
+def test_interrupted_revoke_keeps_the_section_readable(pw_config, tmp_path, monkeypatch, step):
+    from pw.pw_vault import Vault
+
+    for name in ("bob", "carol"):
+        share_command(["--add_key", name, str(tmp_path / f"{name}.pem.pub")], pw_config)
+    share_command(["team", "--to", "bob", "carol"], pw_config)
+    with monkeypatch.context() as m:
+        target = SecretsDataJSONClient if step == "set_many_secrets_data" else SectionKeyring
+        m.setattr(target, step, staticmethod(_interrupt))
+        with pytest.raises(KeyboardInterrupt):
+            share_command(["team", "--revoke", "bob"], pw_config)
+
+    _, keyring = _keyring(tmp_path, "carol")
+    assert "team" in keyring.pending
+    assert Vault.from_config(pw_config).get("team", "kafka", "username") == "ops"
+
+    share_command(["team", "--revoke", "bob"], pw_config)
+
+    client, keyring = _keyring(tmp_path, "carol")
+    assert keyring.pending == {}
+    assert keyring.get_crypto("team").decrypt(client.pw_dict["team"]["kafka"]["username"]) == "ops"
+    _, keyring = _keyring(tmp_path, "bob")
+    with pytest.raises(PermissionError):
+        keyring.get_crypto("team")
+
+
+def test_interrupted_share_keeps_the_section_readable(pw_config, tmp_path, monkeypatch):
+    from pw.pw_vault import Vault
+
+    share_command(["--add_key", "bob", str(tmp_path / "bob.pem.pub")], pw_config)
+    with monkeypatch.context() as m:
+        m.setattr(SectionKeyring, "_reencrypt_history", staticmethod(_interrupt))
+        with pytest.raises(KeyboardInterrupt):
+            share_command(["team", "--to", "bob"], pw_config)
+    assert Vault.from_config(pw_config).get("team", "kafka", "password") == "secret"
+
+    share_command(["team", "--to", "bob"], pw_config)
+
+    client, keyring = _keyring(tmp_path, "bob")
+    assert keyring.pending == {}
+    assert keyring.get_recipients("team") == ["alice", "bob"]
+    assert keyring.get_crypto("team").decrypt(client.pw_dict["team"]["kafka"]["password"]) == "secret"
+
+
+def test_private_keys_are_loaded_once(pw_config, tmp_path):
+    path = str(tmp_path / "alice.pem")
+    assert load_existing_key(path) is load_existing_key(path)
@@ -0,0 +1,112 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from pw.pw_json_client import SecretsDataJSONClient
+
+
+@pytest.fixture(autouse=True)
+def vault_file(write_vault):
+    write_vault({"main": {"guitar": {"password": "a"}}}, encrypt=False)
+
+
+def test_concurrent_writers_do_not_lose_changes(tmp_path):
+    first = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    second = SecretsDataJSONClient(str(tmp_path), "vault.json")
+
+    first.set_secrets_data("main", "amp", {"password": "b"})
+    first.update_secrets_data("main", "guitar", {"brand": "fender"})
+    # second still has the old data in memory; its full write must merge
+    second.update_secrets_data("main", "guitar", {"model": "strat"})
+    second.set_many_secrets_data([("test", "kafka", {"password": "c"})])
+
+    reloaded = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    assert reloaded.pw_dict == {
+        "main": {"guitar": {"password": "a", "brand": "fender", "model": "strat"},
+                 "amp": {"password": "b"}},
+        "test": {"kafka": {"password": "c"}},
+    }
+
+
+def _add_entities(creds_dir, worker, n):
+    client = SecretsDataJSONClient(creds_dir, "vault.json")
+    for i in range(n):
+        client.set_secrets_data("main", f"{worker}-{i}", {"password": "x"})
+        if i % 5 == 0:
+            with client.write_lock():
+                client.save_dict_to_file()  # force full rewrites in between
+
+
+def test_parallel_processes_keep_all_writes(tmp_path):
+    processes = [multiprocessing.Process(target=_add_entities, args=(str(tmp_path), w, 20))
+                 for w in range(4)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+    reloaded = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    assert len(reloaded.pw_dict["main"]) == 1 + 4 * 20
+
+
+def test_transaction_is_written_as_one_record(tmp_path):
+    client = SecretsDataJSONClient(str(tmp_path), "vault.json")
+
+    with client.transaction():
+        client.create_section("dev")
+        client.set_secrets_data("dev", "kafka", {"password": "b"})
+        with client.transaction():
+            client.update_secrets_data("main", "guitar", {"brand": "fender"})
+        client.set_secrets_data("dev", "redis", {"password": "c"})
+        # changes are visible within the transaction, but not written yet
+        assert client.pw_dict["dev"]["kafka"] == {"password": "b"}
+        assert not os.path.exists(client.journal.journal_path)
+
+    assert [record["op"] for record in client.journal.read()] == ["batch"]
+    reloaded = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    assert reloaded.pw_dict == client.pw_dict == {
+        "main": {"guitar": {"password": "a", "brand": "fender"}},
+        "dev": {"kafka": {"password": "b"}, "redis": {"password": "c"}},
+    }
+
+
+def test_bulk_transaction_rewrites_the_file(tmp_path):
+    client = SecretsDataJSONClient(str(tmp_path), "vault.json")
+
+    with client.transaction():
+        client.remove_secrets_data("main", "guitar")
+        assert client.set_many_secrets_data(
+            [("dev", "kafka", {"password": "b"}), ("dev", "redis", {"password": "c"})]) == 2
+
+    assert not os.path.exists(client.journal.journal_path)
+    with open(tmp_path / "vault.json") as f:
+        assert json.load(f) == client.pw_dict == {
+            "main": {}, "dev": {"kafka": {"password": "b"}, "redis": {"password": "c"}}}
+
+
+def test_failed_transaction_is_rolled_back(tmp_path):
+    client = SecretsDataJSONClient(str(tmp_path), "vault.json")
+
+    try:
+        with client.transaction():
+            client.remove_secrets_data("main", "guitar")
+            raise RuntimeError("interrupted")
+    except RuntimeError:
+        pass
+
+    assert client.pw_dict == {"main": {"guitar": {"password": "a"}}}
+    assert not os.path.exists(client.journal.journal_path)
+
+
+def test_backups_of_later_processes_only_store_the_changes(tmp_path):
+    SecretsDataJSONClient(str(tmp_path), "vault.json").set_secrets_data("main", "amp", {"password": "b"})
+    client = SecretsDataJSONClient(str(tmp_path), "vault.json")
+    client.remove_secrets_data("main", "guitar")
+
+    first, second = client.list_backups()
+    assert f"{second}.delta.json" in os.listdir(tmp_path / ".backups" / "snapshots")
+    assert client.backups.load_snapshot(first) == {"main": {"guitar": {"password": "a"}}}
+    client.restore_backup(second)
+    assert client.pw_dict == {"main": {"guitar": {"password": "a"}, "amp": {"password": "b"}}}
@@ -0,0 +1,37 @@
+import json
+
+from pw import pw_cli, pw_trace
+from pw.pw_cli import PasswordCommand
+
+
+def test_profile_reports_the_phases_as_json(pw_config, tmp_path, capsys, monkeypatch):
+    monkeypatch.setenv("PW_NO_AGENT", "1")
+    monkeypatch.setattr(pw_cli, "copy_to_clipboard", lambda text: None)
+    dump_path = tmp_path / "pw.prof"
+
+    PasswordCommand.main(["guitar", "--profile=json", f"--profile_dump={dump_path}"], pw_config)
+
+    report = json.loads(capsys.readouterr().err)
+    assert list(report["phases"]) == ["import", "config", "load", "search", "decrypt"]
+    assert report["phases"]["decrypt"]["calls"] == 2
+    assert report["total_ms"] >= sum(phase["ms"] for phase in report["phases"].values())
+    assert dump_path.exists()
+    assert not pw_trace.tracer.enabled
+
+
+def test_phases_are_no_ops_without_tracing():
+    assert pw_trace.phase("load") is pw_trace.phase("save")
+    assert pw_trace.configure(["guitar", "-k", "brand"]) == ["guitar", "-k", "brand"]
+    assert not pw_trace.tracer.enabled
+
+
+def test_trace_is_off_for_other_values(monkeypatch):
+    for value in ("0", "false", ""):
+        monkeypatch.setenv("PW_TRACE", value)
+        assert pw_trace.configure(["guitar"]) == ["guitar"]
+        assert not pw_trace.tracer.enabled
+
+
+def test_profile_after_double_dash_is_an_entity():
+    assert pw_trace.configure(["-k", "brand", "--", "--profile"]) == ["-k", "brand", "--", "--profile"]
+    assert not pw_trace.tracer.enabled
@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from pw.pw_cli import PasswordCommand
+
+
+@pytest.fixture
+def pw_config(write_vault):
+    return write_vault({"main": {}})
+
+
+def test_import_and_export_roundtrip(pw_config, tmp_path):
+    with open(tmp_path / "in.csv", "w") as f:
+        f.write("section,entity,password,username\n")
+        f.write(",guitar,pink_floyd,david\n")
+        f.write("test,kafka,stream_processing,\n")
+
+    assert PasswordCommand.main(["import", str(tmp_path / "in.csv"), "--workers", "2",
+                                 "--batch_size", "1"], pw_config)
+    assert PasswordCommand.main(["export", str(tmp_path / "out.jsonl")], pw_config)
+
+    with open(tmp_path / "out.jsonl") as f:
+        records = [json.loads(line) for line in f]
+    assert records == [
+        {"section": "main", "entity": "guitar", "password": "pink_floyd", "username": "david"},
+        {"section": "test", "entity": "kafka", "password": "stream_processing"},
+    ]
+    assert os.stat(tmp_path / "out.jsonl").st_mode & 0o777 == 0o600
+    # Stored encrypted, with a single write and no journal
+    with open(tmp_path / "vault.json") as f:
+        assert json.load(f)["main"]["guitar"]["password"] != "pink_floyd"
+    assert not os.path.exists(tmp_path / "vault.json.journal")
+
+
+def test_import_skips_existing_entities(pw_config, tmp_path, capsys):
+    with open(tmp_path / "in.jsonl", "w") as f:
+        f.write(json.dumps({"entity": "guitar", "password": "a"}) + "\n")
+
+    PasswordCommand.main(["import", str(tmp_path / "in.jsonl")], pw_config)
+    PasswordCommand.main(["import", str(tmp_path / "in.jsonl")], pw_config)
+    assert capsys.readouterr().out.splitlines() == ["Imported 1 entities.", "Imported 0 entities."]
+
+
+def test_shared_sections_use_their_data_key(pw_config, tmp_path, capsys):
+    from pw.pw_share import generate_key_pair, share_command
+    from pw.pw_vault import Vault
+
+    generate_key_pair(str(tmp_path / "alice.pem"))
+    pw_config.private_key_path = str(tmp_path / "alice.pem")
+    pw_config.recipient_name = "alice"
+    Vault.from_config(pw_config).add("team", "kafka", {"password": "stream_processing"})
+    share_command(["team", "--to", "alice"], pw_config)
+
+    with open(tmp_path / "in.jsonl", "w") as f:
+        f.write(json.dumps({"section": "team", "entity": "zookeeper", "password": "z"}) + "\n")
+    assert PasswordCommand.main(["import", str(tmp_path / "in.jsonl"), "--workers", "2"], pw_config)
+    assert Vault.from_config(pw_config).get("team", "zookeeper") == "z"
+
+    assert PasswordCommand.main(["export", str(tmp_path / "out.jsonl"), "-s", "team"], pw_config)
+    with open(tmp_path / "out.jsonl") as f:
+        assert [json.loads(line)["password"] for line in f] == ["stream_processing", "z"]
+
+    pw_config.recipient_name = "bob"  # not a recipient
+    assert not PasswordCommand.main(["import", str(tmp_path / "in.jsonl"), "-ow"], pw_config)
+    assert not PasswordCommand.main(["export", "-", "-s", "team"], pw_config)
+    assert 'Skipped section "team"' in capsys.readouterr().err
+
+
+def test_metadata_is_not_exported_nor_imported(pw_config, tmp_path):
+    from pw.pw_vault import Vault
+
+    Vault.from_config(pw_config).add("main", "guitar", {"password": "pink_floyd"})
+    assert PasswordCommand.main(["export", str(tmp_path / "out.csv")], pw_config)
+    with open(tmp_path / "out.csv") as f:
+        assert f.readline().strip() == "section,entity,password"
+
+    with open(tmp_path / "in.jsonl", "w") as f:
+        f.write(json.dumps({"entity": "amp", "password": "a", "_created": "2000-01-01T00:00:00Z"}) + "\n")
+    assert PasswordCommand.main(["import", str(tmp_path / "in.jsonl")], pw_config)
+    vault = Vault.from_config(pw_config)
+    assert vault.get_metadata("main", "amp").get("_created") != "2000-01-01T00:00:00Z"
+
+
+def test_rows_without_entity_abort_the_import(pw_config, tmp_path, capsys):
+    with open(tmp_path / "in.csv", "w") as f:
+        f.write("entity,password\nguitar,a\n,b\n")
+
+    assert not PasswordCommand.main(["import", str(tmp_path / "in.csv")], pw_config)
+    assert capsys.readouterr().err == "Line 3 has no entity. Nothing was imported.\n"
+    with open(tmp_path / "vault.json") as f:
+        assert json.load(f) == {"main": {}}
@@ -0,0 +1,65 @@
+import os
+import string
+
+import pytest
+
+from pw.pw_utils import PUNCTUATION, generate_random_passwords, open_atomically, random_characters
+
+
+def test_random_characters_only_uses_the_charset():
+    characters = random_characters("abc", 10000)
+    assert len(characters) == 10000
+    assert set(characters) == set("abc")
+
+
+def test_bulk_passwords_respect_length_and_charset():
+    passwords = generate_random_passwords(1000, special_characters=False, password_length=20)
+    assert len(passwords) == 1000
+    assert len(set(passwords)) == 1000
+    allowed = set(string.ascii_letters + string.digits)
+    assert all(len(p) == 20 and set(p) <= allowed for p in passwords)
+
+
+def test_passwords_satisfy_the_policy():
+    passwords = generate_random_passwords(
+        500, password_length=8, min_digits=3, min_symbols=2, min_uppercase=1, min_lowercase=1)
+    for password in passwords:
+        assert len(password) == 8
+        assert sum(c in string.digits for c in password) >= 3
+        assert sum(c in PUNCTUATION for c in password) >= 2
+        assert any(c.isupper() for c in password)
+        assert any(c.islower() for c in password)
+
+
+def test_impossible_policies_are_rejected():
+    with pytest.raises(ValueError):
+        generate_random_passwords(1, password_length=4, min_digits=5)
+    with pytest.raises(ValueError):
+        generate_random_passwords(1, special_characters=False, min_symbols=1)
+
+
+def test_open_atomically_keeps_the_old_file_on_errors(tmp_path):
+    path = str(tmp_path / "vault.json")
+    with open_atomically(path, permissions=0o600) as f:
+        f.write("old")
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    with pytest.raises(RuntimeError):
+        with open_atomically(path) as f:
+            f.write("new")
+            raise RuntimeError()
+    with open(path) as f:
+        assert f.read() == "old"
+    assert os.listdir(tmp_path) == ["vault.json"]
+
+
+def test_open_atomically_keeps_the_permissions(tmp_path):
+    path = str(tmp_path / "vault.json")
+    with open_atomically(path) as f:
+        f.write("new")
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    os.chmod(path, 0o640)
+    with open_atomically(path) as f:
+        f.write("rewritten")
+    assert os.stat(path).st_mode & 0o777 == 0o640
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+
+def test_set_fields_writes_one_record(vault):
+    vault.set_fields("main", "guitar", {"brand": "fender", "model": "strat"})
+
+    assert vault.get_fields("main", "guitar") == {
+        "password": "pink_floyd", "brand": "fender", "model": "strat"}
+    assert len(list(vault.pw_client.journal.read())) == 1
+    with pytest.raises(KeyError):
+        vault.set_fields("main", "amp", {"brand": "marshall"})
+
+
+def test_rotate_password(vault):
+    old_password, new_password = vault.rotate_password("main", "guitar", password_length=12)
+
+    assert old_password == "pink_floyd"
+    assert len(new_password) == 12
+    assert vault.get("main", "guitar") == new_password
+    assert "old_password" not in vault.keys("main", "guitar")
+    assert "password" in vault.get_history("main", "guitar")[0].fields
+
+
+def test_add_find_and_delete(vault):
+    assert vault.add("test", "guitar_amp", {"password": "x"})
+    assert not vault.add("test", "guitar_amp", {"password": "y"}, overwrite=False)
+    assert vault.find("guitar") == {"main": ["guitar"], "test": ["guitar_amp"]}
+
+    vault.delete("test", "guitar_amp")
+    assert vault.entities("test") == []
+    with pytest.raises(KeyError):
+        vault.delete("test", "guitar_amp")
+
+
+def test_find_builds_the_index_on_the_second_search(vault, tmp_path):
+    assert vault.find("guitar") == {"main": ["guitar"]}
+    assert vault.pw_client._index is None  # one-shot calls only scan
+
+    vault.add("main", "guitar_amp", {"password": "x"})
+    assert vault.find("guitar") == {"main": ["guitar", "guitar_amp"]}
+    vault.delete("main", "guitar_amp")
+    assert vault.find("guitar") == {"main": ["guitar"]}  # the index follows the changes
+    assert vault.pw_client._index is not None
+    assert not any(name.endswith(".index.json") for name in os.listdir(tmp_path))
+
+
+def test_add_many(vault):
+    items = [("main", "guitar", {"password": "wish_you_were_here"}), ("dev", "amp", {"password": "a"})]
+    assert vault.add_many(items) == 1  # guitar exists
+    assert vault.get("main", "guitar") == "pink_floyd"
+    assert set(vault.get_metadata("dev", "amp")) == {"_created", "_modified", "_password_modified"}
+
+    assert vault.add_many(items, overwrite=True, batch_size=1) == 2
+    assert vault.get("main", "guitar") == "wish_you_were_here"
+    vault.revert("main", "guitar")
+    assert vault.get("main", "guitar") == "pink_floyd"
+
+
+def test_find_returns_the_same_order_from_the_scan_and_the_index(vault):
+    for entity in ("guitar_zz", "bass_guitar", "Guitar_amp"):
+        vault.add("main", entity, {"password": "x"})
+    vault.add("dev", "guitar", {"password": "x"})
+
+    first = vault.find("guitar")  # scans the names
+    second = vault.find("guitar")  # from the index
+    assert list(second.items()) == list(first.items())
+    assert first == {"dev": ["guitar"], "main": ["Guitar_amp", "bass_guitar", "guitar", "guitar_zz"]}
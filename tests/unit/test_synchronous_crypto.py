@@ -0,0 +1,34 @@
+from src.crypto.decrypted_value_cache import DecryptedValueCache
+from src.crypto.synchronous_encryption_fernet import SynchronousEncryptionFernet
+
+
+def test_encrypt_and_decrypt_many():
+    crypto = SynchronousEncryptionFernet(SynchronousEncryptionFernet.generate_key())
+    encrypted = crypto.encrypt_many(["fender", "strat", "fender"])
+    assert crypto.decrypt_many(encrypted + encrypted[:1]) == ["fender", "strat", "fender", "fender"]
+
+
+def test_cache_serves_repeated_decryptions():
+    cache = DecryptedValueCache(max_size=1)
+    crypto = SynchronousEncryptionFernet(SynchronousEncryptionFernet.generate_key(), cache)
+    token = crypto.encrypt("pink_floyd")
+    assert crypto.decrypt(token) == "pink_floyd"
+
+    crypto.cipher = None  # a cache hit must not touch the cipher
+    assert crypto.decrypt(token) == "pink_floyd"
+
+
+def test_cache_zeroes_evicted_values():
+    cache = DecryptedValueCache(max_size=1)
+    cache.put("a", b"secret")
+    plaintext = cache._entries["a"][1]
+    cache.put("b", b"other")
+    assert plaintext == bytearray(6)
+    assert cache.get("a") is None
+
+
+def test_cache_entries_expire():
+    cache = DecryptedValueCache(ttl=-1)
+    cache.put("a", b"secret")
+    assert cache.get("a") is None
+    assert len(cache) == 0